@@ -1,11 +1,19 @@
-from flask import Flask
+from flask import Flask, Response
 from routes.sut import sut
 from flask_cors import CORS
+from utils.metrics import render_metrics
 
 app = Flask(__name__)
 CORS(app, origins="*")
 
 app.register_blueprint(sut, url_prefix="/api/sut")
 
+
+@app.route("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5005, debug=True)
\ No newline at end of file
@@ -1,6 +1,11 @@
 from backend.endpoint import (
     AuthorizationError,
     Endpoint,
+    RequestEngine,
     RequestError,
 )
-from backend.system_data import SystemData
+from backend.async_endpoint import (
+    AsyncEndpoint,
+    AsyncRequestEngine,
+)
+from backend.system_data import AsyncSystemData, SystemData
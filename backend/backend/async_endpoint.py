@@ -0,0 +1,125 @@
+import asyncio
+import aiohttp
+import weakref
+
+from typing import Any, Dict, List, Union
+from environment import ASYNC_REQUEST_LIMIT, REQUEST_TIMEOUT, VERIFY_CERTS
+from utils.metrics import observe_request
+from backend.endpoint import (
+    AuthorizationError,
+    Endpoint,
+    RequestEngine,
+    RequestError,
+)
+
+
+class AsyncRequestEngine(RequestEngine):
+    """asyncio twin of RequestEngine, every verb is a coroutine.
+
+    One aiohttp.ClientSession is kept per event loop and shared by every engine
+    running on it, so connections are reused across all AsyncEndpoints.
+    """
+
+    _sessions = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=ASYNC_REQUEST_LIMIT, ssl=None if VERIFY_CERTS else False
+                ),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
+            self._sessions[loop] = session
+        return session
+
+    @classmethod
+    async def close(cls):
+        """Close the session of the running event loop, call before the loop shuts down."""
+        session = cls._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    async def _request(
+        self,
+        method: str,
+        route: str,
+        return_response: bool = False,
+        **kwargs,
+    ) -> Union[List, Dict, aiohttp.ClientResponse]:
+        with observe_request("conductor", f"{method} {route}") as observation:
+            async with self.session.request(
+                method,
+                self._build_route(route),
+                headers=self._get_headers(),
+                **kwargs,
+            ) as res:
+                observation.status = res.status
+                try:
+                    contents = await res.json(content_type=None)
+                except ValueError:
+                    contents = ""
+                if contents is None:
+                    contents = ""
+        if res.status == 401:
+            raise AuthorizationError(str(contents))
+        elif res.status >= 400 and return_response is not True:
+            raise RequestError(str(contents))
+        return contents if return_response is not True else res
+
+    async def get(self, route: str, **kwargs):
+        return await self._request("GET", route, json=kwargs)
+
+    async def post(
+        self,
+        route: str,
+        data: Dict = None,
+        files: Any = None,
+        return_response: bool = False,
+        **_,
+    ) -> Union[List, Dict, aiohttp.ClientResponse]:
+        if files:
+            form = aiohttp.FormData()
+            for key, value in (data or {}).items():
+                form.add_field(key, str(value))
+            for key, value in files.items():
+                # Same shapes requests accepts: fileobj or (filename, fileobj[, content_type])
+                if isinstance(value, tuple):
+                    form.add_field(
+                        key,
+                        value[1],
+                        filename=value[0],
+                        content_type=value[2] if len(value) > 2 else None,
+                    )
+                else:
+                    form.add_field(key, value, filename=key)
+            return await self._request(
+                "POST", route, return_response=return_response, data=form
+            )
+        return await self._request(
+            "POST", route, return_response=return_response, json=data
+        )
+
+    async def put(
+        self, route: str, data: Dict = None, return_response: bool = False, **_
+    ) -> Union[List, Dict, aiohttp.ClientResponse]:
+        return await self._request(
+            "PUT", route, return_response=return_response, json=data
+        )
+
+    async def delete(
+        self, route: str, data: Dict = None, return_response: bool = False, **_
+    ) -> Union[List, Dict, aiohttp.ClientResponse]:
+        return await self._request(
+            "DELETE", route, return_response=return_response, json=data
+        )
+
+
+class AsyncEndpoint(Endpoint):
+    """Endpoint whose get/post/put/delete return awaitables instead of results."""
+
+    def __init__(self):
+        self.requester = AsyncRequestEngine()
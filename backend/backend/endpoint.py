@@ -1,11 +1,19 @@
 import abc
 import requests
 import socket
+import threading
 import urllib3
 
 from version import version
+from utils.metrics import observe_request
+from requests.adapters import HTTPAdapter
 from typing import Any, Dict, List, Optional, Union
-from environment import REQUEST_TIMEOUT, VERIFY_CERTS
+from environment import (
+    REQUEST_POOL_HOSTS,
+    REQUEST_POOL_SIZE,
+    REQUEST_TIMEOUT,
+    VERIFY_CERTS,
+)
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -19,14 +27,74 @@ class AuthorizationError(Exception):
 
 
 class RequestEngine:
+    # One connection pool shared by every engine (and so every Endpoint) in the process.
+    # Sessions are per-thread since requests.Session is not thread-safe, but they all
+    # mount the same adapter so keep-alive connections are reused across threads.
+    _adapter = None
+    _adapter_lock = threading.Lock()
+    _local = threading.local()
+
+    @classmethod
+    def configure_pool(
+        cls, pool_size: int = REQUEST_POOL_SIZE, pool_hosts: int = REQUEST_POOL_HOSTS
+    ):
+        """Replace the shared connection pool, e.g. to match the worker count of a batch.
+
+        Args:
+            pool_size (int): Keep-alive connections kept per host.
+            pool_hosts (int): Number of hosts to keep pools for.
+        """
+        with RequestEngine._adapter_lock:
+            old_adapter = RequestEngine._adapter
+            RequestEngine._adapter = HTTPAdapter(
+                pool_connections=pool_hosts, pool_maxsize=pool_size
+            )
+            RequestEngine._local = threading.local()
+        if old_adapter is not None:
+            old_adapter.close()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._adapter is None:
+            with self._adapter_lock:
+                if self._adapter is None:
+                    RequestEngine._adapter = HTTPAdapter(
+                        pool_connections=REQUEST_POOL_HOSTS,
+                        pool_maxsize=REQUEST_POOL_SIZE,
+                    )
+        local = self._local
+        session = getattr(local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            local.session = session
+        return session
+
+    def _send(self, method: str, route: str, **kwargs) -> requests.Response:
+        """Send a request to Conductor, recording its latency and status.
+
+        Args:
+            method (str): The HTTP method.
+            route (str): The route, relative to the Conductor URL.
+
+        Returns:
+            requests.Response: The response, whatever its status.
+        """
+        with observe_request("conductor", f"{method} {route}") as observation:
+            res = self.session.request(
+                method,
+                self._build_route(route),
+                headers=self._get_headers(),
+                verify=VERIFY_CERTS,
+                timeout=REQUEST_TIMEOUT,
+                **kwargs,
+            )
+            observation.status = res.status_code
+        return res
+
     def get(self, route: str, **kwargs):
-        res = requests.get(
-            self._build_route(route),
-            headers=self._get_headers(),
-            json=kwargs,
-            verify=VERIFY_CERTS,
-            timeout=REQUEST_TIMEOUT,
-        )
+        res = self._send("GET", route, json=kwargs)
 
         try:
             contents = res.json()
@@ -47,22 +115,9 @@ class RequestEngine:
         **_,
     ) -> Union[List, Dict, requests.Response]:
         if files:
-            res = requests.post(
-                self._build_route(route),
-                headers=self._get_headers(),
-                data=data,
-                files=files,
-                verify=VERIFY_CERTS,
-                timeout=REQUEST_TIMEOUT,
-            )
+            res = self._send("POST", route, data=data, files=files)
         else:
-            res = requests.post(
-                self._build_route(route),
-                headers=self._get_headers(),
-                json=data,
-                verify=VERIFY_CERTS,
-                timeout=REQUEST_TIMEOUT,
-            )
+            res = self._send("POST", route, json=data)
         try:
             contents = res.json()
         except requests.exceptions.JSONDecodeError:
@@ -76,13 +131,7 @@ class RequestEngine:
     def put(
         self, route: str, data: Dict = None, return_response: bool = False, **_
     ) -> Union[List, Dict, requests.Response]:
-        res = requests.put(
-            self._build_route(route),
-            headers=self._get_headers(),
-            json=data,
-            verify=VERIFY_CERTS,
-            timeout=REQUEST_TIMEOUT,
-        )
+        res = self._send("PUT", route, json=data)
         try:
             contents = res.json()
         except requests.exceptions.JSONDecodeError:
@@ -96,13 +145,7 @@ class RequestEngine:
     def delete(
         self, route: str, data: Dict = None, return_response: bool = False, **_
     ) -> Union[List, Dict, requests.Response]:
-        res = requests.delete(
-            self._build_route(route),
-            headers=self._get_headers(),
-            json=data,
-            verify=VERIFY_CERTS,
-            timeout=REQUEST_TIMEOUT,
-        )
+        res = self._send("DELETE", route, json=data)
         try:
             contents = res.json()
         except requests.exceptions.JSONDecodeError:
@@ -204,7 +247,12 @@ class Endpoint(abc.ABC):
     ):
         if identifier and not isinstance(data, list):
             data["id"] = identifier
-        data = self._clear_unused(data) if clear_unused is True else data
+        if isinstance(data, list):
+            data = (
+                [self._clear_unused(x) for x in data] if clear_unused is True else data
+            )
+        else:
+            data = self._clear_unused(data) if clear_unused is True else data
         return self.requester.put(
             self.route, return_response=return_response, data=data, **kwargs
         )
@@ -1,6 +1,10 @@
 
-from backend import Endpoint
+from backend import AsyncEndpoint, Endpoint
 from routes import Route
 
 class SystemData(Endpoint):
     route = Route.SYSTEM_DATA
+
+
+class AsyncSystemData(AsyncEndpoint):
+    route = Route.SYSTEM_DATA
@@ -0,0 +1,189 @@
+import os
+import csv
+import json
+import time
+import argparse
+import statistics
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from backend.endpoint import RequestEngine
+from environment import REQUEST_POOL_SIZE
+from utils.journal import RENAME_JOURNAL, RenameJournal
+from utils.logger import logger
+from utils.maas import MACHINE_RESOLVER, get_machine_index
+from manual_run import rename_sut
+from planner import plan_rename
+
+DEFAULT_WORKERS = int(os.environ.get("BATCH_WORKERS", 8))
+
+
+@dataclass
+class RenameResult:
+    current_hostname: str
+    new_hostname: str
+    success: bool
+    duration: float
+    error: Optional[str] = None
+
+
+def load_manifest(path: str) -> List[Tuple[str, str]]:
+    """
+    Load old -> new hostname pairs from a CSV or JSON manifest
+    CSV: rows of `current_hostname,new_hostname` (header row optional)
+    JSON: a list of {"current_hostname": ..., "new_hostname": ...}, a list of pairs or a {old: new} mapping
+    :param path: Path to the manifest
+    :return: List of (current_hostname, new_hostname)
+    """
+    with open(path, newline="") as f:
+        if path.lower().endswith(".json"):
+            data = json.load(f)
+            if isinstance(data, dict):
+                pairs = list(data.items())
+            else:
+                pairs = [
+                    (item["current_hostname"], item["new_hostname"])
+                    if isinstance(item, dict)
+                    else tuple(item)
+                    for item in data
+                ]
+        else:
+            pairs = [
+                (row[0], row[1])
+                for row in csv.reader(f)
+                if row and not row[0].startswith("#")
+            ]
+            if pairs and pairs[0] == ("current_hostname", "new_hostname"):
+                pairs = pairs[1:]
+
+    pairs = [(old.strip(), new.strip()) for old, new in pairs]
+    seen = set()
+    for old, new in pairs:
+        if old in seen:
+            raise ValueError(f"{old} appears more than once in {path}")
+        seen.add(old)
+    return pairs
+
+
+def _rename(
+    current_hostname: str, new_hostname: str, rename: Callable[[str, str], None]
+) -> RenameResult:
+    start_time = time.perf_counter()
+    try:
+        rename(current_hostname, new_hostname)
+        error = None
+    except Exception as e:
+        logger.exception(f"Failed to rename {current_hostname}")
+        error = str(e) or e.__class__.__name__
+    return RenameResult(
+        current_hostname=current_hostname,
+        new_hostname=new_hostname,
+        success=error is None,
+        duration=time.perf_counter() - start_time,
+        error=error,
+    )
+
+
+def run_batch(
+    pairs: List[Tuple[str, str]],
+    workers: int = DEFAULT_WORKERS,
+    rename: Callable[[str, str], None] = rename_sut,
+) -> Tuple[List[RenameResult], float]:
+    """
+    Rename every SUT in `pairs` on a bounded worker pool
+    :param pairs: List of (current_hostname, new_hostname)
+    :param workers: Maximum number of renames in flight
+    :param rename: The single-SUT rename to run for each pair
+    :return: Tuple of the per-SUT results in manifest order and the wall-clock time
+    """
+    start_time = time.perf_counter()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(_rename, old, new, rename): old for old, new in pairs
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.current_hostname] = result
+            logger.info(
+                f"[{len(results)}/{len(pairs)}] {result.current_hostname} -> {result.new_hostname}: "
+                f"{'OK' if result.success else 'FAILED'} in {result.duration:.1f}s"
+            )
+    return [results[old] for old, _ in pairs], time.perf_counter() - start_time
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def summarize(results: List[RenameResult], wall_time: float) -> str:
+    lines = ["", f"{'CURRENT HOSTNAME':<45} {'NEW HOSTNAME':<45} {'STATUS':<8} TIME"]
+    for result in results:
+        lines.append(
+            f"{result.current_hostname:<45} {result.new_hostname:<45} "
+            f"{'OK' if result.success else 'FAILED':<8} {result.duration:.1f}s"
+            + (f"  ({result.error})" if result.error else "")
+        )
+
+    durations = sorted(result.duration for result in results)
+    succeeded = sum(result.success for result in results)
+    lines.append("")
+    lines.append(
+        f"Renamed {succeeded}/{len(results)} SUTs in {wall_time:.1f}s "
+        f"({succeeded / wall_time * 60 if wall_time else 0:.2f} renames/min)"
+    )
+    if durations:
+        lines.append(
+            f"Latency p50={_percentile(durations, 50):.1f}s "
+            f"p95={_percentile(durations, 95):.1f}s max={durations[-1]:.1f}s"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rename many SUTs from a manifest")
+    parser.add_argument("manifest", help="CSV or JSON file of old -> new hostnames")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Maximum concurrent renames (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Start every rename over instead of resuming from the journal",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print which steps each rename would run",
+    )
+    args = parser.parse_args()
+
+    pairs = load_manifest(args.manifest)
+    if args.restart:
+        for old, new in pairs:
+            RENAME_JOURNAL.discard(RenameJournal.rename_id(old, new))
+    for site in MACHINE_RESOLVER.sites:
+        # One listing per site instead of one lookup per SUT
+        try:
+            get_machine_index(site).prefetch(old.split(".")[0] for old, _ in pairs)
+        except Exception as e:
+            logger.warning(f"Failed to prefetch MAAS machines from {site}: {e}")
+    RequestEngine.configure_pool(pool_size=max(args.workers, REQUEST_POOL_SIZE))
+    if args.dry_run:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            for plan in executor.map(lambda pair: plan_rename(*pair), pairs):
+                print(plan.describe())
+        raise SystemExit(0)
+    logger.info(f"Renaming {len(pairs)} SUTs with {args.workers} workers")
+    results, wall_time = run_batch(pairs, workers=args.workers)
+    logger.info(summarize(results, wall_time))
+
+    if not all(result.success for result in results):
+        raise SystemExit(1)
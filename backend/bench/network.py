@@ -0,0 +1,96 @@
+import socket
+import itertools
+import ipaddress
+import threading
+from typing import Dict, Optional, Tuple
+
+_getaddrinfo = socket.getaddrinfo
+
+
+def short_name(hostname: str) -> str:
+    return hostname.split(".")[0].lower()
+
+
+class FakeNetwork:
+    def __init__(self, first_address: str = "127.1.0.1"):
+        """
+        Name resolution for the benchmark fleet, in place of DNS
+        Every host gets its own loopback address and names resolve by their short hostname, so renaming a
+        host in a fake service moves its name the way a DHCP/DNS update would. Connections to a service port
+        of a host, e.g. 22 or 443, are sent to the local server standing in for it.
+        :param first_address: Addresses are handed out counting up from here
+        """
+        self._addresses = (
+            str(ipaddress.ip_address(address))
+            for address in itertools.count(int(ipaddress.ip_address(first_address)))
+        )
+        # short hostname -> address
+        self._names: Dict[str, str] = {}
+        # (address, port) -> (address, port) of the local server
+        self._services: Dict[Tuple[str, int], Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def allocate(self) -> str:
+        with self._lock:
+            return next(self._addresses)
+
+    def register(self, hostname: str, address: str):
+        with self._lock:
+            self._names[short_name(hostname)] = address
+
+    def unregister(self, hostname: str):
+        with self._lock:
+            self._names.pop(short_name(hostname), None)
+
+    def rename(self, old_hostname: str, new_hostname: str):
+        """
+        Move a name to the host's new hostname, the old one stops resolving
+        """
+        with self._lock:
+            address = self._names.pop(short_name(old_hostname), None)
+            if address is not None:
+                self._names[short_name(new_hostname)] = address
+
+    def expose(self, address: str, port: int, target: Tuple[str, int]):
+        """
+        Send connections to address:port to a local server
+        """
+        with self._lock:
+            self._services[(address, port)] = target
+
+    def lookup(self, hostname: str) -> Optional[str]:
+        with self._lock:
+            return self._names.get(short_name(hostname))
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        if host is None or _is_local(host):
+            return _getaddrinfo(host, port, family, type, proto, flags)
+        address = self.lookup(host)
+        if address is None or family == socket.AF_INET6:
+            raise socket.gaierror(socket.EAI_NONAME, f"Name or service not known: {host}")
+        port = int(port or 0)
+        address, port = self._services.get((address, port), (address, port))
+        return [
+            (socket.AF_INET, type or socket.SOCK_STREAM, proto or socket.IPPROTO_TCP, "", (address, port))
+        ]
+
+    def install(self):
+        """
+        Resolve every name through this network, nothing outside the benchmark is reachable by name
+        """
+        socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        socket.getaddrinfo = _getaddrinfo
+
+
+def _is_local(host) -> bool:
+    if isinstance(host, bytes):
+        host = host.decode()
+    if host == "localhost":
+        return True
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
@@ -0,0 +1,411 @@
+"""
+Offline end-to-end benchmark of the rename
+Runs batch_run/manual_run against local stand-ins for Conductor, MAAS, Jenkins, Redfish and SSH and reports
+the latency of every step and the overall throughput, e.g.
+
+    python -m bench.run --suts 1 10 50 --workers 8 --latency 0.05 --jitter 0.02
+"""
+import os
+import json
+import logging
+import argparse
+import tempfile
+import statistics
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from bench.network import FakeNetwork
+from bench.services import (
+    FakeConductor,
+    FakeJenkins,
+    FakeMAAS,
+    FakeRedfish,
+    Faults,
+    generate_certificate,
+)
+from bench.ssh import FakeSSHServer
+
+SERVICES = ("conductor", "maas", "jenkins", "redfish", "ssh")
+CONTROLLERS = ("pikvm", "rpi", "bmc")
+MAAS_SITES = ("eq", "ust")
+DOMAIN = "bench.local"
+
+
+class Backends:
+    def __init__(
+        self,
+        directory: str,
+        faults: Dict[str, Faults],
+        queue_time: float = 0.5,
+        build_time: float = 2,
+        reboot_time: float = 2,
+        task_time: float = 0.5,
+    ):
+        """
+        Every backend a rename talks to, sharing one fake network
+        :param directory: Where the SSH stubs, host state, certificate and journal are kept
+        :param faults: Faults of each service, by name
+        """
+        self.directory = directory
+        self.network = FakeNetwork()
+        self.conductor = FakeConductor(faults.get("conductor"))
+        self.maas = {site: FakeMAAS(self.network, faults.get("maas")) for site in MAAS_SITES}
+        self.jenkins = FakeJenkins(faults.get("jenkins"), queue_time, build_time)
+        self.redfish = FakeRedfish(
+            self.network, generate_certificate(directory), faults.get("redfish"), task_time
+        )
+        self.ssh = FakeSSHServer(self.network, directory, faults.get("ssh"), reboot_time)
+        self._suts = 0
+
+    @property
+    def services(self) -> list:
+        return [self.conductor, *self.maas.values(), self.jenkins, self.redfish]
+
+    def start(self):
+        for service in self.services:
+            service.start()
+        self.ssh.start()
+        return self
+
+    def stop(self):
+        for service in self.services:
+            service.stop()
+        self.ssh.stop()
+        self.network.uninstall()
+
+    def environment(self) -> Dict[str, str]:
+        """
+        Settings pointing the rename at the fake backends
+        They have to be in place before manual_run is imported, and win over any .env since load_dotenv
+        never overrides what is already set
+        """
+        environment = dict(
+            ATS_URL=self.conductor.url,
+            ATS_SECRET="bench",
+            JENKINS_HOST=self.jenkins.url,
+            JENKINS_USER="bench",
+            JENKINS_CREDS="bench",
+            RENAME_JOURNAL_PATH=os.path.join(self.directory, "rename_journal.db"),
+            VERIFY_CERTS="False",
+            # Nothing the benchmark talks to may go through a proxy
+            NO_PROXY="*",
+        )
+        for site, maas in self.maas.items():
+            environment[f"MAAS_{site.upper()}_HOST"] = maas.url
+            environment[f"MAAS_{site.upper()}_MAAS_API_KEY"] = "bench:bench:bench"
+        return environment
+
+    def add_sut(self, controller: str) -> Tuple[str, str]:
+        """
+        Add a SUT to Conductor, MAAS and the network, with a power controller of the given kind
+        :param controller: One of CONTROLLERS
+        :return: Its current and new hostname
+        """
+        index = self._suts
+        self._suts += 1
+        name = f"bench-sut{index:05d}"
+        current_hostname, new_hostname = f"{name}.{DOMAIN}", f"{name}-new.{DOMAIN}"
+
+        controller_hostname = f"{controller}-{name}.amd.com"
+        if controller == "bmc":
+            self.redfish.add_bmc(controller_hostname)
+        else:
+            self.ssh.add_host(controller_hostname)
+        self.ssh.add_host(current_hostname)
+
+        self.maas[MAAS_SITES[index % len(MAAS_SITES)]].add_machine(
+            name, "ipmi" if controller == "bmc" else "webhook"
+        )
+        self.conductor.add_system(
+            dict(
+                name=name,
+                hostname_ip=current_hostname,
+                username="orch",
+                platform_config=dict(
+                    power_controllers=[
+                        {"ip": controller_hostname, "user": "admin", "pass": "admin"}
+                    ],
+                    notes=f"Power: {controller_hostname}",
+                ),
+                platforms=dict(name="AsrockRack" if controller == "bmc" else "Generic"),
+            )
+        )
+        return current_hostname, new_hostname
+
+    def request_counts(self) -> Dict[str, int]:
+        counts = defaultdict(int)
+        for service in self.services:
+            counts[service.name] += service.requests
+        counts["ssh"] = self.ssh.commands
+        return dict(counts)
+
+
+def percentile(values: List[float], pct: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+@dataclass
+class BenchResult:
+    suts: int
+    workers: int
+    succeeded: int
+    wall_time: float
+    renames: List[float]
+    steps: Dict[str, List[float]]
+    requests: Dict[str, int]
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def rate(self) -> float:
+        """Renames per minute"""
+        return self.succeeded / self.wall_time * 60 if self.wall_time else 0
+
+    @staticmethod
+    def _percentiles(values: List[float]) -> Dict[str, float]:
+        if not values:
+            return {}
+        return {f"p{pct}": percentile(values, pct) for pct in (50, 95, 99)}
+
+    def to_dict(self) -> dict:
+        return dict(
+            suts=self.suts,
+            workers=self.workers,
+            succeeded=self.succeeded,
+            wall_time=self.wall_time,
+            renames_per_minute=self.rate,
+            rename=self._percentiles(self.renames),
+            steps={step: self._percentiles(durations) for step, durations in self.steps.items()},
+            requests=self.requests,
+            errors=self.errors,
+        )
+
+    def describe(self) -> str:
+        lines = [
+            f"{self.suts} SUTs, {self.workers} workers: {self.succeeded}/{self.suts} renamed in "
+            f"{self.wall_time:.1f}s ({self.rate:.2f} renames/min)",
+            f"  {'STEP':<24} {'RUNS':>5} {'p50':>8} {'p95':>8} {'p99':>8}",
+        ]
+        for step, durations in [*self.steps.items(), ("rename", self.renames)]:
+            pcts = self._percentiles(durations)
+            columns = [f"{pcts[key]:>7.2f}s" if pcts else f"{'-':>8}" for key in ("p50", "p95", "p99")]
+            lines.append(f"  {step:<24} {len(durations):>5} " + " ".join(columns))
+        requests = ", ".join(f"{name}={count}" for name, count in self.requests.items())
+        lines.append(f"  requests: {requests}")
+        for error in self.errors:
+            lines.append(f"  ! {error}")
+        return "\n".join(lines)
+
+
+def run_bench(
+    backends: Backends,
+    suts: int,
+    workers: int,
+    controllers=CONTROLLERS,
+    plan: bool = True,
+) -> BenchResult:
+    """
+    Rename `suts` new SUTs through batch_run.run_batch and manual_run.rename_sut
+    :param controllers: Kinds of power controllers, handed out to the SUTs in turn
+    :param plan: Whether renames read the current state first, as they do by default
+    """
+    from batch_run import run_batch
+    from manual_run import rename_sut
+    from planner import STEPS
+    from utils.maas import MACHINE_RESOLVER, get_machine_index
+    from utils.pipeline import SUCCEEDED
+
+    pairs = [backends.add_sut(controllers[index % len(controllers)]) for index in range(suts)]
+    requests_before = backends.request_counts()
+    steps = {step: [] for step in STEPS}
+    lock = threading.Lock()
+
+    def on_transition(run):
+        if run.state == SUCCEEDED:
+            with lock:
+                steps[run.name].append(run.duration)
+
+    for site in MACHINE_RESOLVER.sites:
+        get_machine_index(site).prefetch(old.split(".")[0] for old, _ in pairs)
+    results, wall_time = run_batch(
+        pairs,
+        workers=workers,
+        rename=lambda old, new: rename_sut(old, new, on_transition=on_transition, plan=plan),
+    )
+    requests_after = backends.request_counts()
+    return BenchResult(
+        suts=suts,
+        workers=workers,
+        succeeded=sum(result.success for result in results),
+        wall_time=wall_time,
+        renames=[result.duration for result in results if result.success],
+        steps=steps,
+        requests={name: requests_after[name] - requests_before.get(name, 0) for name in requests_after},
+        errors=[f"{result.current_hostname}: {result.error}" for result in results if not result.success],
+    )
+
+
+def parse_faults(args) -> Dict[str, Faults]:
+    faults = {
+        service: Faults(args.latency, args.jitter, args.failure_rate) for service in SERVICES
+    }
+    for fault in args.fault or []:
+        service, _, values = fault.partition("=")
+        if service not in SERVICES or not values:
+            raise SystemExit(
+                "--fault must look like SERVICE=LATENCY[,JITTER[,FAILURE_RATE]], "
+                f"SERVICE one of {', '.join(SERVICES)}"
+            )
+        faults[service] = Faults(*(float(value) for value in values.split(",")))
+    return faults
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark renames against local fake backends")
+    parser.add_argument(
+        "--suts",
+        type=int,
+        nargs="+",
+        default=[1, 10],
+        help="SUT counts to benchmark (default: 1 10)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=int(os.environ.get("BATCH_WORKERS", 8)),
+        help="Maximum concurrent renames",
+    )
+    parser.add_argument(
+        "--controllers",
+        nargs="+",
+        choices=CONTROLLERS,
+        default=list(CONTROLLERS),
+        help="Power controller kinds, handed out in turn",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="Seconds added to every request and command",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0,
+        help="Latency varies by up to this many seconds either way",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0,
+        help="Fraction of requests and commands that fail",
+    )
+    parser.add_argument(
+        "--fault",
+        action="append",
+        metavar="SERVICE=LATENCY[,JITTER[,FAILURE_RATE]]",
+        help=f"Faults of one service, one of {', '.join(SERVICES)}",
+    )
+    parser.add_argument(
+        "--queue-time",
+        type=float,
+        default=0.5,
+        help="Seconds a Jenkins build waits in the queue",
+    )
+    parser.add_argument(
+        "--build-time",
+        type=float,
+        default=2,
+        help="Seconds a Jenkins build runs",
+    )
+    parser.add_argument(
+        "--reboot-time",
+        type=float,
+        default=2,
+        help="Seconds a power controller takes to reboot",
+    )
+    parser.add_argument(
+        "--task-time",
+        type=float,
+        default=0.5,
+        help="Seconds a Redfish task takes",
+    )
+    parser.add_argument(
+        "--no-plan",
+        action="store_true",
+        help="Skip reading the current state before each rename",
+    )
+    parser.add_argument(
+        "--json",
+        help="Also write the results to this file",
+    )
+    parser.add_argument(
+        "--min-rate",
+        type=float,
+        help="Fail unless every run reaches this many renames/min",
+    )
+    parser.add_argument(
+        "--max-p95",
+        type=float,
+        help="Fail if a run's p95 rename time exceeds this many seconds",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Show the rename logs",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="rename-bench-") as directory:
+        backends = Backends(
+            directory,
+            parse_faults(args),
+            args.queue_time,
+            args.build_time,
+            args.reboot_time,
+            args.task_time,
+        ).start()
+        os.environ.update(backends.environment())
+        backends.network.install()
+
+        from backend.endpoint import RequestEngine
+        from environment import REQUEST_POOL_SIZE
+        from utils.logger import logger
+
+        logger.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+        # Banner-only readiness probes make the server side of paramiko complain
+        logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+        RequestEngine.configure_pool(pool_size=max(args.workers, REQUEST_POOL_SIZE))
+
+        results = []
+        try:
+            for suts in args.suts:
+                result = run_bench(
+                    backends, suts, args.workers, args.controllers, plan=not args.no_plan
+                )
+                print(result.describe(), flush=True)
+                results.append(result)
+        finally:
+            backends.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([result.to_dict() for result in results], f, indent=2)
+
+    failed = []
+    for result in results:
+        if args.min_rate is not None and result.rate < args.min_rate:
+            failed.append(f"{result.suts} SUTs: {result.rate:.2f} renames/min is below {args.min_rate}")
+        if args.max_p95 is not None and (
+            not result.renames or percentile(result.renames, 95) > args.max_p95
+        ):
+            failed.append(f"{result.suts} SUTs: p95 rename time is above {args.max_p95}s")
+    for failure in failed:
+        print(failure)
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,545 @@
+import re
+import ssl
+import json
+import time
+import uuid
+import random
+import datetime
+import itertools
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from bench.network import FakeNetwork, short_name
+
+# Build console lines written per second while a fake Jenkins build runs
+CONSOLE_LINES_PER_SECOND = 5
+
+
+@dataclass
+class Faults:
+    """
+    What a fake service does to every request it serves
+    :param latency: Seconds added to each request
+    :param jitter: The added latency varies by up to this many seconds either way
+    :param failure_rate: Fraction of requests answered with a 503 (or a failed command over SSH)
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+
+    def inject(self) -> bool:
+        """
+        Wait out the latency
+        :return: Whether this request should fail
+        """
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        return random.random() < self.failure_rate
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, List[str]]
+    headers: dict
+    body: bytes
+
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+    def form(self) -> Dict[str, str]:
+        return {key: values[-1] for key, values in parse_qs(self.body.decode()).items()}
+
+
+# (status, JSON payload or raw bytes or None, headers)
+Response = Tuple[int, object, Dict[str, str]]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def setup(self):
+        # TLS handshakes happen here, on the connection's own thread, rather than in the accept loop
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.do_handshake()
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        request = Request(
+            method=self.command,
+            path=url.path,
+            query=parse_qs(url.query),
+            headers=dict(self.headers),
+            body=self.rfile.read(length) if length else b"",
+        )
+        try:
+            status, payload, headers = self.service.serve(request)
+        except Exception as e:
+            status, payload, headers = 500, {"error": str(e)}, {}
+
+        if payload is None:
+            data = b""
+        elif isinstance(payload, bytes):
+            data = payload
+        else:
+            data = json.dumps(payload).encode()
+            headers.setdefault("Content-Type", "application/json")
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+
+class FakeService:
+    """
+    Local HTTP server standing in for a backend
+    Subclasses list their `routes` as (method, path regex, handler name), handlers are called with the
+    Request and the regex's named groups and return a Response
+    """
+
+    name = ""
+    routes: List[Tuple[str, str, str]] = []
+
+    def __init__(self, faults: Optional[Faults] = None, address: str = "127.0.0.1"):
+        self.faults = faults or Faults()
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._routes = [(method, re.compile(pattern), handler) for method, pattern, handler in self.routes]
+        handler = type(f"{type(self).__name__}Handler", (_Handler,), {"service": self})
+        self.server = _Server((address, 0), handler)
+        self._thread = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        host, port = self.address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name=f"fake-{self.name}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve(self, request: Request) -> Response:
+        with self._lock:
+            self.requests += 1
+        if self.faults.inject():
+            with self._lock:
+                self.failures += 1
+            return 503, {"error": "injected failure"}, {}
+        for method, pattern, handler in self._routes:
+            match = pattern.match(request.path)
+            if method == request.method and match:
+                return getattr(self, handler)(request, **match.groupdict())
+        return 404, {"error": f"{request.method} {request.path} not found"}, {}
+
+
+class FakeConductor(FakeService):
+    """The `api/v1/system/data` routes of Conductor"""
+
+    name = "conductor"
+    routes = [
+        ("GET", r"^/api/v1/system/data/?$", "query"),
+        ("PUT", r"^/api/v1/system/data/?$", "update"),
+    ]
+
+    def __init__(self, faults: Optional[Faults] = None):
+        super().__init__(faults)
+        self.systems: Dict[str, dict] = {}
+
+    def add_system(self, system: dict) -> dict:
+        system = dict(system, id=system.get("id") or uuid.uuid4().hex)
+        with self._lock:
+            self.systems[system["id"]] = system
+        return system
+
+    def query(self, request: Request) -> Response:
+        filters = request.json()
+        page = filters.pop("page", None)
+        page_size = filters.pop("page_size", None)
+        return_record_count = filters.pop("return_record_count", False)
+        with self._lock:
+            matches = [
+                json.loads(json.dumps(system))
+                for system in self.systems.values()
+                if all(system.get(key) == value for key, value in filters.items())
+            ]
+        if not return_record_count:
+            return 200, matches, {}
+        page, page_size = page or 1, page_size or len(matches) or 1
+        last_page = max(1, -(-len(matches) // page_size))
+        data = matches[(page - 1) * page_size : page * page_size]
+        return 200, {"data": data, "record_count": len(matches), "last_page": last_page}, {}
+
+    def update(self, request: Request) -> Response:
+        records = request.json()
+        updated = []
+        with self._lock:
+            for record in records if isinstance(records, list) else [records]:
+                system = self.systems.get(record.get("id"))
+                if system is None:
+                    return 404, {"error": f"System {record.get('id')} not found"}, {}
+                system.update(record)
+                updated.append(json.loads(json.dumps(system)))
+        return 200, updated if isinstance(records, list) else updated[0], {}
+
+
+class FakeMAAS(FakeService):
+    """The machines API of a MAAS site, renaming a machine moves its name on the network"""
+
+    name = "maas"
+    routes = [
+        ("GET", r"^/MAAS/api/2\.0/machines/$", "list_machines"),
+        ("PUT", r"^/MAAS/api/2\.0/machines/(?P<system_id>[^/]+)/$", "update_machine"),
+    ]
+
+    def __init__(self, network: FakeNetwork, faults: Optional[Faults] = None):
+        super().__init__(faults)
+        self.network = network
+        self.machines: Dict[str, dict] = {}
+
+    def add_machine(self, hostname: str, power_type: str = "ipmi") -> dict:
+        machine = dict(system_id=uuid.uuid4().hex[:6], hostname=hostname, power_type=power_type)
+        with self._lock:
+            self.machines[machine["system_id"]] = machine
+        return machine
+
+    def list_machines(self, request: Request) -> Response:
+        hostnames = set(request.query.get("hostname", []))
+        with self._lock:
+            machines = [
+                dict(machine)
+                for machine in self.machines.values()
+                if not hostnames or machine["hostname"] in hostnames
+            ]
+        return 200, machines, {}
+
+    def update_machine(self, request: Request, system_id: str) -> Response:
+        form = request.form()
+        with self._lock:
+            machine = self.machines.get(system_id)
+            if machine is None:
+                return 404, {"error": f"Machine {system_id} not found"}, {}
+            old_hostname = machine["hostname"]
+            machine.update(form)
+            machine = dict(machine)
+        if machine["hostname"] != old_hostname:
+            self.network.rename(old_hostname, machine["hostname"])
+        return 200, machine, {}
+
+
+class FakeJenkins(FakeService):
+    """
+    The SUT Auth install/uninstall jobs of Jenkins
+    Queued builds leave the queue after `queue_time` seconds and succeed `build_time` seconds later
+    """
+
+    name = "jenkins"
+    JOB = r"/job/At-Scale/job/sut-auth/job/manual-(?P<type>install|uninstall)-prod"
+    routes = [
+        ("GET", r"^/crumbIssuer/api/json$", "crumb"),
+        ("POST", rf"^{JOB}/buildWithParameters$", "build_with_parameters"),
+        ("GET", rf"^{JOB}/api/json$", "job"),
+        ("GET", rf"^{JOB}/(?P<number>\d+)/api/json$", "build"),
+        ("GET", rf"^{JOB}/(?P<number>\d+)/logText/progressiveText$", "progressive_text"),
+        ("GET", r"^/queue/api/json$", "queue"),
+        ("GET", r"^/queue/item/(?P<queue_id>\d+)/api/json$", "queue_item"),
+    ]
+
+    def __init__(
+        self, faults: Optional[Faults] = None, queue_time: float = 0.5, build_time: float = 2
+    ):
+        super().__init__(faults)
+        self.queue_time = queue_time
+        self.build_time = build_time
+        self._queue_ids = itertools.count(1)
+        # queue id -> {type, parameters, queued_at, build}
+        self._items: Dict[int, dict] = {}
+        # type -> builds, oldest first
+        self._builds: Dict[str, List[dict]] = {"install": [], "uninstall": []}
+
+    def _advance(self):
+        now = time.time()
+        for queue_id, item in self._items.items():
+            if item["build"] is None and now - item["queued_at"] >= self.queue_time:
+                builds = self._builds[item["type"]]
+                item["build"] = dict(
+                    number=len(builds) + 1,
+                    queueId=queue_id,
+                    started_at=now,
+                    parameters=item["parameters"],
+                )
+                builds.append(item["build"])
+
+    def _render(self, build: dict) -> dict:
+        building = time.time() - build["started_at"] < self.build_time
+        return dict(
+            number=build["number"],
+            queueId=build["queueId"],
+            building=building,
+            result=None if building else "SUCCESS",
+            duration=0 if building else int(self.build_time * 1000),
+            timestamp=int(build["started_at"] * 1000),
+            actions=[
+                {
+                    "parameters": [
+                        {"name": name, "value": value}
+                        for name, value in build["parameters"].items()
+                    ]
+                }
+            ],
+        )
+
+    def _find(self, type: str, number: str) -> Optional[dict]:
+        builds = self._builds[type]
+        index = int(number) - 1
+        return builds[index] if 0 <= index < len(builds) else None
+
+    def crumb(self, request: Request) -> Response:
+        return 200, {"crumb": "bench", "crumbRequestField": "Jenkins-Crumb"}, {}
+
+    def build_with_parameters(self, request: Request, type: str) -> Response:
+        queue_id = next(self._queue_ids)
+        with self._lock:
+            self._items[queue_id] = dict(
+                type=type, parameters=request.form(), queued_at=time.time(), build=None
+            )
+        host = request.headers.get("Host", "localhost")
+        return 201, None, {"Location": f"http://{host}/queue/item/{queue_id}/"}
+
+    def job(self, request: Request, type: str) -> Response:
+        with self._lock:
+            self._advance()
+            builds = [self._render(build) for build in reversed(self._builds[type][-50:])]
+        return 200, {"builds": builds}, {}
+
+    def build(self, request: Request, type: str, number: str) -> Response:
+        with self._lock:
+            self._advance()
+            build = self._find(type, number)
+            if build is None:
+                return 404, None, {}
+            return 200, self._render(build), {}
+
+    def progressive_text(self, request: Request, type: str, number: str) -> Response:
+        with self._lock:
+            self._advance()
+            build = self._find(type, number)
+            if build is None:
+                return 404, None, {}
+            rendered = self._render(build)
+        elapsed = min(time.time() - build["started_at"], self.build_time)
+        lines = [f"[bench] {type} step {i}" for i in range(int(elapsed * CONSOLE_LINES_PER_SECOND))]
+        if not rendered["building"]:
+            lines.append(f"Finished: {rendered['result']}")
+        text = "".join(line + "\n" for line in lines).encode()
+        start = int(request.query.get("start", ["0"])[0])
+        return 200, text[start:], {
+            "Content-Type": "text/plain; charset=utf-8",
+            "X-Text-Size": str(len(text)),
+            "X-More-Data": "true" if rendered["building"] else "false",
+        }
+
+    def queue(self, request: Request) -> Response:
+        with self._lock:
+            self._advance()
+            items = [{"id": queue_id} for queue_id, item in self._items.items() if item["build"] is None]
+        return 200, {"items": items}, {}
+
+    def queue_item(self, request: Request, queue_id: str) -> Response:
+        with self._lock:
+            self._advance()
+            item = self._items.get(int(queue_id))
+            if item is None:
+                return 404, None, {}
+            executable = {"number": item["build"]["number"]} if item["build"] else None
+        return 200, {"cancelled": False, "executable": executable}, {}
+
+
+class FakeRedfish(FakeService):
+    """
+    Redfish over TLS for any number of BMCs, told apart by the Host header
+    Hostname changes are applied by a task that completes after `task_time` seconds
+    """
+
+    name = "redfish"
+    SESSIONS = "/redfish/v1/SessionService/Sessions"
+    INTERFACE = "/redfish/v1/Managers/Self/EthernetInterfaces/bond0"
+    routes = [
+        ("GET", r"^/redfish/v1/?$", "service_root"),
+        ("POST", rf"^{SESSIONS}$", "login"),
+        ("DELETE", rf"^{SESSIONS}/(?P<session_id>\w+)$", "logout"),
+        ("GET", rf"^{INTERFACE}$", "get_interface"),
+        ("PATCH", rf"^{INTERFACE}$", "patch_interface"),
+        ("GET", r"^/redfish/v1/TaskService/Tasks/(?P<task_id>\d+)$", "task"),
+    ]
+
+    def __init__(
+        self,
+        network: FakeNetwork,
+        certificate: Tuple[str, str],
+        faults: Optional[Faults] = None,
+        task_time: float = 0.5,
+    ):
+        """
+        :param certificate: Paths of the certificate and its key, see generate_certificate
+        """
+        super().__init__(faults)
+        self.network = network
+        self.task_time = task_time
+        # address -> {hostname, version}
+        self.bmcs: Dict[str, dict] = {}
+        self._tokens = set()
+        self._task_ids = itertools.count(1)
+        self._tasks: Dict[int, dict] = {}
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*certificate)
+        self.server.socket = context.wrap_socket(
+            self.server.socket, server_side=True, do_handshake_on_connect=False
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self.address
+        return f"https://{host}:{port}"
+
+    def add_bmc(self, hostname: str) -> str:
+        """
+        Put a BMC on the network, answering Redfish on port 443
+        :return: Its address
+        """
+        address = self.network.allocate()
+        self.network.register(hostname, address)
+        self.network.expose(address, 443, self.address)
+        with self._lock:
+            self.bmcs[address] = dict(hostname=short_name(hostname), version=1)
+        return address
+
+    def _bmc(self, request: Request) -> Optional[dict]:
+        address = self.network.lookup(request.headers.get("Host", "").split(":")[0])
+        return self.bmcs.get(address)
+
+    def _authorized(self, request: Request) -> bool:
+        return request.headers.get("X-Auth-Token") in self._tokens or "Authorization" in request.headers
+
+    def service_root(self, request: Request) -> Response:
+        return 200, {"RedfishVersion": "1.11.0"}, {}
+
+    def login(self, request: Request) -> Response:
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._tokens.add(token)
+        return 201, {}, {"X-Auth-Token": token, "Location": f"{self.SESSIONS}/{token}"}
+
+    def logout(self, request: Request, session_id: str) -> Response:
+        with self._lock:
+            self._tokens.discard(session_id)
+        return 204, None, {}
+
+    def get_interface(self, request: Request) -> Response:
+        bmc = self._bmc(request)
+        if not self._authorized(request):
+            return 401, {}, {}
+        if bmc is None:
+            return 404, {}, {}
+        etag = f'W/"{bmc["version"]}"'
+        return 200, {"HostName": bmc["hostname"], "@odata.etag": etag}, {"ETag": etag}
+
+    def patch_interface(self, request: Request) -> Response:
+        bmc = self._bmc(request)
+        if not self._authorized(request):
+            return 401, {}, {}
+        if bmc is None:
+            return 404, {}, {}
+        with self._lock:
+            if request.headers.get("If-Match") not in ("*", f'W/"{bmc["version"]}"'):
+                return 412, {}, {}
+            bmc["version"] += 1
+            task_id = next(self._task_ids)
+            self._tasks[task_id] = dict(
+                bmc=bmc, hostname=request.json()["HostName"], done_at=time.time() + self.task_time
+            )
+        return 202, {}, {"Location": f"/redfish/v1/TaskService/Tasks/{task_id}"}
+
+    def task(self, request: Request, task_id: str) -> Response:
+        if not self._authorized(request):
+            return 401, {}, {}
+        with self._lock:
+            task = self._tasks.get(int(task_id))
+            if task is None:
+                return 404, {}, {}
+            if time.time() < task["done_at"]:
+                return 202, {"TaskState": "Running"}, {}
+            old_hostname = task["bmc"]["hostname"]
+            task["bmc"]["hostname"] = task["hostname"]
+        if old_hostname != task["hostname"]:
+            self.network.rename(old_hostname, task["hostname"])
+        return 200, {"TaskState": "Completed"}, {}
+
+
+def generate_certificate(directory: str) -> Tuple[str, str]:
+    """
+    Write a throwaway self-signed certificate for the fake BMCs
+    :return: Paths of the certificate and its key
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "bench-bmc")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    certificate_path, key_path = f"{directory}/bmc.crt", f"{directory}/bmc.key"
+    with open(certificate_path, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    return certificate_path, key_path
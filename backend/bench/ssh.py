@@ -0,0 +1,230 @@
+import os
+import time
+import socket
+import selectors
+import threading
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import paramiko
+
+from bench.network import FakeNetwork
+from bench.services import Faults
+
+# Stand-ins for the commands the rename runs on SUTs and power controllers. They act on the host's
+# directory ($BENCH_HOST_DIR) instead of the machine running the benchmark.
+STUBS = {
+    "sudo": 'exec "$@"',
+    "hostnamectl": (
+        'case "$1" in\n'
+        '  set-hostname) printf "%s" "$2" > "$BENCH_HOST_DIR/hostname" ;;\n'
+        '  *) echo "Static hostname: $(cat "$BENCH_HOST_DIR/hostname")" ;;\n'
+        "esac"
+    ),
+    "hostname": 'cat "$BENCH_HOST_DIR/hostname"; echo',
+    # Only ever pointed at /etc/hosts by the rename
+    "sed": "exit 0",
+    "rw": "exit 0",
+    "ro": "exit 0",
+    "reboot": 'touch "$BENCH_HOST_DIR/reboot"',
+}
+
+
+@dataclass
+class FakeHost:
+    hostname: str
+    address: str
+    directory: str
+    listener: socket.socket
+    # Until when the host is rebooting, it refuses SSH and its name doesn't resolve meanwhile
+    down_until: Optional[float] = None
+    transports: List[paramiko.Transport] = field(default_factory=list)
+
+    @property
+    def port(self) -> int:
+        return self.listener.getsockname()[1]
+
+    def read_hostname(self) -> str:
+        with open(os.path.join(self.directory, "hostname")) as f:
+            return f.read().strip()
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, server: "FakeSSHServer", host: FakeHost):
+        self.server = server
+        self.host = host
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(
+            target=self.server.execute,
+            args=(self.host, channel, command.decode()),
+            name=f"fake-ssh-{self.host.address}",
+            daemon=True,
+        ).start()
+        return True
+
+
+class FakeSSHServer:
+    def __init__(
+        self,
+        network: FakeNetwork,
+        directory: str,
+        faults: Optional[Faults] = None,
+        reboot_time: float = 2,
+    ):
+        """
+        In-process SSH server for any number of SUTs and power controllers, each on its own address
+        Commands run in a real shell, with the system commands the rename uses replaced by STUBS
+        A host that reboots goes down for `reboot_time` seconds and comes back under its new hostname
+        :param directory: Where the stubs and each host's state are kept
+        """
+        self.network = network
+        self.directory = directory
+        self.faults = faults or Faults()
+        self.reboot_time = reboot_time
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.hosts: Dict[str, FakeHost] = {}
+        self.commands = 0
+        self.failures = 0
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        stubs = os.path.join(directory, "bin")
+        os.makedirs(stubs, exist_ok=True)
+        for name, body in STUBS.items():
+            path = os.path.join(stubs, name)
+            with open(path, "w") as f:
+                f.write(f"#!/bin/sh\n{body}\n")
+            os.chmod(path, 0o755)
+        self.path = os.pathsep.join([stubs, os.environ.get("PATH", "")])
+
+    def add_host(self, hostname: str) -> FakeHost:
+        """
+        Put a host on the network, answering SSH on port 22
+        """
+        address = self.network.allocate()
+        directory = os.path.join(self.directory, "hosts", address)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "hostname"), "w") as f:
+            f.write(hostname)
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((address, 0))
+        listener.listen(64)
+        listener.setblocking(False)
+        host = FakeHost(hostname, address, directory, listener)
+        with self._lock:
+            self.hosts[address] = host
+            self._selector.register(listener, selectors.EVENT_READ, host)
+        self.network.register(hostname, address)
+        self.network.expose(address, 22, (address, host.port))
+        return host
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name="fake-ssh", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            hosts = list(self.hosts.values())
+        for host in hosts:
+            for transport in host.transports:
+                transport.close()
+            host.listener.close()
+        self._selector.close()
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            for key, _ in self._selector.select(timeout=0.05):
+                host = key.data
+                try:
+                    connection, _ = host.listener.accept()
+                except BlockingIOError:
+                    continue
+                if host.down_until is not None:
+                    connection.close()
+                    continue
+                connection.setblocking(True)
+                threading.Thread(
+                    target=self._start_transport, args=(host, connection), daemon=True
+                ).start()
+            self._update_hosts()
+
+    def _start_transport(self, host: FakeHost, connection: socket.socket):
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(self.host_key)
+        with self._lock:
+            host.transports = [t for t in host.transports if t.is_active()] + [transport]
+        try:
+            transport.start_server(server=_ServerInterface(self, host))
+        except (paramiko.SSHException, EOFError, OSError):
+            # Probes only read the banner and hang up
+            transport.close()
+
+    def _update_hosts(self):
+        now = time.time()
+        with self._lock:
+            hosts = list(self.hosts.values())
+        for host in hosts:
+            reboot = os.path.join(host.directory, "reboot")
+            if os.path.exists(reboot):
+                os.remove(reboot)
+                host.down_until = now + self.reboot_time
+                self.network.unregister(host.hostname)
+                for transport in host.transports:
+                    transport.close()
+            elif host.down_until is not None and now >= host.down_until:
+                # Power controllers register their hostname with DNS as they boot
+                host.down_until = None
+                host.hostname = host.read_hostname()
+                self.network.register(host.hostname, host.address)
+
+    def execute(self, host: FakeHost, channel: paramiko.Channel, command: str):
+        try:
+            stdin = []
+            while True:
+                data = channel.recv(65536)
+                if not data:
+                    break
+                stdin.append(data)
+            with self._lock:
+                self.commands += 1
+            if self.faults.inject():
+                with self._lock:
+                    self.failures += 1
+                channel.sendall_stderr(b"injected failure\n")
+                channel.send_exit_status(255)
+                return
+            process = subprocess.run(
+                ["sh", "-c", command],
+                input=b"".join(stdin),
+                capture_output=True,
+                cwd=host.directory,
+                env=dict(PATH=self.path, BENCH_HOST_DIR=host.directory),
+            )
+            channel.sendall(process.stdout)
+            channel.sendall_stderr(process.stderr)
+            channel.send_exit_status(process.returncode)
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            channel.close()
@@ -1 +1,8 @@
-from database.system_data import SYSTEM_DATA_DB_CONTROLLER
\ No newline at end of file
+from database.system_data import (
+    ASYNC_SYSTEM_DATA_DB_CONTROLLER,
+    SYSTEM_DATA_DB_CONTROLLER,
+    SYSTEM_DATA_QUERY_CACHE,
+)
+from database.async_database import AsyncDatabaseController
+from database.cache import QueryCache
+from database.database import DatabaseController
@@ -0,0 +1,240 @@
+import asyncio
+import aiohttp
+
+from ats_logging import get_logger
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+logger = get_logger(__name__, print_logs=False)
+
+
+import models
+from backend import AsyncEndpoint, RequestError
+from database.cache import QueryCache
+from database.database import (
+    DEFAULT_BULK_CHUNK_BYTES,
+    DEFAULT_BULK_CHUNK_SIZE,
+    DEFAULT_BULK_CONCURRENCY,
+    DEFAULT_PAGE_SIZE,
+    DatabaseController,
+)
+from aiohttp import ClientResponse
+
+# What aiohttp raises when a request doesn't get a response, its counterpart of requests' RequestException
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+def async_suppress_errors(func):
+    async def wrapper(self, *args, **kwargs):
+        try:
+            return await func(self, *args, **kwargs)
+        except RequestError:
+            logger.exception("Exception suppressed by controller, returning None.")
+            return None
+
+    return wrapper
+
+
+class AsyncDatabaseController(DatabaseController):
+    """asyncio twin of DatabaseController, every method is a coroutine.
+
+    Payload shaping is inherited from DatabaseController: against an AsyncEndpoint
+    its _send_* methods return the endpoint's awaitable, which is awaited here.
+    """
+
+    def __init__(
+        self,
+        model: models.Model,
+        endpoint: AsyncEndpoint,
+        cache: Optional[QueryCache] = None,
+    ):
+        super().__init__(model, endpoint, cache)
+
+    @async_suppress_errors
+    async def query(self, **kwargs) -> Union[models.Model, List[models.Model]]:
+        if self.cache is not None:
+            cached, query_result = self.cache.get(kwargs)
+            if cached:
+                return query_result
+            generation = self.cache.generation
+        response = await self.endpoint.get(**kwargs)
+        query_result = self._get_query_result(response, kwargs)
+        if self.cache is not None:
+            self.cache.set(kwargs, query_result, generation)
+        return query_result
+
+    async def get(self, **kwargs) -> Union[models.Model, List[models.Model]]:
+        return await self.query(**kwargs)
+
+    async def iter_query(
+        self, page_size: int = DEFAULT_PAGE_SIZE, **kwargs
+    ) -> AsyncIterator[models.Model]:
+        """Async counterpart of DatabaseController.iter_query."""
+        page = 1
+        next_page = asyncio.ensure_future(self._query_page(page, page_size, kwargs))
+        try:
+            while next_page is not None:
+                response = await next_page
+                next_page = (
+                    None
+                    if self._is_last_page(response, page, page_size)
+                    else asyncio.ensure_future(
+                        self._query_page(page + 1, page_size, kwargs)
+                    )
+                )
+                data = response.get("data") or []
+                del response
+                for item in data:
+                    yield self._get_model_obj(item)
+                page += 1
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def update(
+        self,
+        model_obj: Union[models.Model, Dict],
+        race_condition_check=False,
+        return_response=False,
+        **kwargs
+    ) -> Union[Dict, List, ClientResponse]:
+        targets = self._write_targets(model_obj)
+        try:
+            return await self._send_update(
+                model_obj, race_condition_check, return_response=return_response, **kwargs
+            )
+        finally:
+            self._invalidate_cache(targets)
+
+    async def put(
+        self,
+        model_obj: Union[models.Model, Dict],
+        race_condition_check=False,
+        return_response=False,
+        **kwargs
+    ) -> Union[Dict, List, ClientResponse]:
+        return await self.update(
+            model_obj, race_condition_check, return_response=return_response, **kwargs
+        )
+
+    async def insert(
+        self,
+        model_obj: Union[
+            models.Model, List[models.Model], Dict, List[Dict], None
+        ] = None,
+        return_response=False,
+        **kwargs
+    ) -> Union[Dict, List, ClientResponse]:
+        targets = self._write_targets(model_obj)
+        try:
+            return await self._send_insert(
+                model_obj, return_response=return_response, **kwargs
+            )
+        finally:
+            self._invalidate_cache(targets, inserted=True)
+
+    async def post(
+        self,
+        model_obj: Union[
+            models.Model, List[models.Model], Dict, List[Dict], None
+        ] = None,
+        return_response=False,
+        **kwargs
+    ) -> Union[Dict, List, ClientResponse]:
+        return await self.insert(model_obj, return_response=return_response, **kwargs)
+
+    @async_suppress_errors
+    async def delete(
+        self,
+        identifier: str = None,
+        model_obj: Union[models.Model, Dict] = None,
+        return_response=False,
+        **kwargs
+    ) -> Union[Dict, List, ClientResponse]:
+        targets = self._write_targets(model_obj, identifier, include_fields=False)
+        try:
+            return await self._send_delete(
+                identifier, model_obj, return_response=return_response, **kwargs
+            )
+        finally:
+            self._invalidate_cache(targets)
+
+    async def _send_chunk(
+        self,
+        send: Callable[[List[Dict]], Awaitable[Union[Dict, List]]],
+        records: List[Dict],
+        indexes: List[int],
+        results: List[Dict],
+        split_on: Tuple,
+    ):
+        try:
+            response = await send([records[index] for index in indexes])
+        except split_on as e:
+            # The whole chunk was rejected, bisect it to find the records at fault
+            if len(indexes) > 1:
+                middle = len(indexes) // 2
+                await self._send_chunk(send, records, indexes[:middle], results, split_on)
+                await self._send_chunk(send, records, indexes[middle:], results, split_on)
+                return
+            error = e
+        except (RequestError, *TRANSPORT_ERRORS) as e:
+            error = e
+        else:
+            self._chunk_succeeded(results, indexes, response)
+            return
+        self._chunk_failed(results, indexes, error)
+
+    async def _bulk_write(
+        self,
+        send: Callable[[List[Dict]], Awaitable[Union[Dict, List]]],
+        records: List[Dict],
+        chunk_size: int,
+        chunk_bytes: int,
+        max_concurrency: int,
+        split_on: Tuple,
+    ) -> List[Dict]:
+        results = self._bulk_results(records)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def send_chunk(chunk: List[int]):
+            async with semaphore:
+                await self._send_chunk(send, records, chunk, results, split_on)
+
+        # AuthorizationError and other unexpected errors abort the whole batch
+        await asyncio.gather(
+            *(send_chunk(chunk) for chunk in self._chunk(records, chunk_size, chunk_bytes))
+        )
+        return results
+
+    async def bulk_update(
+        self,
+        model_objs: List[Union[models.Model, Dict]],
+        chunk_size: int = DEFAULT_BULK_CHUNK_SIZE,
+        chunk_bytes: int = DEFAULT_BULK_CHUNK_BYTES,
+        max_concurrency: int = DEFAULT_BULK_CONCURRENCY,
+    ) -> List[Dict]:
+        """Async counterpart of DatabaseController.bulk_update."""
+        return await self._bulk_write(
+            lambda chunk: self.update([dict(record) for record in chunk]),
+            self._update_records(model_objs),
+            chunk_size,
+            chunk_bytes,
+            max_concurrency,
+            split_on=(RequestError, *TRANSPORT_ERRORS),
+        )
+
+    async def bulk_insert(
+        self,
+        model_objs: List[Union[models.Model, Dict]],
+        chunk_size: int = DEFAULT_BULK_CHUNK_SIZE,
+        chunk_bytes: int = DEFAULT_BULK_CHUNK_BYTES,
+        max_concurrency: int = DEFAULT_BULK_CONCURRENCY,
+    ) -> List[Dict]:
+        """Async counterpart of DatabaseController.bulk_insert."""
+        return await self._bulk_write(
+            lambda chunk: self.insert(list(chunk)),
+            self._insert_records(model_objs),
+            chunk_size,
+            chunk_bytes,
+            max_concurrency,
+            split_on=(RequestError,),
+        )
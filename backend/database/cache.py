@@ -0,0 +1,127 @@
+import copy
+import json
+import time
+import threading
+
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Tuple
+
+import models
+
+# Query kwargs that shape the response rather than filter records
+PAGINATION_KEYS = frozenset(("page", "page_size", "return_record_count"))
+
+
+class QueryCache:
+    """Read-through TTL + LRU cache for DatabaseController.query results.
+
+    Entries are keyed on the normalized query kwargs and remember the ids of the
+    records they returned and the fields they filtered on, so writes only evict
+    the entries they can affect. Values are copied in and out so callers can
+    mutate what they get back without corrupting the cache.
+    """
+
+    def __init__(self, ttl: float = 30, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidation so results fetched before a write are not stored after it
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query_kwargs: Dict) -> str:
+        return json.dumps(query_kwargs, sort_keys=True, default=str)
+
+    @staticmethod
+    def _record_ids(value: Any) -> FrozenSet[str]:
+        if isinstance(value, dict) and "data" in value and "record_count" in value:
+            value = value["data"]
+        records = value if isinstance(value, list) else [value]
+        ids = set()
+        for record in records:
+            if isinstance(record, models.Model):
+                ids.add(record.id)
+            elif isinstance(record, dict):
+                ids.add(record.get("id"))
+        ids.discard(None)
+        return frozenset(ids)
+
+    def get(self, query_kwargs: Dict) -> Tuple[bool, Any]:
+        """
+        Returns:
+            Tuple[bool, Any]: Whether the query was cached, and a copy of its result.
+        """
+        key = self.make_key(query_kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        return True, copy.deepcopy(value)
+
+    def set(self, query_kwargs: Dict, value: Any, generation: Optional[int] = None):
+        """Store a query result, unless the cache was invalidated since `generation` was read."""
+        key = self.make_key(query_kwargs)
+        entry = (
+            time.monotonic() + self.ttl,
+            copy.deepcopy(value),
+            self._record_ids(value),
+            frozenset(query_kwargs) - PAGINATION_KEYS,
+        )
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(
+        self,
+        ids: Optional[Iterable[str]] = None,
+        fields: Iterable[str] = (),
+        inserted: bool = False,
+    ):
+        """Evict the entries a write can affect.
+
+        Args:
+            ids (Iterable[str], optional): Ids of the written records, None when unknown which clears everything.
+            fields (Iterable[str]): Fields the write set.
+            inserted (bool): The records are new, so any query filtering only on `fields` may now match them.
+        """
+        fields = frozenset(fields)
+        ids = frozenset(ids) if ids is not None else None
+        with self._lock:
+            self.generation += 1
+            if ids is None:
+                self._entries.clear()
+                return
+            for key, (_, _, entry_ids, filter_keys) in list(self._entries.items()):
+                if inserted:
+                    stale = filter_keys <= fields
+                else:
+                    stale = bool(entry_ids & ids or filter_keys & fields)
+                if stale:
+                    del self._entries[key]
+
+    def clear(self):
+        self.invalidate()
+
+    @property
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
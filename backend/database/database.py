@@ -1,13 +1,23 @@
+import json
+import requests
+
 from ats_logging import get_logger
-from typing import Dict, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 logger = get_logger(__name__, print_logs=False)
 
 
 import models
 from backend import (Endpoint, RequestError)
+from database.cache import QueryCache
 from requests import Response
 
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_BULK_CHUNK_SIZE = 100
+DEFAULT_BULK_CHUNK_BYTES = 512 * 1024
+DEFAULT_BULK_CONCURRENCY = 4
+
 
 def suppress_errors(func):
     def wrapper(self, *args, **kwargs):
@@ -21,30 +31,48 @@ def suppress_errors(func):
 
 
 class DatabaseController:
-    def __init__(self, model: models.Model, endpoint: Endpoint):
+    def __init__(
+        self,
+        model: models.Model,
+        endpoint: Endpoint,
+        cache: Optional[QueryCache] = None,
+    ):
         self.model = model
         self.endpoint = endpoint
+        self.cache = cache
+
+    def _get_model_obj(self, item: Dict) -> models.Model:
+        model_obj = self.model()
+        model_obj.from_db = True
+        model_obj.from_dict(item)
+        return model_obj
 
     def _get_model_objs(self, data):
         model_objs = None
         if isinstance(data, list):
-            model_objs = []
-            for item in data:
-                model_obj = self.model()
-                model_obj.from_db = True
-                model_obj.from_dict(item)
-                model_objs.append(model_obj)
+            model_objs = [self._get_model_obj(item) for item in data]
         elif data:
-            model_obj = self.model()
-            model_obj.from_db = True
-            model_obj.from_dict(data)
-            model_objs = model_obj
+            model_objs = self._get_model_obj(data)
         return model_objs
 
-    @suppress_errors
-    def query(self, **kwargs) -> Union[models.Model, List[models.Model]]:
-        response = self.endpoint.get(**kwargs)
-        if "return_record_count" in kwargs:
+    def _query_page(self, page: int, page_size: int, query_kwargs: Dict) -> Dict:
+        return self.endpoint.get(
+            page=page, page_size=page_size, return_record_count=True, **query_kwargs
+        )
+
+    @staticmethod
+    def _is_last_page(response: Dict, page: int, page_size: int) -> bool:
+        data = response.get("data") or []
+        last_page = response.get("last_page")
+        if len(data) < page_size:
+            return True
+        # Conductor reports either a flag or the number of the last page
+        if isinstance(last_page, bool):
+            return last_page
+        return last_page is not None and page >= last_page
+
+    def _get_query_result(self, response, query_kwargs: Dict):
+        if "return_record_count" in query_kwargs:
             query_result = {
                 "data": self._get_model_objs(response["data"]),
                 "record_count": response["record_count"],
@@ -54,15 +82,100 @@ class DatabaseController:
             query_result = response
         return query_result
 
+    def _write_targets(
+        self, model_obj, identifier: str = None, include_fields: bool = True
+    ) -> Optional[Tuple[Optional[set], set]]:
+        """Ids and fields a write touches, for cache invalidation. Ids are None when unknown."""
+        if self.cache is None:
+            return None
+        ids, fields = set(), set()
+        records = model_obj if isinstance(model_obj, list) else [model_obj]
+        for record in records:
+            if isinstance(record, models.Model):
+                ids.add(record.id)
+                if include_fields:
+                    fields.update(record.to_dict(only_modified=True))
+            elif isinstance(record, Dict):
+                ids.add(record.get("id"))
+                if include_fields:
+                    fields.update(record)
+            elif record is not None:
+                return None, fields
+        if identifier:
+            ids = {identifier}
+        return (None if not ids or None in ids else ids), fields
+
+    def _invalidate_cache(self, targets, inserted: bool = False):
+        if targets is None:
+            return
+        ids, fields = targets
+        if inserted and fields:
+            # ids of new records are irrelevant, any query filtering only on set fields may now match
+            ids = ()
+        self.cache.invalidate(ids, fields, inserted=inserted)
+
+    @suppress_errors
+    def query(self, **kwargs) -> Union[models.Model, List[models.Model]]:
+        if self.cache is not None:
+            cached, query_result = self.cache.get(kwargs)
+            if cached:
+                return query_result
+            generation = self.cache.generation
+        response = self.endpoint.get(**kwargs)
+        query_result = self._get_query_result(response, kwargs)
+        if self.cache is not None:
+            self.cache.set(kwargs, query_result, generation)
+        return query_result
+
     def get(self, **kwargs) -> Union[models.Model, List[models.Model]]:
         return self.query(**kwargs)
 
+    def iter_query(
+        self, page_size: int = DEFAULT_PAGE_SIZE, **kwargs
+    ) -> Iterator[models.Model]:
+        """Yield every model matching `kwargs`, one page of `page_size` at a time.
+
+        Page N+1 is fetched in the background while page N is consumed, so at most
+        two pages are held in memory. Unlike query, RequestErrors are raised rather
+        than suppressed so a scan never silently stops early.
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = 1
+            next_page = executor.submit(self._query_page, page, page_size, kwargs)
+            while next_page is not None:
+                response = next_page.result()
+                next_page = (
+                    None
+                    if self._is_last_page(response, page, page_size)
+                    else executor.submit(self._query_page, page + 1, page_size, kwargs)
+                )
+                data = response.get("data") or []
+                del response
+                for item in data:
+                    yield self._get_model_obj(item)
+                page += 1
+
     def update(
         self,
         model_obj: Union[models.Model, Dict],
         race_condition_check=False,
         return_response=False,
         **kwargs
+    ) -> Union[Dict, List, Response]:
+        targets = self._write_targets(model_obj)
+        try:
+            return self._send_update(
+                model_obj, race_condition_check, return_response=return_response, **kwargs
+            )
+        finally:
+            self._invalidate_cache(targets)
+
+    def _send_update(
+        self,
+        model_obj: Union[models.Model, Dict],
+        race_condition_check=False,
+        return_response=False,
+        **kwargs
     ) -> Union[Dict, List, Response]:
         clear_unused = True
         if isinstance(model_obj, Dict):
@@ -107,6 +220,20 @@ class DatabaseController:
         ] = None,
         return_response=False,
         **kwargs
+    ) -> Union[Dict, List, Response]:
+        targets = self._write_targets(model_obj)
+        try:
+            return self._send_insert(model_obj, return_response=return_response, **kwargs)
+        finally:
+            self._invalidate_cache(targets, inserted=True)
+
+    def _send_insert(
+        self,
+        model_obj: Union[
+            models.Model, List[models.Model], Dict, List[Dict], None
+        ] = None,
+        return_response=False,
+        **kwargs
     ) -> Union[Dict, List, Response]:
         if model_obj is None:
             return self.endpoint.post()
@@ -143,6 +270,166 @@ class DatabaseController:
     ) -> Union[Dict, List, Response]:
         return self.insert(model_obj, return_response=return_response, **kwargs)
 
+    @staticmethod
+    def _chunk(records: List[Dict], chunk_size: int, chunk_bytes: int) -> List[List[int]]:
+        """Split record indexes into chunks of at most `chunk_size` records and about `chunk_bytes` of JSON."""
+        chunks, chunk, size = [], [], 0
+        for index, record in enumerate(records):
+            record_size = len(json.dumps(record, default=str))
+            if chunk and (len(chunk) >= chunk_size or size + record_size > chunk_bytes):
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(index)
+            size += record_size
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _send_chunk(
+        self,
+        send: Callable[[List[Dict]], Union[Dict, List]],
+        records: List[Dict],
+        indexes: List[int],
+        results: List[Dict],
+        split_on: Tuple,
+    ):
+        try:
+            response = send([records[index] for index in indexes])
+        except split_on as e:
+            # The whole chunk was rejected, bisect it to find the records at fault
+            if len(indexes) > 1:
+                middle = len(indexes) // 2
+                self._send_chunk(send, records, indexes[:middle], results, split_on)
+                self._send_chunk(send, records, indexes[middle:], results, split_on)
+                return
+            error = e
+        except (RequestError, requests.exceptions.RequestException) as e:
+            error = e
+        else:
+            self._chunk_succeeded(results, indexes, response)
+            return
+        self._chunk_failed(results, indexes, error)
+
+    @staticmethod
+    def _chunk_succeeded(results: List[Dict], indexes: List[int], response: Union[Dict, List]):
+        per_record = isinstance(response, list) and len(response) == len(indexes)
+        for position, index in enumerate(indexes):
+            results[index].update(
+                success=True,
+                response=response[position] if per_record else response,
+            )
+
+    @staticmethod
+    def _chunk_failed(results: List[Dict], indexes: List[int], error: Exception):
+        logger.warning(f"Bulk write of {len(indexes)} record(s) failed: {error}")
+        for index in indexes:
+            results[index].update(success=False, error=str(error))
+
+    @staticmethod
+    def _bulk_results(records: List[Dict]) -> List[Dict]:
+        return [
+            dict(record=record, success=False, response=None, error=None)
+            for record in records
+        ]
+
+    @staticmethod
+    def _update_records(model_objs: List[Union[models.Model, Dict]]) -> List[Dict]:
+        return [
+            model_obj
+            if isinstance(model_obj, Dict)
+            else dict(
+                model_obj.to_dict(include_nested=False, only_modified=True),
+                id=model_obj.id,
+            )
+            for model_obj in model_objs
+        ]
+
+    @staticmethod
+    def _insert_records(model_objs: List[Union[models.Model, Dict]]) -> List[Dict]:
+        return [
+            model_obj
+            if isinstance(model_obj, Dict)
+            else model_obj.to_dict(include_nested=False, only_modified=True)
+            for model_obj in model_objs
+        ]
+
+    def _bulk_write(
+        self,
+        send: Callable[[List[Dict]], Union[Dict, List]],
+        records: List[Dict],
+        chunk_size: int,
+        chunk_bytes: int,
+        max_concurrency: int,
+        split_on: Tuple,
+    ) -> List[Dict]:
+        results = self._bulk_results(records)
+        chunks = self._chunk(records, chunk_size, chunk_bytes)
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            futures = [
+                executor.submit(
+                    self._send_chunk, send, records, chunk, results, split_on
+                )
+                for chunk in chunks
+            ]
+            for future in futures:
+                # AuthorizationError and other unexpected errors abort the whole batch
+                future.result()
+        return results
+
+    def bulk_update(
+        self,
+        model_objs: List[Union[models.Model, Dict]],
+        chunk_size: int = DEFAULT_BULK_CHUNK_SIZE,
+        chunk_bytes: int = DEFAULT_BULK_CHUNK_BYTES,
+        max_concurrency: int = DEFAULT_BULK_CONCURRENCY,
+    ) -> List[Dict]:
+        """Update many records as bounded chunks sent concurrently.
+
+        A chunk the server rejects is bisected and resent, so one bad record only
+        fails itself. Updates are idempotent, so timeouts are bisected too.
+
+        Args:
+            model_objs (List[Union[models.Model, Dict]]): Records to update, each with an id.
+            chunk_size (int): Maximum records per request.
+            chunk_bytes (int): Approximate maximum JSON payload per request.
+            max_concurrency (int): Maximum requests in flight.
+
+        Returns:
+            List[Dict]: Per record, in input order: record, success, response and error.
+        """
+        return self._bulk_write(
+            lambda chunk: self.update([dict(record) for record in chunk]),
+            self._update_records(model_objs),
+            chunk_size,
+            chunk_bytes,
+            max_concurrency,
+            split_on=(RequestError, requests.exceptions.RequestException),
+        )
+
+    def bulk_insert(
+        self,
+        model_objs: List[Union[models.Model, Dict]],
+        chunk_size: int = DEFAULT_BULK_CHUNK_SIZE,
+        chunk_bytes: int = DEFAULT_BULK_CHUNK_BYTES,
+        max_concurrency: int = DEFAULT_BULK_CONCURRENCY,
+    ) -> List[Dict]:
+        """Insert many records as bounded chunks sent concurrently.
+
+        Like bulk_update, but a chunk that times out is reported as failed rather
+        than resent since it may already have been inserted.
+
+        Returns:
+            List[Dict]: Per record, in input order: record, success, response and error.
+        """
+        return self._bulk_write(
+            lambda chunk: self.insert(list(chunk)),
+            self._insert_records(model_objs),
+            chunk_size,
+            chunk_bytes,
+            max_concurrency,
+            split_on=(RequestError,),
+        )
+
     @suppress_errors
     def delete(
         self,
@@ -150,6 +437,21 @@ class DatabaseController:
         model_obj: Union[models.Model, Dict] = None,
         return_response=False,
         **kwargs
+    ) -> Union[Dict, List, Response]:
+        targets = self._write_targets(model_obj, identifier, include_fields=False)
+        try:
+            return self._send_delete(
+                identifier, model_obj, return_response=return_response, **kwargs
+            )
+        finally:
+            self._invalidate_cache(targets)
+
+    def _send_delete(
+        self,
+        identifier: str = None,
+        model_obj: Union[models.Model, Dict] = None,
+        return_response=False,
+        **kwargs
     ) -> Union[Dict, List, Response]:
         if not model_obj:
             kwargs["identifier"] = identifier
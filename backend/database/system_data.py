@@ -1,7 +1,23 @@
 import models
-from backend import SystemData
+from backend import AsyncSystemData, SystemData
+from database.async_database import AsyncDatabaseController
+from database.cache import QueryCache
 from database.database import DatabaseController
+from environment import QUERY_CACHE_SIZE, QUERY_CACHE_TTL
+
+# Shared by the sync and async controllers so a write through either invalidates both
+SYSTEM_DATA_QUERY_CACHE = (
+    QueryCache(ttl=QUERY_CACHE_TTL, max_size=QUERY_CACHE_SIZE)
+    if QUERY_CACHE_TTL > 0
+    else None
+)
 
 SYSTEM_DATA_DB_CONTROLLER = DatabaseController(
-    model=models.SystemData, endpoint=SystemData()
+    model=models.SystemData, endpoint=SystemData(), cache=SYSTEM_DATA_QUERY_CACHE
+)
+
+ASYNC_SYSTEM_DATA_DB_CONTROLLER = AsyncDatabaseController(
+    model=models.SystemData,
+    endpoint=AsyncSystemData(),
+    cache=SYSTEM_DATA_QUERY_CACHE,
 )
@@ -36,3 +36,14 @@ BOOL_STRINGS = {"true": True, "false": False}
 VERIFY_CERTS = BOOL_STRINGS.get(os.environ.get("VERIFY_CERTS", "False").lower(), True)
 
 REQUEST_TIMEOUT = int(os.environ.get("REQUEST_TIMEOUT", 180))
+
+# Connections kept alive per host, and number of hosts pooled, by backend.RequestEngine
+REQUEST_POOL_SIZE = int(os.environ.get("REQUEST_POOL_SIZE", 32))
+REQUEST_POOL_HOSTS = int(os.environ.get("REQUEST_POOL_HOSTS", 4))
+
+# Maximum concurrent requests in flight per event loop for backend.AsyncRequestEngine
+ASYNC_REQUEST_LIMIT = int(os.environ.get("ASYNC_REQUEST_LIMIT", 200))
+
+# Seconds SYSTEM_DATA_DB_CONTROLLER caches query results for, 0 disables the cache
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 0))
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 1024))
@@ -1,238 +1,569 @@
 import re
+import copy
 import time
-import json
-import requests
+from typing import Callable, Optional
 
-from utils.logger import logger
-from utils.maas import MAAS
+from utils.logger import get_sut_logger
+from utils.maas import MACHINE_RESOLVER, get_machine_index
 from utils.jenkins import Jenkins
-from utils.paramiko import Paramiko
+from utils.paramiko import Paramiko, detached
+from utils.journal import RENAME_JOURNAL, RenameJournal
+from utils.pipeline import FAILED, SUCCEEDED, Pipeline, PipelineResult, Step, StepRun
+from utils.probes import probe_ssh_banner, wait_for_redfish, wait_for_ssh, wait_until
+from utils.redfish import bulk_set_hostname
 from database import SYSTEM_DATA_DB_CONTROLLER
+from planner import plan_rename
 
 
 CURRENT_HOSTNAME = ""
 NEW_HOSTNAME = ""
 # e.g. asrock325x-png-5cr14-02b.png.dcgpu
 
-if __name__ == "__main__":
-    pattern = r"^[^.]+\..+$"
-    if not re.match(pattern, NEW_HOSTNAME) or not re.match(pattern, CURRENT_HOSTNAME):
+# Only print which steps would run
+DRY_RUN = False
+
+HOSTNAME_PATTERN = r"^[^.]+\..+$"
+
+# Seconds to wait for renamed power controllers to come back under their new names
+REBOOT_TIMEOUT = 300
+# Seconds to wait for the SUT to be reachable under its new name
+SUT_READY_TIMEOUT = 300
+
+# Power controller fields that are kept out of the rename journal
+CREDENTIAL_FIELDS = ("user", "pass")
+
+
+def run_remote_steps(ssh: Paramiko, steps: list, logger=None):
+    """
+    Run commands on a host in one round trip, raising on the first one that fails
+    :param logger: Logs each step's output at debug level when given
+    """
+    results = ssh.run_script(steps)
+    for result in results:
+        if logger is not None:
+            for line in (result.stdout + result.stderr).splitlines():
+                logger.debug(f"[{ssh.hostname}] {line}")
+        if not result.ok:
+            raise RuntimeError(
+                f"`{result.command}` exited with {result.exit_status}: {result.stderr.strip()}"
+            )
+    if len(results) != len(steps):
+        raise RuntimeError(f"Remote script stopped after {len(results)} of {len(steps)} steps")
+
+
+def rename_sut(
+    current_hostname: str,
+    new_hostname: str,
+    on_transition: Optional[Callable[[StepRun], None]] = None,
+    journal: Optional[RenameJournal] = RENAME_JOURNAL,
+    plan: bool = True,
+) -> PipelineResult:
+    """
+    Rename a single SUT in Conductor, its power controllers, MAAS, Jenkins SUT Auth and the SUT itself
+    Steps run as soon as their inputs are ready, see build_rename_pipeline for the dependencies
+    Each step's outputs are journaled, so rerunning a rename that failed skips the steps it already completed
+    Steps the planner finds already applied, e.g. by an earlier attempt made elsewhere, are skipped as well
+    :param current_hostname: The current FQDN of the SUT
+    :param new_hostname: The new FQDN of the SUT
+    :param on_transition: Called with a step's StepRun whenever its state changes
+    :param journal: Where completed steps are recorded and resumed from, None to always start over
+    :param plan: Read the current state first and skip the steps that are already applied
+    :return: PipelineResult holding every step's state and timing
+    """
+    logger = get_sut_logger(current_hostname)
+
+    if not re.match(HOSTNAME_PATTERN, new_hostname) or not re.match(
+        HOSTNAME_PATTERN, current_hostname
+    ):
         logger.error("Invalid hostname format")
         raise RuntimeError("Invalid hostname format")
 
+    completed = {}
+    if plan:
+        rename_plan = plan_rename(current_hostname, new_hostname)
+        logger.info(rename_plan.describe())
+        completed.update(rename_plan.completed)
+
+    if journal is None:
+        result = build_rename_pipeline(current_hostname, new_hostname, logger).run(
+            on_transition=on_transition, completed=completed
+        )
+    else:
+        result = _run_journaled(
+            current_hostname, new_hostname, logger, on_transition, journal, completed
+        )
+
+    for run in result.runs.values():
+        if run.duration is not None:
+            logger.debug(f"{run.name} took {run.duration:.2f}s")
+    logger.info(
+        "All operations completed successfully, please update the power distribution accordingly!"
+    )
+    return result
+
+
+def _run_journaled(
+    current_hostname, new_hostname, logger, on_transition, journal, completed
+) -> PipelineResult:
+    rename_id = RenameJournal.rename_id(current_hostname, new_hostname)
+    journaled = journal.completed_steps(rename_id)
+    if journaled:
+        logger.info(f"Resuming rename, skipping {', '.join(sorted(journaled))}")
+        _restore_credentials(journaled, current_hostname, new_hostname)
+    # The journal picks up what the planner can't see, what the planner reads live wins
+    completed = {**journaled, **completed}
+    journal.start(rename_id, current_hostname, new_hostname)
+
+    def record_outputs(run: StepRun, outputs: dict):
+        journal.record_step(
+            rename_id,
+            run.name,
+            SUCCEEDED,
+            _strip_credentials(outputs),
+            started_at=run.started_at,
+            finished_at=time.time(),
+        )
+
+    def record_transition(run: StepRun):
+        if run.state == FAILED:
+            journal.record_step(
+                rename_id,
+                run.name,
+                FAILED,
+                error=run.error,
+                started_at=run.started_at,
+                finished_at=run.finished_at,
+            )
+        if on_transition is not None:
+            on_transition(run)
+
+    try:
+        result = build_rename_pipeline(current_hostname, new_hostname, logger).run(
+            on_transition=record_transition, completed=completed, on_outputs=record_outputs
+        )
+    except Exception as e:
+        journal.finish(rename_id, FAILED, str(e) or e.__class__.__name__)
+        raise
+    journal.finish(rename_id, SUCCEEDED)
+    return result
+
+
+def _controller_lists(outputs: dict) -> list:
+    # The system and the renamed controllers both carry the power controllers
+    lists = []
+    if "system" in outputs:
+        lists.append(outputs["system"].get("platform_config", {}).get("power_controllers", []))
+    if "power_controllers" in outputs:
+        lists.append(outputs["power_controllers"])
+    return lists
+
+
+def _strip_credentials(outputs: dict) -> dict:
+    """
+    :return: A copy of a step's outputs without the power controllers' credentials, fit for the journal
+    """
+    outputs = copy.deepcopy(outputs)
+    for power_controllers in _controller_lists(outputs):
+        for power_controller in power_controllers:
+            for field in CREDENTIAL_FIELDS:
+                power_controller.pop(field, None)
+    return outputs
+
+
+def _restore_credentials(journaled: dict, current_hostname: str, new_hostname: str):
+    """
+    Put the power controllers' credentials back into journaled outputs, reading them from Conductor again
+    Controllers are matched by position, the rename keeps their order
+    """
+    controller_lists = [
+        power_controllers
+        for outputs in journaled.values()
+        for power_controllers in _controller_lists(outputs)
+        if power_controllers
+    ]
+    if not controller_lists:
+        return
+
+    # Conductor holds the system under the new hostname once conductor_update went through
+    for hostname in (current_hostname, new_hostname):
+        system_data = SYSTEM_DATA_DB_CONTROLLER.query(hostname_ip=hostname)
+        if system_data:
+            break
+    else:
+        raise RuntimeError("System not found in Conductor, can't restore the power controller credentials")
+
+    stored = system_data[0].get("platform_config", {}).get("power_controllers", [])
+    for power_controllers in controller_lists:
+        for power_controller, stored_controller in zip(power_controllers, stored):
+            for field in CREDENTIAL_FIELDS:
+                if field in stored_controller:
+                    power_controller[field] = stored_controller[field]
+
+
+def build_rename_pipeline(current_hostname: str, new_hostname: str, logger) -> Pipeline:
+    """
+    Lay out the rename as a pipeline
+    Conductor and MAAS are looked up at the same time, and nothing is changed until both lookups succeeded so a
+    SUT missing from either one is left as it was. The power controllers and the Conductor update then run
+    alongside the Jenkins chain, which waits for MAAS since the SUT is reached by its new name from there on:
+    maas_update -> sut_auth_uninstall -> sut_hostname -> sut_auth_install
+    Waiting for renamed power controllers to come back is a step of its own that nothing else waits on
+    """
+    new_short_hostname = new_hostname.split(".")[0]
+
     # ======================================================
-    # CONDUCTOR UPDATE
-    # Note: This section configures the hostname in Conductor
+    # CONDUCTOR LOOKUP
+    # Note: This section finds the system in Conductor
     # ======================================================
-    logger.info("Searching on Conductor")
-    system_data = SYSTEM_DATA_DB_CONTROLLER.query(hostname_ip=CURRENT_HOSTNAME)
-
-    if not system_data:
-        logger.error("System not found")
-        raise RuntimeError("System data not found")
-
-    logger.info("System found")
-
-    system_id = system_data[0].get("id", "")
-    system_username = system_data[0].get("username", "")
-    platform_config = system_data[0].get("platform_config", {})
-    notes = platform_config.get("notes", "")
-    power_controllers = platform_config.get("power_controllers", [])
-    platforms = system_data[0].get("platforms", {})
-    platform_name = platforms.get("name", "")
-
-    for power_controller in power_controllers:
-        if (
-            "bmc" in power_controller.get("ip", "")
-            and "asrock" in platform_name.lower()
-        ):
-            logger.info("Configuring Asrock BMC...")
+    def conductor_lookup():
+        logger.info("Searching on Conductor")
+        system_data = SYSTEM_DATA_DB_CONTROLLER.query(hostname_ip=current_hostname)
 
-            # REDFISH PATCH REQUEST
-            url = f"https://{power_controller["ip"]}/redfish/v1/Managers/Self/EthernetInterfaces/bond0"
+        if not system_data:
+            logger.error("System not found")
+            raise RuntimeError("System data not found")
 
-            username = power_controller["user"]
-            password = power_controller["pass"]
+        logger.info("System found")
+        return {"system": system_data[0]}
 
-            headers = {"Content-Type": "application/json", "If-Match": "*"}
-
-            payload = {"HostName": f"bmc-{NEW_HOSTNAME.split('.')[0]}"}
+    # ======================================================
+    # POWER CONTROLLERS
+    # Note: This section renames the BMC, PiKVM and RaspberryPi
+    # ======================================================
+    def power_controllers_update(system, machine):
+        # machine is unused, it only holds the renames back until MAAS has the SUT as well
+        platform_config = system.get("platform_config", {})
+        notes = platform_config.get("notes", "")
+        power_controllers = platform_config.get("power_controllers", [])
+        platforms = system.get("platforms", {})
+        platform_name = platforms.get("name", "")
+        renamed = []
+        bmcs = []
+
+        for power_controller in power_controllers:
+            if (
+                "bmc" in power_controller.get("ip", "")
+                and "asrock" in platform_name.lower()
+            ):
+                # Renamed together below
+                bmcs.append(power_controller)
+            elif "pikvm" in power_controller.get("ip", ""):
+                logger.info("Configuring PiKVM...")
+
+                pikvm_new_hostname = "pikvm-" + new_short_hostname
+                pikvm_username = power_controller["user"]
+                pikvm_password = power_controller["pass"]
+
+                modified_note = notes.replace(power_controller["ip"], pikvm_new_hostname + ".amd.com")
+                notes = modified_note
+
+                try:
+                    with Paramiko(
+                        hostname=power_controller["ip"],
+                        username=pikvm_username,
+                        password=pikvm_password,
+                    ) as ssh:
+                        run_remote_steps(
+                            ssh,
+                            [
+                                "rw",
+                                f"hostnamectl set-hostname {pikvm_new_hostname}",
+                                "ro",
+                                detached("reboot"),
+                            ],
+                            logger,
+                        )
+                        ssh.close(discard=True)
+                    logger.info("Configured PiKVM")
+                except Exception as e:
+                    logger.error(f"An error occurred: {e}")
+                    raise Exception(f"An error occurred: {e}")
+
+                renamed.append(
+                    dict(
+                        kind="pikvm",
+                        hostname=power_controller["ip"],
+                        new_hostname=pikvm_new_hostname + ".amd.com",
+                    )
+                )
+                power_controller["ip"] = pikvm_new_hostname + ".amd.com"
+            elif "rpi" in power_controller.get("ip", ""):
+                logger.info("Configuring RaspberryPi...")
+
+                rpi_new_hostname = "rpi-" + new_short_hostname
+                rpi_username = power_controller["user"]
+                rpi_password = power_controller["pass"]
+
+                modified_note = notes.replace(power_controller["ip"], rpi_new_hostname + ".amd.com")
+                notes = modified_note
+
+                try:
+                    with Paramiko(
+                        hostname=power_controller["ip"],
+                        username=rpi_username,
+                        password=rpi_password,
+                    ) as ssh:
+                        run_remote_steps(
+                            ssh,
+                            [f"sudo hostnamectl set-hostname {rpi_new_hostname}", detached("sudo reboot")],
+                            logger,
+                        )
+                        ssh.close(discard=True)
+                    logger.info("Configured RaspberryPi")
+                except Exception as e:
+                    logger.error(f"An error occurred: {e}")
+                    raise Exception(f"An error occurred: {e}")
+                renamed.append(
+                    dict(
+                        kind="rpi",
+                        hostname=power_controller["ip"],
+                        new_hostname=rpi_new_hostname + ".amd.com",
+                    )
+                )
+                power_controller["ip"] = rpi_new_hostname + ".amd.com"
 
-            response = requests.patch(
-                url,
-                auth=(username, password),
-                headers=headers,
-                data=json.dumps(payload),
-                verify=False,
-            )
-            power_controller["ip"] = (
-                "bmc-" + NEW_HOSTNAME.split(".")[0] + ".amd.com"
-                if response.status_code == 202
-                else power_controller["ip"]
+        if bmcs:
+            logger.info("Configuring Asrock BMC...")
+            errors = bulk_set_hostname(
+                [
+                    dict(
+                        host=power_controller["ip"],
+                        username=power_controller["user"],
+                        password=power_controller["pass"],
+                        hostname=f"bmc-{new_short_hostname}",
+                    )
+                    for power_controller in bmcs
+                ]
             )
-        elif "pikvm" in power_controller.get("ip", ""):
-            logger.info("Configuring PiKVM...")
-
-            PIKVM_NEW_HOSTNAME = "pikvm-" + NEW_HOSTNAME.split(".")[0]
-            pikvm_username = power_controller["user"]
-            pikvm_password = power_controller["pass"]
-            
-            modified_note = notes.replace(power_controller["ip"], PIKVM_NEW_HOSTNAME + ".amd.com")
-            notes = modified_note
-            
+            for power_controller in bmcs:
+                # A BMC that couldn't be renamed keeps its current address in Conductor
+                if errors[power_controller["ip"]] is None:
+                    renamed.append(
+                        dict(
+                            kind="bmc",
+                            hostname=power_controller["ip"],
+                            new_hostname="bmc-" + new_short_hostname + ".amd.com",
+                        )
+                    )
+                    power_controller["ip"] = "bmc-" + new_short_hostname + ".amd.com"
+
+        return {"power_controllers": power_controllers, "notes": notes, "renamed_controllers": renamed}
+
+    def power_controllers_ready(renamed_controllers):
+        # No step waits on this one, a controller that doesn't come back is only reported
+        deadline = time.monotonic() + REBOOT_TIMEOUT
+        for controller in renamed_controllers:
+            hostname, new_hostname = controller["hostname"], controller["new_hostname"]
             try:
-                ssh = Paramiko(
-                    hostname=power_controller["ip"],
-                    username=pikvm_username,
-                    password=pikvm_password,
+                if controller["kind"] == "bmc":
+                    # BMCs aren't rebooted, only their new name has to reach DNS
+                    wait_for_redfish(new_hostname, max(0, deadline - time.monotonic()))
+                    logger.info(f"{new_hostname} is up")
+                    continue
+                # The reboot is delayed so the script can report back, until it happens the
+                # controller still answers SSH and would pass for being back up
+                wait_until(
+                    lambda: not probe_ssh_banner(hostname),
+                    max(0, deadline - time.monotonic()),
+                    f"{hostname} to go down",
+                    max_delay=1,
                 )
-                ssh.execute(f"rw")
-                ssh.execute(f"hostnamectl set-hostname {PIKVM_NEW_HOSTNAME}")
-                ssh.execute("ro")
-                ssh.execute("reboot")
-                ssh.close()
-                logger.info("Configured PiKVM")
-            except Exception as e:
-                logger.error(f"An error occurred: {e}")
-                raise Exception("An error occurred: {e}")
-
-            power_controller["ip"] = PIKVM_NEW_HOSTNAME + ".amd.com"
-        elif "rpi" in power_controller.get("ip", ""):
-            logger.info("Configuring RaspberryPi...")
-
-            RPI_NEW_HOSTNAME = "rpi-" + NEW_HOSTNAME.split(".")[0]
-            rpi_username = power_controller["user"]
-            rpi_password = power_controller["pass"]
-
-            modified_note = notes.replace(power_controller["ip"], RPI_NEW_HOSTNAME + ".amd.com")
-            notes = modified_note
+                wait_for_ssh(new_hostname, max(0, deadline - time.monotonic()))
+                logger.info(f"{new_hostname} is back up")
+            except TimeoutError as e:
+                logger.warning(str(e))
+        return {}
 
-            try:
-                ssh = Paramiko(
-                    hostname=power_controller["ip"],
-                    username=rpi_username,
-                    password=rpi_password,
-                )
-                ssh.execute(f"sudo hostnamectl set-hostname {RPI_NEW_HOSTNAME}")
-                ssh.execute("sudo reboot")
-                ssh.close()
-                logger.info("Configured RaspberryPi")
-            except Exception as e:
-                logger.error(f"An error occurred: {e}")
-                raise Exception("An error occurred: {e}")
-            power_controller["ip"] = RPI_NEW_HOSTNAME + ".amd.com"
-
-    logger.info("Updating on Conductor")
-    response = SYSTEM_DATA_DB_CONTROLLER.update(
-        dict(
-            id=system_id,
-            name=NEW_HOSTNAME.split(".")[0],
-            hostname_ip=NEW_HOSTNAME,
-            platform_config={"power_controllers": power_controllers, "notes": notes},
+    # ======================================================
+    # CONDUCTOR UPDATE
+    # Note: This section configures the hostname in Conductor
+    # ======================================================
+    def conductor_update(system, power_controllers, notes):
+        logger.info("Updating on Conductor")
+        SYSTEM_DATA_DB_CONTROLLER.update(
+            dict(
+                id=system.get("id", ""),
+                name=new_short_hostname,
+                hostname_ip=new_hostname,
+                platform_config={"power_controllers": power_controllers, "notes": notes},
+            )
         )
-    )
+        return {"conductor_updated": True}
 
     # ======================================================
     # MAAS UPDATE
     # Note: This section configures the hostname in MaaS
     # ======================================================
-    site = "ust" if "pngtechno" in CURRENT_HOSTNAME else "eq"
+    def maas_lookup():
+        logger.info("Searching for machine in MAAS")
+        site, machine = MACHINE_RESOLVER.resolve(current_hostname.split(".")[0])
 
-    logger.info(f"Detected MaaS site at {site.upper()}")
-    logger.info("Searching for machine in MAAS")
-    maas = MAAS(site)
-    machine = maas.get_machine(CURRENT_HOSTNAME.split(".")[0])
+        if machine is None:
+            logger.error("Machine not found")
+            raise RuntimeError("Machine not found in MAAS")
 
-    machine_id, power_type = machine["system_id"], machine["power_type"]
+        if not machine["system_id"] or not machine["power_type"]:
+            logger.error("Machine not found")
+            raise RuntimeError("Machine ID not found")
 
-    if not machine_id or not power_type:
-        logger.error("Machine not found")
-        raise RuntimeError("Machine ID not found")
+        logger.info(f"Machine found at MaaS site {site.upper()}")
+        return {"maas_site": site, "machine": machine}
 
-    logger.info("Machine found")
-    updated_machine = maas.update_machine(
-        machine_id, NEW_HOSTNAME.split(".")[0], power_type
-    )
+    def maas_update(maas_site, machine, system):
+        # system is unused, it only holds the rename back until Conductor has the SUT as well
+        maas = get_machine_index(maas_site)
+        if not maas.update_machine(machine["system_id"], new_short_hostname, machine["power_type"]):
+            logger.error("Failed to update machine in MAAS")
+            raise RuntimeError("Failed to update machine in MAAS")
+        MACHINE_RESOLVER.remember(new_short_hostname, maas_site)
 
-    logger.info("Updated machine in MAAS")
+        logger.info("Updated machine in MAAS")
+        return {"maas_updated": True}
 
     # ======================================================
     # JENKINS UNINSTALL
     # Note: This section uninstalls SUT Auth in Jenkins
     # ======================================================
-    if system_username == "orch":
-        logger.info("Detected SUT Auth, uninstalling...")
-        jenkins = Jenkins()
-        TIMEOUT = 300
-        uninstall_start_time = time.time()
+    TIMEOUT = 300
 
-        build_num = jenkins.uninstall_sut_auth(NEW_HOSTNAME)
+    def sut_auth_uninstall(system, maas_updated):
+        if system.get("username", "") == "orch":
+            logger.info("Detected SUT Auth, uninstalling...")
+            jenkins = Jenkins()
+            uninstall_start_time = time.time()
 
-        if not build_num:
-            logger.error("Failed to uninstall SUT Auth")
-            raise RuntimeError("Failed to uninstall SUT Auth")
+            build_num = jenkins.uninstall_sut_auth(new_hostname)
+
+            if not build_num:
+                logger.error("Failed to uninstall SUT Auth")
+                raise RuntimeError("Failed to uninstall SUT Auth")
 
-        while True:
-            if time.time() - uninstall_start_time > TIMEOUT:
+            try:
+                job_progress = jenkins.watch_build(
+                    "uninstall",
+                    build_num,
+                    timeout=TIMEOUT - (time.time() - uninstall_start_time),
+                    on_line=lambda line: logger.debug(f"[uninstall #{build_num}] {line}"),
+                )
+            except TimeoutError:
                 logger.error("Uninstall timed out")
                 raise TimeoutError("Uninstall timed out")
 
-            job_progress = jenkins.get_job_progress("uninstall", build_num)
-
-            if job_progress.get("result") == "SUCCESS":
-                logger.info("Uninstalled SUT Auth Successfully")
-                break
-            time.sleep(1)
-    else:
-        logger.info("Detected no SUTH Auth, skipping uninstall...")
-        time.sleep(10)
+            if job_progress.get("result") != "SUCCESS":
+                logger.error(f"Uninstall build {build_num} ended with {job_progress.get('result')}")
+                raise RuntimeError("Failed to uninstall SUT Auth")
+            logger.info("Uninstalled SUT Auth Successfully")
+        else:
+            logger.info("Detected no SUTH Auth, skipping uninstall...")
+        return {"sut_auth_removed": True}
 
     # ======================================================
     # PARAMIKO HOSTNAME CONFIG
     # Note: This section configures the hostname in SUT via SSH
     # ======================================================
-    logger.info("Configuring hostname...")
-
-    try:
-        ssh = Paramiko(hostname=NEW_HOSTNAME, username="amd", password="amd123")
-        logger.info("Connected to the host")
-        ssh.execute(f"sudo hostnamectl set-hostname {NEW_HOSTNAME}")
-        ssh.execute(
-            rf"sudo sed -i 's/^127\.0\.1\.1.*/127.0.1.1 {NEW_HOSTNAME} {NEW_HOSTNAME.split('.')[0]}/' /etc/hosts"
-        )
-        ssh.close()
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        raise Exception("An error occurred: {e}")
-    logger.info("Configured hostname in SUT")
+    def sut_hostname(sut_auth_removed):
+        logger.info("Configuring hostname...")
+
+        try:
+            # Wait for the MAAS rename to reach DNS rather than for a fixed time
+            wait_for_ssh(new_hostname, SUT_READY_TIMEOUT)
+            with Paramiko(hostname=new_hostname, username="amd", password="amd123") as ssh:
+                logger.info("Connected to the host")
+                run_remote_steps(
+                    ssh,
+                    [
+                        f"sudo hostnamectl set-hostname {new_hostname}",
+                        rf"sudo sed -i 's/^127\.0\.1\.1.*/127.0.1.1 {new_hostname} {new_short_hostname}/' /etc/hosts",
+                    ],
+                    logger,
+                )
+        except Exception as e:
+            logger.error(f"An error occurred: {e}")
+            raise Exception(f"An error occurred: {e}")
+        logger.info("Configured hostname in SUT")
+        return {"sut_renamed": True}
 
     # ======================================================
     # JENKINS INSTALL
     # Note: This section reinstalls SUT Auth in Jenkins
     # ======================================================
-    if system_username == "orch":
+    def sut_auth_install(system, sut_renamed, conductor_updated):
+        if system.get("username", "") != "orch":
+            return {}
+
         logger.info("Installing SUT Auth...")
+        jenkins = Jenkins()
         install_start_time = time.time()
 
-        build_num = jenkins.install_sut_auth(NEW_HOSTNAME)
+        build_num = jenkins.install_sut_auth(new_hostname)
 
         if not build_num:
             logger.error("Failed to install SUT Auth, build number not found")
             raise RuntimeError("Failed to install SUT Auth")
 
-        while True:
-            if time.time() - install_start_time > TIMEOUT:
-                logger.error("Install timed out")
-                raise TimeoutError("Install timed out")
-
-            job_progress = jenkins.get_job_progress("install", build_num)
+        try:
+            job_progress = jenkins.watch_build(
+                "install",
+                build_num,
+                timeout=TIMEOUT - (time.time() - install_start_time),
+                on_line=lambda line: logger.debug(f"[install #{build_num}] {line}"),
+            )
+        except TimeoutError:
+            logger.error("Install timed out")
+            raise TimeoutError("Install timed out")
 
-            if job_progress.get("result") == "SUCCESS":
-                logger.info("Installed SUT Auth Successfully")
-                break
+        if job_progress.get("result") != "SUCCESS":
+            logger.error(f"Install build {build_num} ended with {job_progress.get('result')}")
+            raise RuntimeError("Failed to install SUT Auth")
+        logger.info("Installed SUT Auth Successfully")
+        return {}
+
+    return Pipeline(
+        [
+            Step("conductor_lookup", conductor_lookup, outputs=("system",)),
+            Step(
+                "power_controllers",
+                power_controllers_update,
+                inputs=("system", "machine"),
+                outputs=("power_controllers", "notes", "renamed_controllers"),
+            ),
+            Step("power_controllers_ready", power_controllers_ready, inputs=("renamed_controllers",)),
+            Step(
+                "conductor_update",
+                conductor_update,
+                inputs=("system", "power_controllers", "notes"),
+                outputs=("conductor_updated",),
+            ),
+            Step("maas_lookup", maas_lookup, outputs=("maas_site", "machine")),
+            Step(
+                "maas_update",
+                maas_update,
+                inputs=("maas_site", "machine", "system"),
+                outputs=("maas_updated",),
+            ),
+            Step(
+                "sut_auth_uninstall",
+                sut_auth_uninstall,
+                inputs=("system", "maas_updated"),
+                outputs=("sut_auth_removed",),
+            ),
+            Step(
+                "sut_hostname",
+                sut_hostname,
+                inputs=("sut_auth_removed",),
+                outputs=("sut_renamed",),
+            ),
+            Step(
+                "sut_auth_install",
+                sut_auth_install,
+                inputs=("system", "sut_renamed", "conductor_updated"),
+            ),
+        ]
+    )
 
-            time.sleep(1)
 
-    logger.info(
-        "All operations completed successfully, please update the power distribution accordingly!"
-    )
+if __name__ == "__main__":
+    if DRY_RUN:
+        print(plan_rename(CURRENT_HOSTNAME, NEW_HOSTNAME).describe())
+    else:
+        rename_sut(CURRENT_HOSTNAME, NEW_HOSTNAME)
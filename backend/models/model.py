@@ -1,72 +1,145 @@
 from typing import Any, Dict, Optional
 
+_NOT_SET = object()
 
-class Model:
-    def __init__(self, model_attrs: Dict[str, Any] = None, from_db: bool = False):
-        self.id: Optional[str] = None
-        self.date_create: Optional[str] = None
-        self.model_attrs = model_attrs or {}
-        self.snapshot = {}
+
+class ModelMeta(type):
+    """Compiles the annotated class attributes of every Model subclass into a field table.
+
+    Fields become __slots__ (so instances carry no __dict__) and from_dict/to_dict
+    loop over the precomputed table instead of inspecting the instance on every call.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        annotations = namespace.get("__annotations__", {})
+        own_fields = [
+            key for key in annotations if key in namespace and not key.startswith("_")
+        ]
+        own_defaults = {key: namespace.pop(key) for key in own_fields}
+        namespace["__slots__"] = tuple(namespace.get("__slots__", ())) + tuple(
+            own_fields
+        )
+        cls = super().__new__(mcs, name, bases, namespace)
+
+        defaults = dict(getattr(cls, "_defaults", {}))
+        defaults.update(own_defaults)
+        nested = cls.model_attrs
+        plain_fields = tuple(key for key in defaults if key not in nested)
+
+        cls._defaults = defaults
+        cls._plain_fields = plain_fields
+        # (name, default, factory for mutable defaults so instances never share them)
+        cls._init_table = tuple(
+            (
+                key,
+                value,
+                value.copy if isinstance(value, (dict, list, set)) else None,
+            )
+            for key, value in defaults.items()
+        )
+        # (name, index into the snapshot, nested Model class or None)
+        cls._field_table = tuple(
+            (
+                key,
+                plain_fields.index(key) if key not in nested else -1,
+                nested.get(key),
+            )
+            for key in defaults
+        )
+        return cls
+
+
+class Model(metaclass=ModelMeta):
+    """Base class for Conductor records.
+
+    Subclasses declare their fields as annotated class attributes whose values are
+    the defaults, and nested records in `model_attrs` as {field: Model subclass}.
+    """
+
+    __slots__ = ("from_db", "_snapshot")
+    model_attrs = {}
+
+    id: Optional[str] = None
+    date_create: Optional[str] = None
+
+    def __init__(self, from_db: bool = False, **kwargs):
+        for key, value, factory in self._init_table:
+            setattr(self, key, factory() if factory is not None else value)
         self.from_db = from_db
+        self._snapshot = None
+        if kwargs:
+            self.from_dict(kwargs)
+
+    @property
+    def snapshot(self) -> Dict[str, Any]:
+        if self._snapshot is None:
+            return {}
+        return {
+            key: value
+            for key, value in zip(self._plain_fields, self._snapshot)
+            if value is not _NOT_SET
+        }
 
     def to_dict(self, include_nested=False, only_modified=False):
         if only_modified is True and self.from_db is False:
             # we probably created this object ourselves, consider all fields modified
             only_modified = False
         model_dict = {}
-        for key in self.__dict__.keys():
-            value = getattr(self, key)
-            if key in self.model_attrs:
-                if only_modified is True:
-                    # do not check modification status of nested objects
-                    continue
-                if include_nested is True:
-                    if isinstance(value, list):
-                        if len(value) == 0 or not isinstance(value[0], Model):
-                            continue
-                        model_dict[key] = [
-                            x.to_dict(include_nested=include_nested) for x in value
-                        ]
-                    else:
-                        if not isinstance(value, Model):
-                            continue
-                        model_dict[key] = value.to_dict(include_nested=include_nested)
-            elif key == "model_attrs" or key == "snapshot" or key == "from_db":
-                if include_nested is False:
-                    continue
-            else:
-                if only_modified is True:
-                    if value != self.snapshot.get(key, None):
-                        model_dict[key] = value
-                else:
+        if only_modified is True:
+            # do not check modification status of nested objects
+            snapshot = self._snapshot or [_NOT_SET] * len(self._plain_fields)
+            for key, previous in zip(self._plain_fields, snapshot):
+                value = getattr(self, key)
+                if value != (None if previous is _NOT_SET else previous):
+                    model_dict[key] = value
+        elif include_nested is True:
+            for key, _, nested in self._field_table:
+                value = getattr(self, key)
+                if nested is None:
                     model_dict[key] = value
+                elif isinstance(value, list):
+                    if len(value) == 0 or not isinstance(value[0], Model):
+                        continue
+                    model_dict[key] = [
+                        x.to_dict(include_nested=include_nested) for x in value
+                    ]
+                elif isinstance(value, Model):
+                    model_dict[key] = value.to_dict(include_nested=include_nested)
+        else:
+            for key in self._plain_fields:
+                model_dict[key] = getattr(self, key)
         return model_dict
 
     def from_dict(self, data, snapshot: bool = True):
         if not data:
             return None
-        for key in self.__dict__.keys():
+        if snapshot is True:
+            if self._snapshot is None:
+                self._snapshot = [_NOT_SET] * len(self._plain_fields)
+            snapshot_values = self._snapshot
+        else:
+            snapshot_values = None
+        for key, index, nested in self._field_table:
             if key not in data:
                 continue
-            # should be turned into an object
-            if key in self.model_attrs:
-                # list of objects
-                if isinstance(data[key], list):
-                    objects = []
-                    for obj in data[key]:
-                        model_attr = self.model_attrs[key](from_db=self.from_db)
-                        model_attr.from_dict(obj, snapshot=snapshot)
-                        objects.append(model_attr)
-                    setattr(self, key, objects)
-                # single object
-                elif data.get(key):
-                    model_attr = self.model_attrs[key](from_db=self.from_db)
-                    model_attr.from_dict(data[key], snapshot=snapshot)
-                    setattr(self, key, model_attr)
-                else:
-                    setattr(self, key, None)
+            value = data[key]
             # normal attribute, as it would be uploaded to DB
+            if nested is None:
+                setattr(self, key, value)
+                if snapshot_values is not None:
+                    snapshot_values[index] = value
+            # list of objects
+            elif isinstance(value, list):
+                objects = []
+                for obj in value:
+                    model_attr = nested(from_db=self.from_db)
+                    model_attr.from_dict(obj, snapshot=snapshot)
+                    objects.append(model_attr)
+                setattr(self, key, objects)
+            # single object
+            elif value:
+                model_attr = nested(from_db=self.from_db)
+                model_attr.from_dict(value, snapshot=snapshot)
+                setattr(self, key, model_attr)
             else:
-                setattr(self, key, data[key])
-                if snapshot is True:
-                    self.snapshot[key] = data[key]
+                setattr(self, key, None)
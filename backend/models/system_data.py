@@ -4,16 +4,13 @@ from models.model import Model
 from models.platform import Platform
 
 class SystemData(Model):
-    def __init__(self, **kwargs):
-        super().__init__(
-            model_attrs=dict(
-                platforms=Platform,
-            )
-        )
-        self.username: Optional[str] = None
-        self.scraped_data: Optional[Dict] = {}
-        self.platform_config: Optional[Dict] = {}
-        self.name: Optional[str] = None
-        self.hostname_ip: Optional[str] = None
-        self.platforms: Optional[Platform] = None
-        self.from_dict(kwargs)
+    model_attrs = dict(
+        platforms=Platform,
+    )
+
+    username: Optional[str] = None
+    scraped_data: Optional[Dict] = {}
+    platform_config: Optional[Dict] = {}
+    name: Optional[str] = None
+    hostname_ip: Optional[str] = None
+    platforms: Optional[Platform] = None
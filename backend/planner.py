@@ -0,0 +1,205 @@
+import time
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Optional
+
+from utils.logger import logger
+from utils.maas import MACHINE_RESOLVER
+from utils.jenkins import Jenkins
+from utils.paramiko import Paramiko
+from database import SYSTEM_DATA_DB_CONTROLLER
+
+# Seconds the planner waits on its sources, read all at once, before treating the slow ones as unknown
+PLAN_TIMEOUT = 15
+
+# Steps of the rename pipeline, in the order they normally finish
+STEPS = (
+    "conductor_lookup",
+    "maas_lookup",
+    "power_controllers",
+    "conductor_update",
+    "power_controllers_ready",
+    "maas_update",
+    "sut_auth_uninstall",
+    "sut_hostname",
+    "sut_auth_install",
+)
+
+
+@dataclass
+class RenameState:
+    # The Conductor system, and whether it is already stored under the new hostname
+    system: Optional[dict] = None
+    conductor_renamed: bool = False
+    # The MAAS site and machine, and whether it already carries the new hostname
+    maas_site: Optional[str] = None
+    machine: Optional[dict] = None
+    maas_renamed: bool = False
+    # What the SUT reports as its hostname, None when it couldn't be reached
+    sut_hostname: Optional[str] = None
+    # The latest successful SUT Auth build for the new hostname, {type, number, timestamp}
+    sut_auth: Optional[dict] = None
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class RenamePlan:
+    current_hostname: str
+    new_hostname: str
+    state: RenameState
+    # Outputs of the steps that are already applied, in the form Pipeline.run takes for `completed`
+    completed: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    reasons: Dict[str, str] = field(default_factory=dict)
+
+    def describe(self) -> str:
+        lines = [f"{self.current_hostname} -> {self.new_hostname}"]
+        for step in STEPS:
+            action = "SKIP" if step in self.completed else "RUN"
+            lines.append(f"  {action:<5} {step:<24} {self.reasons.get(step, '')}")
+        for source, error in self.state.errors.items():
+            lines.append(f"  ! could not read {source}: {error}")
+        return "\n".join(lines)
+
+
+def _read_conductor(current_hostname, new_hostname):
+    for hostname, renamed in ((current_hostname, False), (new_hostname, True)):
+        # Straight to the endpoint, query() would turn a failed request into "not found"
+        system_data = SYSTEM_DATA_DB_CONTROLLER.endpoint.get(hostname_ip=hostname)
+        if system_data:
+            return system_data[0], renamed
+    return None, False
+
+
+def _read_maas(current_hostname, new_hostname):
+    for hostname, renamed in ((current_hostname, False), (new_hostname, True)):
+        site, machine = MACHINE_RESOLVER.resolve(hostname.split(".")[0])
+        if machine is not None:
+            return site, machine, renamed
+    return None, None, False
+
+
+def _read_sut_hostname(current_hostname, new_hostname):
+    # Before the MAAS rename only the current name resolves
+    for hostname in (new_hostname, current_hostname):
+        try:
+            ssh = Paramiko(hostname=hostname, username="amd", password="amd123", timeout=PLAN_TIMEOUT)
+        except Exception:
+            continue
+        with ssh:
+            return ssh.run("hostname -f", timeout=PLAN_TIMEOUT).stdout.strip()
+    raise RuntimeError("SUT not reachable over SSH as amd")
+
+
+def read_state(current_hostname: str, new_hostname: str) -> RenameState:
+    """
+    Read where Conductor, MAAS, the SUT and SUT Auth stand, all at once
+    A source that can't be read is left unknown and recorded in `errors`
+    """
+    state = RenameState()
+    executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        futures = dict(
+            conductor=executor.submit(_read_conductor, current_hostname, new_hostname),
+            maas=executor.submit(_read_maas, current_hostname, new_hostname),
+            sut=executor.submit(_read_sut_hostname, current_hostname, new_hostname),
+            sut_auth=executor.submit(Jenkins().get_last_sut_auth, new_hostname),
+        )
+        deadline = time.monotonic() + PLAN_TIMEOUT
+        for source, future in futures.items():
+            try:
+                result = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                state.errors[source] = f"no answer within {PLAN_TIMEOUT}s"
+                continue
+            except Exception as e:
+                state.errors[source] = str(e) or e.__class__.__name__
+                continue
+            if source == "conductor":
+                state.system, state.conductor_renamed = result
+            elif source == "maas":
+                state.maas_site, state.machine, state.maas_renamed = result
+            elif source == "sut":
+                state.sut_hostname = result
+            else:
+                state.sut_auth = result
+    finally:
+        # A source that hangs is left behind rather than holding up the rename
+        executor.shutdown(wait=False, cancel_futures=True)
+    return state
+
+
+def plan_rename(current_hostname: str, new_hostname: str) -> RenamePlan:
+    """
+    Work out which rename steps are already applied, so only the ones whose target state differs are run
+    """
+    state = read_state(current_hostname, new_hostname)
+    plan = RenamePlan(current_hostname, new_hostname, state)
+    completed, reasons = plan.completed, plan.reasons
+
+    if state.system is not None:
+        completed["conductor_lookup"] = {"system": state.system}
+        reasons["conductor_lookup"] = "found in Conductor"
+        if state.conductor_renamed:
+            # Conductor is only updated once the power controllers are done
+            platform_config = state.system.get("platform_config", {})
+            completed["power_controllers"] = {
+                "power_controllers": platform_config.get("power_controllers", []),
+                "notes": platform_config.get("notes", ""),
+                "renamed_controllers": [],
+            }
+            completed["power_controllers_ready"] = {}
+            completed["conductor_update"] = {"conductor_updated": True}
+            for step in ("power_controllers", "power_controllers_ready", "conductor_update"):
+                reasons[step] = "Conductor already has the new hostname"
+        else:
+            reasons["conductor_update"] = "Conductor has the current hostname"
+    else:
+        reasons["conductor_lookup"] = "not found in Conductor under either hostname"
+
+    if state.machine is not None:
+        completed["maas_lookup"] = {"maas_site": state.maas_site, "machine": state.machine}
+        reasons["maas_lookup"] = f"found at MAAS site {state.maas_site}"
+        if state.maas_renamed:
+            completed["maas_update"] = {"maas_updated": True}
+            reasons["maas_update"] = "MAAS already has the new hostname"
+        else:
+            reasons["maas_update"] = "MAAS has the current hostname"
+    else:
+        reasons["maas_lookup"] = "not found in MAAS under either hostname"
+
+    uses_sut_auth = state.system is not None and state.system.get("username", "") == "orch"
+    sut_renamed = state.sut_hostname == new_hostname
+    last_auth = (state.sut_auth or {}).get("type")
+
+    if sut_renamed:
+        completed["sut_hostname"] = {"sut_renamed": True}
+        reasons["sut_hostname"] = "SUT already reports the new hostname"
+    elif state.sut_hostname is not None:
+        reasons["sut_hostname"] = f"SUT reports {state.sut_hostname}"
+    else:
+        reasons["sut_hostname"] = "SUT hostname unknown"
+
+    if uses_sut_auth and last_auth == "install" and sut_renamed:
+        completed["sut_auth_uninstall"] = {"sut_auth_removed": True}
+        completed["sut_auth_install"] = {}
+        reasons["sut_auth_uninstall"] = reasons["sut_auth_install"] = (
+            f"SUT Auth already installed for the new hostname (build #{state.sut_auth['number']})"
+        )
+    elif uses_sut_auth and last_auth == "uninstall":
+        completed["sut_auth_uninstall"] = {"sut_auth_removed": True}
+        reasons["sut_auth_uninstall"] = f"SUT Auth already uninstalled (build #{state.sut_auth['number']})"
+        reasons["sut_auth_install"] = "SUT Auth not installed for the new hostname"
+    elif uses_sut_auth:
+        # Without an uninstall build to show for it the uninstall runs again, even once the SUT is renamed
+        if "sut_auth" in state.errors:
+            reason = "SUT Auth history unknown"
+        elif last_auth == "install":
+            reason = f"SUT not renamed since install build #{state.sut_auth['number']}"
+        else:
+            reason = "no SUT Auth build for the new hostname"
+        reasons["sut_auth_uninstall"] = reasons["sut_auth_install"] = reason
+    else:
+        reasons["sut_auth_uninstall"] = reasons["sut_auth_install"] = "SUT doesn't use SUT Auth"
+
+    logger.debug(plan.describe())
+    return plan
@@ -1,7 +1,132 @@
-from flask import Blueprint, request
+import re
+import json
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from utils.events import EVENT_BUS, EventLogHandler
+from utils.jobs import FAILED, SUCCEEDED, JobConflict, JobManager
+from utils.logger import logger
 
 sut = Blueprint("sut", __name__)
 
-@sut.route("rename", methods=["GET"])
+
+def _rename_sut(**kwargs):
+    # manual_run pulls in the Conductor client, which imports this package for Route
+    from manual_run import rename_sut
+
+    return rename_sut(**kwargs)
+
+
+def _rename_keys(params):
+    # Neither hostname may be in two renames at once, they'd run the same steps on one SUT
+    return {params["current_hostname"].lower(), params["new_hostname"].lower()}
+
+
+RENAME_JOBS = JobManager(_rename_sut, events=EVENT_BUS, keys=_rename_keys)
+logger.addHandler(EventLogHandler(EVENT_BUS))
+
+# Seconds between keep-alive comments on an idle event stream
+SSE_HEARTBEAT = 15
+
+
+def _parse_rename(item):
+    from manual_run import HOSTNAME_PATTERN
+
+    if not isinstance(item, dict):
+        raise ValueError("Expected an object with current_hostname and new_hostname")
+    current_hostname = item.get("current_hostname")
+    new_hostname = item.get("new_hostname")
+    for hostname in (current_hostname, new_hostname):
+        if not isinstance(hostname, str) or not re.match(HOSTNAME_PATTERN, hostname):
+            raise ValueError(f"Invalid hostname format: {hostname}")
+    return dict(current_hostname=current_hostname, new_hostname=new_hostname)
+
+
+@sut.route("rename", methods=["POST"])
 def rename():
-    return True
+    """
+    Queue one rename, or a list of them, and return the jobs right away
+    Nothing is queued if a hostname is already being renamed, or appears twice in the list
+    """
+    body = request.get_json(silent=True)
+    items = body if isinstance(body, list) else [body]
+    try:
+        renames = [_parse_rename(item) for item in items]
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    try:
+        jobs = [job.to_dict() for job in RENAME_JOBS.submit_many(renames)]
+    except JobConflict as e:
+        return jsonify(error=str(e), job=e.job.id if e.job is not None else None), 409
+    return jsonify(jobs if isinstance(body, list) else jobs[0]), 202
+
+
+@sut.route("rename", methods=["GET"])
+def list_renames():
+    return jsonify([job.to_dict() for job in RENAME_JOBS.list()])
+
+
+@sut.route("rename/<job_id>", methods=["GET"])
+def get_rename(job_id):
+    job = RENAME_JOBS.get(job_id)
+    if job is None:
+        return jsonify(error="Job not found"), 404
+    return jsonify(job.to_dict())
+
+
+def _format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def _stream_events(job_ids):
+    # Subscribe before taking the snapshot so nothing falls in between
+    subscription = EVENT_BUS.subscribe(job_ids or None)
+    jobs = [RENAME_JOBS.get(job_id) for job_id in job_ids] if job_ids else RENAME_JOBS.list()
+    if any(job is None for job in jobs):
+        subscription.close()
+        return jsonify(error="Job not found"), 404
+    # A stream for given jobs ends once all of them finished, an unfiltered one runs until the client leaves
+    remaining = {job.id for job in jobs if not job.done} if job_ids else None
+
+    def generate():
+        with subscription:
+            for job in jobs:
+                yield _format_event(dict(type="snapshot", job=job.id, data=job.to_dict()))
+            while remaining is None or remaining:
+                event = subscription.get(timeout=SSE_HEARTBEAT)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield _format_event(event)
+                    for received in (event, event.get("next") or {}):
+                        if received.get("type") == "job" and received.get("state") in (SUCCEEDED, FAILED):
+                            if remaining is not None:
+                                remaining.discard(received["job"])
+                if remaining and (event is None or event["type"] == "dropped"):
+                    # A job's terminal event may have been among the dropped ones, check on it directly
+                    for job_id in list(remaining):
+                        job = RENAME_JOBS.get(job_id)
+                        if job is None or job.done:
+                            remaining.discard(job_id)
+                            if job is not None:
+                                yield _format_event(dict(type="snapshot", job=job.id, data=job.to_dict()))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@sut.route("rename/events", methods=["GET"])
+def rename_events():
+    """
+    Server-sent events of job and step transitions, Jenkins console lines and SSH output
+    Filter with repeated `job` query parameters, otherwise every job is followed
+    """
+    return _stream_events(request.args.getlist("job"))
+
+
+@sut.route("rename/<job_id>/events", methods=["GET"])
+def rename_job_events(job_id):
+    return _stream_events([job_id])
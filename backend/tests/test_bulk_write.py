@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+import requests
+
+from backend import AuthorizationError, RequestError
+from database.async_database import AsyncDatabaseController
+from database.database import DatabaseController
+
+
+class FakeEndpoint:
+    """Rejects any chunk holding a record marked bad, like Conductor rejects a whole request"""
+
+    def __init__(self, error=RequestError):
+        self.error = error
+        self.chunks = []
+
+    def _write(self, data):
+        self.chunks.append([record.get("name") for record in data])
+        if any(record.get("bad") for record in data):
+            raise self.error("rejected")
+        return [dict(record, written=True) for record in data]
+
+    def put(self, data=None, **kwargs):
+        return self._write(data)
+
+    def post(self, data=None, **kwargs):
+        return self._write(data)
+
+
+class AsyncFakeEndpoint(FakeEndpoint):
+    async def put(self, data=None, **kwargs):
+        await asyncio.sleep(0)
+        return self._write(data)
+
+    async def post(self, data=None, **kwargs):
+        await asyncio.sleep(0)
+        return self._write(data)
+
+
+def records(count, bad=()):
+    return [dict(id=str(index), name=f"sut{index}", bad=index in bad) for index in range(count)]
+
+
+def test_chunks_are_bounded_by_count_and_size():
+    chunks = DatabaseController._chunk([{"name": "x" * 10}] * 7, chunk_size=3, chunk_bytes=10_000)
+    assert chunks == [[0, 1, 2], [3, 4, 5], [6]]
+
+    # A record over the byte budget still goes out, on its own
+    chunks = DatabaseController._chunk([{"name": "x" * 100}, {"name": "y"}], chunk_size=10, chunk_bytes=50)
+    assert chunks == [[0], [1]]
+
+
+def test_bulk_update_bisects_a_rejected_chunk_down_to_the_bad_record():
+    endpoint = FakeEndpoint()
+    controller = DatabaseController(model=None, endpoint=endpoint)
+
+    results = controller.bulk_update(records(8, bad={5}), chunk_size=4, max_concurrency=1)
+
+    assert [result["success"] for result in results] == [True] * 5 + [False] + [True] * 2
+    assert results[5]["error"] == "rejected"
+    assert results[0]["response"] == dict(records(1)[0], written=True)
+    # The first chunk went through whole, the second was split until sut5 was alone
+    assert endpoint.chunks[0] == ["sut0", "sut1", "sut2", "sut3"]
+    assert ["sut5"] in endpoint.chunks
+    assert ["sut4"] in endpoint.chunks
+
+
+def test_bulk_update_bisects_timeouts_but_bulk_insert_does_not():
+    endpoint = FakeEndpoint(error=requests.exceptions.Timeout)
+    results = DatabaseController(model=None, endpoint=endpoint).bulk_update(records(4, bad={0}))
+    assert [result["success"] for result in results] == [False, True, True, True]
+
+    # An insert that timed out may have gone through, resending it could duplicate records
+    endpoint = FakeEndpoint(error=requests.exceptions.Timeout)
+    results = DatabaseController(model=None, endpoint=endpoint).bulk_insert(records(4, bad={0}))
+    assert [result["success"] for result in results] == [False] * 4
+    assert len(endpoint.chunks) == 1
+
+
+def test_authorization_errors_abort_the_batch():
+    endpoint = FakeEndpoint(error=AuthorizationError)
+    with pytest.raises(AuthorizationError):
+        DatabaseController(model=None, endpoint=endpoint).bulk_update(records(2, bad={1}))
+
+
+def test_async_bulk_update_sends_and_bisects():
+    endpoint = AsyncFakeEndpoint()
+    controller = AsyncDatabaseController(model=None, endpoint=endpoint)
+
+    results = asyncio.run(controller.bulk_update(records(8, bad={2}), chunk_size=4))
+
+    assert [result["success"] for result in results] == [True, True, False] + [True] * 5
+    assert sum(len(chunk) for chunk in endpoint.chunks if "sut2" not in chunk) == 7
+
+
+def test_async_bulk_insert_sends_every_chunk():
+    endpoint = AsyncFakeEndpoint()
+    controller = AsyncDatabaseController(model=None, endpoint=endpoint)
+
+    results = asyncio.run(controller.bulk_insert(records(5), chunk_size=2, max_concurrency=2))
+
+    assert all(result["success"] for result in results)
+    assert sorted(name for chunk in endpoint.chunks for name in chunk) == [f"sut{i}" for i in range(5)]
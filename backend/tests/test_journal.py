@@ -0,0 +1,90 @@
+import pytest
+
+import manual_run
+from manual_run import _restore_credentials, _strip_credentials
+from utils.journal import RenameJournal
+
+RENAME = RenameJournal.rename_id("sut-a.example", "sut-b.example")
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = RenameJournal(str(tmp_path / "journal.db"))
+    journal.start(RENAME, "sut-a.example", "sut-b.example")
+    return journal
+
+
+def test_a_failed_rename_resumes_its_succeeded_steps(journal):
+    journal.record_step(RENAME, "conductor_lookup", "succeeded", {"system": {"id": 1}})
+    journal.record_step(RENAME, "maas_update", "failed", error="MAAS down")
+    journal.finish(RENAME, "failed", "MAAS down")
+
+    assert journal.completed_steps(RENAME) == {"conductor_lookup": {"system": {"id": 1}}}
+    assert journal.get(RENAME)["error"] == "MAAS down"
+
+
+def test_a_running_rename_resumes(journal):
+    # What a crash leaves behind
+    journal.record_step(RENAME, "conductor_lookup", "succeeded", {"system": {"id": 1}})
+    assert journal.get(RENAME)["state"] == "running"
+    assert journal.completed_steps(RENAME) == {"conductor_lookup": {"system": {"id": 1}}}
+
+
+def test_a_succeeded_rename_starts_over(journal):
+    journal.record_step(RENAME, "conductor_lookup", "succeeded", {"system": {"id": 1}})
+    journal.finish(RENAME, "succeeded")
+    assert journal.completed_steps(RENAME) == {}
+
+    journal.start(RENAME, "sut-a.example", "sut-b.example")
+    assert journal.get(RENAME)["state"] == "running"
+    assert journal.completed_steps(RENAME) == {}
+
+
+def test_restarting_a_failed_rename_keeps_its_steps(journal):
+    journal.record_step(RENAME, "conductor_lookup", "succeeded", {"system": {"id": 1}})
+    journal.finish(RENAME, "failed", "MAAS down")
+
+    journal.start(RENAME, "sut-a.example", "sut-b.example")
+    assert journal.get(RENAME)["error"] is None
+    assert journal.completed_steps(RENAME) == {"conductor_lookup": {"system": {"id": 1}}}
+
+
+def test_discard_forgets_the_rename(journal):
+    journal.record_step(RENAME, "conductor_lookup", "succeeded", {"system": {"id": 1}})
+    journal.discard(RENAME)
+    assert journal.get(RENAME) is None
+    assert journal.completed_steps(RENAME) == {}
+
+
+class FakeSystemData:
+    def __init__(self, systems):
+        self.systems = systems
+
+    def query(self, hostname_ip):
+        return [self.systems[hostname_ip]] if hostname_ip in self.systems else []
+
+
+def _controller(**credentials):
+    return {"ip": "10.0.0.1", "type": "bmc", **credentials}
+
+
+def test_credentials_stay_out_of_the_journal_and_come_back_from_conductor(monkeypatch):
+    system = {"platform_config": {"power_controllers": [_controller(user="root", **{"pass": "secret"})]}}
+    outputs = {"system": system, "power_controllers": [_controller(user="root", **{"pass": "secret"})]}
+
+    journaled = {"power_controllers": _strip_credentials(outputs)}
+    assert journaled["power_controllers"]["power_controllers"] == [_controller()]
+    assert journaled["power_controllers"]["system"]["platform_config"]["power_controllers"] == [_controller()]
+    # The live outputs keep theirs
+    assert outputs["power_controllers"][0]["pass"] == "secret"
+
+    # Conductor already carries the new hostname
+    monkeypatch.setattr(manual_run, "SYSTEM_DATA_DB_CONTROLLER", FakeSystemData({"sut-b.example": system}))
+    _restore_credentials(journaled, "sut-a.example", "sut-b.example")
+    assert journaled["power_controllers"] == outputs
+
+
+def test_restoring_credentials_needs_the_system(monkeypatch):
+    monkeypatch.setattr(manual_run, "SYSTEM_DATA_DB_CONTROLLER", FakeSystemData({}))
+    with pytest.raises(RuntimeError):
+        _restore_credentials({"power_controllers": {"power_controllers": [_controller()]}}, "a", "b")
@@ -0,0 +1,145 @@
+import logging
+import threading
+
+import pytest
+
+from manual_run import build_rename_pipeline
+from utils.pipeline import (
+    FAILED,
+    RESUMED,
+    SKIPPED,
+    SUCCEEDED,
+    Pipeline,
+    PipelineError,
+    Step,
+)
+
+
+def test_steps_run_once_their_inputs_are_ready():
+    order = []
+
+    def step(name, **outputs):
+        def func(**inputs):
+            order.append(name)
+            return outputs
+
+        return func
+
+    result = Pipeline(
+        [
+            Step("c", step("c"), inputs=("a", "b")),
+            Step("b", step("b", b=2), inputs=("a",), outputs=("b",)),
+            Step("a", step("a", a=1), outputs=("a",)),
+        ]
+    ).run()
+
+    assert order == ["a", "b", "c"]
+    assert result.success
+    assert result.context == {"a": 1, "b": 2}
+
+
+def test_independent_steps_run_concurrently():
+    # Only passes if both steps are inside wait() at the same time
+    barrier = threading.Barrier(2, timeout=5)
+
+    result = Pipeline(
+        [
+            Step("a", lambda: barrier.wait() and {}),
+            Step("b", lambda: barrier.wait() and {}),
+        ]
+    ).run()
+
+    assert result.success
+
+
+def test_a_failed_step_skips_its_dependents():
+    def fail():
+        raise RuntimeError("boom")
+
+    pipeline = Pipeline(
+        [
+            Step("lookup", fail, outputs=("system",)),
+            Step("update", lambda system: {}, inputs=("system",)),
+            Step("other", lambda: {"other": True}, outputs=("other",)),
+        ]
+    )
+    with pytest.raises(PipelineError) as error:
+        pipeline.run()
+
+    runs = error.value.result.runs
+    assert error.value.step == "lookup"
+    assert runs["lookup"].state == FAILED and runs["lookup"].error == "boom"
+    assert runs["update"].state == SKIPPED
+    assert runs["other"].state == SUCCEEDED
+
+
+def test_completed_steps_are_resumed_not_run():
+    calls = []
+    pipeline = Pipeline(
+        [
+            Step("lookup", lambda: calls.append("lookup") or {"system": "fresh"}, outputs=("system",)),
+            Step("update", lambda system: calls.append(system) or {}, inputs=("system",)),
+        ]
+    )
+
+    result = pipeline.run(completed={"lookup": {"system": "journaled"}})
+
+    assert calls == ["journaled"]
+    assert result.runs["lookup"].state == RESUMED
+    assert result.success
+
+
+def test_completed_steps_missing_an_output_run_again():
+    pipeline = Pipeline([Step("lookup", lambda: {"system": "fresh", "extra": 1}, outputs=("system", "extra"))])
+    result = pipeline.run(completed={"lookup": {"system": "journaled"}})
+    assert result.runs["lookup"].state == SUCCEEDED
+    assert result.context["system"] == "fresh"
+
+
+def test_outputs_are_reported_and_a_failing_callback_fails_the_step():
+    seen = {}
+
+    def on_outputs(run, outputs):
+        seen[run.name] = outputs
+        if run.name == "b":
+            raise RuntimeError("journal unavailable")
+
+    pipeline = Pipeline(
+        [
+            Step("a", lambda: {"a": 1, "ignored": 2}, outputs=("a",)),
+            Step("b", lambda a: {"b": a}, inputs=("a",), outputs=("b",)),
+        ]
+    )
+    with pytest.raises(PipelineError):
+        pipeline.run(on_outputs=on_outputs)
+    assert seen == {"a": {"a": 1}, "b": {"b": 1}}
+
+
+def test_invalid_pipelines_are_refused():
+    with pytest.raises(ValueError, match="produced by both"):
+        Pipeline([Step("a", dict, outputs=("x",)), Step("b", dict, outputs=("x",))])
+    with pytest.raises(ValueError, match="cycle"):
+        Pipeline(
+            [
+                Step("a", dict, inputs=("y",), outputs=("x",)),
+                Step("b", dict, inputs=("x",), outputs=("y",)),
+            ]
+        )
+    with pytest.raises(ValueError, match="No step produces"):
+        Pipeline([Step("a", dict, inputs=("x",))]).run()
+
+
+def _upstream(pipeline, name):
+    steps = set()
+    for input in pipeline.steps[name].inputs:
+        producer = pipeline.producers[input]
+        steps |= {producer} | _upstream(pipeline, producer)
+    return steps
+
+
+def test_rename_changes_nothing_before_both_lookups_succeed():
+    pipeline = build_rename_pipeline("sut.example", "sut-new.example", logging.getLogger(__name__))
+    lookups = {"conductor_lookup", "maas_lookup"}
+    for name in pipeline.steps:
+        if name not in lookups:
+            assert lookups <= _upstream(pipeline, name), name
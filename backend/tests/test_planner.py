@@ -0,0 +1,135 @@
+import time
+
+import pytest
+
+import planner
+from planner import RenameState, plan_rename, read_state
+
+CURRENT = "sut-a.example"
+NEW = "sut-b.example"
+SYSTEM = {
+    "username": "orch",
+    "platform_config": {"power_controllers": [{"ip": "10.0.0.1"}], "notes": "rack 5"},
+}
+
+
+@pytest.fixture
+def state(monkeypatch):
+    state = RenameState()
+    monkeypatch.setattr(planner, "read_state", lambda current_hostname, new_hostname: state)
+    return state
+
+
+def test_nothing_applied_runs_everything(state):
+    plan = plan_rename(CURRENT, NEW)
+    assert plan.completed == {}
+    assert plan.reasons["conductor_lookup"] == "not found in Conductor under either hostname"
+
+
+def test_conductor_renamed_skips_the_power_controllers(state):
+    state.system, state.conductor_renamed = SYSTEM, True
+    plan = plan_rename(CURRENT, NEW)
+    assert set(plan.completed) == {
+        "conductor_lookup",
+        "power_controllers",
+        "power_controllers_ready",
+        "conductor_update",
+    }
+    assert plan.completed["power_controllers"] == {
+        "power_controllers": [{"ip": "10.0.0.1"}],
+        "notes": "rack 5",
+        "renamed_controllers": [],
+    }
+
+
+def test_conductor_not_renamed_only_skips_the_lookup(state):
+    state.system = SYSTEM
+    assert set(plan_rename(CURRENT, NEW).completed) == {"conductor_lookup"}
+
+
+def test_maas_renamed(state):
+    state.maas_site, state.machine = "eq", {"system_id": "abc"}
+    assert set(plan_rename(CURRENT, NEW).completed) == {"maas_lookup"}
+
+    state.maas_renamed = True
+    plan = plan_rename(CURRENT, NEW)
+    assert plan.completed["maas_lookup"] == {"maas_site": "eq", "machine": {"system_id": "abc"}}
+    assert "maas_update" in plan.completed
+
+
+def test_sut_auth_installed_for_the_renamed_sut(state):
+    state.system, state.sut_hostname = SYSTEM, NEW
+    state.sut_auth = {"type": "install", "number": 7}
+    completed = plan_rename(CURRENT, NEW).completed
+    assert {"sut_hostname", "sut_auth_uninstall", "sut_auth_install"} <= set(completed)
+
+
+def test_sut_auth_uninstalled(state):
+    state.system = SYSTEM
+    state.sut_auth = {"type": "uninstall", "number": 7}
+    completed = plan_rename(CURRENT, NEW).completed
+    assert "sut_auth_uninstall" in completed
+    assert "sut_auth_install" not in completed
+
+
+def test_sut_auth_install_before_the_sut_was_renamed_runs_again(state):
+    state.system, state.sut_hostname = SYSTEM, CURRENT
+    state.sut_auth = {"type": "install", "number": 7}
+    plan = plan_rename(CURRENT, NEW)
+    assert "sut_auth_uninstall" not in plan.completed
+    assert plan.reasons["sut_auth_uninstall"] == "SUT not renamed since install build #7"
+
+
+@pytest.mark.parametrize(
+    "errors, reason",
+    [({}, "no SUT Auth build for the new hostname"), ({"sut_auth": "Jenkins down"}, "SUT Auth history unknown")],
+)
+def test_renamed_sut_without_sut_auth_history_runs_sut_auth(state, errors, reason):
+    state.system, state.sut_hostname, state.errors = SYSTEM, NEW, errors
+    plan = plan_rename(CURRENT, NEW)
+    assert "sut_hostname" in plan.completed
+    assert "sut_auth_uninstall" not in plan.completed
+    assert "sut_auth_install" not in plan.completed
+    assert plan.reasons["sut_auth_uninstall"] == reason
+
+
+def test_sut_without_sut_auth(state):
+    state.system = {**SYSTEM, "username": "amd"}
+    state.sut_auth = {"type": "uninstall", "number": 7}
+    plan = plan_rename(CURRENT, NEW)
+    assert "sut_auth_uninstall" not in plan.completed
+    assert plan.reasons["sut_auth_install"] == "SUT doesn't use SUT Auth"
+
+
+class FakeJenkins:
+    def get_last_sut_auth(self, hostname):
+        return {"type": "install", "number": 3}
+
+
+class FakeEndpoint:
+    def get(self, hostname_ip):
+        raise ConnectionError("Conductor down")
+
+
+class FakeSystemData:
+    endpoint = FakeEndpoint()
+
+
+def test_read_state_records_failing_and_slow_sources(monkeypatch):
+    def slow_maas(current_hostname, new_hostname):
+        time.sleep(2)
+
+    monkeypatch.setattr(planner, "PLAN_TIMEOUT", 0.2)
+    monkeypatch.setattr(planner, "Jenkins", FakeJenkins)
+    monkeypatch.setattr(planner, "SYSTEM_DATA_DB_CONTROLLER", FakeSystemData())
+    monkeypatch.setattr(planner, "_read_maas", slow_maas)
+    monkeypatch.setattr(planner, "_read_sut_hostname", lambda current_hostname, new_hostname: NEW)
+
+    started = time.monotonic()
+    state = read_state(CURRENT, NEW)
+
+    assert time.monotonic() - started < 1
+    assert state.errors == {"conductor": "Conductor down", "maas": "no answer within 0.2s"}
+    assert state.system is None and state.machine is None
+    assert state.sut_hostname == NEW
+    assert state.sut_auth == {"type": "install", "number": 3}
@@ -0,0 +1,96 @@
+import pytest
+
+from database import cache as cache_module
+from database.cache import QueryCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_hit_returns_a_copy():
+    cache = QueryCache()
+    cache.set({"name": "a"}, [{"id": "1", "name": "a"}])
+
+    cached, value = cache.get({"name": "a"})
+    value[0]["name"] = "changed"
+
+    assert cached
+    assert cache.get({"name": "a"}) == (True, [{"id": "1", "name": "a"}])
+    assert cache.stats["hits"] == 2
+
+
+def test_key_ignores_kwarg_order():
+    cache = QueryCache()
+    cache.set({"a": 1, "b": 2}, [])
+    assert cache.get({"b": 2, "a": 1}) == (True, [])
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = QueryCache(ttl=30)
+    cache.set({"name": "a"}, [])
+
+    clock[0] += 29
+    assert cache.get({"name": "a"})[0]
+    clock[0] += 2
+    assert cache.get({"name": "a"}) == (False, None)
+    assert cache.stats["size"] == 0
+
+
+def test_least_recently_used_is_evicted_first():
+    cache = QueryCache(max_size=2)
+    cache.set({"name": "a"}, [])
+    cache.set({"name": "b"}, [])
+    cache.get({"name": "a"})
+    cache.set({"name": "c"}, [])
+
+    assert cache.get({"name": "a"})[0]
+    assert not cache.get({"name": "b"})[0]
+    assert cache.get({"name": "c"})[0]
+
+
+def test_result_read_before_a_write_is_not_stored():
+    cache = QueryCache()
+    generation = cache.generation
+    cache.invalidate(ids=["1"])
+    cache.set({"name": "a"}, [{"id": "1"}], generation)
+    assert not cache.get({"name": "a"})[0]
+
+
+def test_update_evicts_entries_holding_the_record_or_filtering_on_its_fields():
+    cache = QueryCache()
+    cache.set({"name": "a"}, [{"id": "1"}])
+    cache.set({"name": "b"}, [{"id": "2"}])
+    cache.set({"hostname_ip": "h"}, [{"id": "3"}])
+
+    cache.invalidate(ids=["1"], fields=["hostname_ip"])
+
+    assert not cache.get({"name": "a"})[0]
+    assert cache.get({"name": "b"})[0]
+    assert not cache.get({"hostname_ip": "h"})[0]
+
+
+def test_insert_evicts_queries_it_may_now_match():
+    cache = QueryCache()
+    page = {"name": "a", "page": 2, "page_size": 10, "return_record_count": True}
+    cache.set({"name": "a"}, [])
+    cache.set({"name": "a", "username": "orch"}, [])
+    cache.set(page, {"data": [], "record_count": 0, "last_page": True})
+
+    cache.invalidate(ids=[], fields=["name"], inserted=True)
+
+    assert not cache.get({"name": "a"})[0]
+    # A new record with only a name set can't match a query on its username
+    assert cache.get({"name": "a", "username": "orch"})[0]
+    # Pagination doesn't filter
+    assert not cache.get(page)[0]
+
+
+def test_unknown_ids_clear_everything():
+    cache = QueryCache()
+    cache.set({"name": "a"}, [])
+    cache.clear()
+    assert cache.stats["size"] == 0
@@ -0,0 +1,120 @@
+import os
+import time
+import queue
+import logging
+import threading
+import contextvars
+from typing import Iterable, Optional
+
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", 1000))
+
+# Id of the job the current code runs for, log records made under it are published as events
+CURRENT_JOB: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_job", default=None
+)
+
+
+class Subscription:
+    def __init__(self, bus, job_ids: Optional[Iterable[str]], max_queue: int):
+        """
+        A subscriber's view of the bus, fed through a bounded queue
+        When the subscriber falls behind, new events are dropped rather than blocking the publishers,
+        and the count of dropped events is reported with the next one delivered
+        """
+        self.bus = bus
+        self.job_ids = set(job_ids) if job_ids is not None else None
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, event: dict):
+        if self.job_ids is not None and event.get("job") not in self.job_ids:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        :return: The next event, or None when none arrived within the timeout
+        """
+        try:
+            event = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return dict(type="dropped", count=dropped, time=time.time(), next=event)
+        return event
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventBus:
+    def __init__(self, max_queue: int = EVENT_QUEUE_SIZE):
+        """
+        Fans rename progress out to any number of subscribers
+        :param max_queue: Events buffered per subscriber before its events are dropped
+        """
+        self.max_queue = max_queue
+        self._subscriptions = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_ids: Optional[Iterable[str]] = None) -> Subscription:
+        """
+        :param job_ids: Only receive events of these jobs, all jobs when None
+        """
+        subscription = Subscription(self, job_ids, self.max_queue)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, type: str, job: Optional[str] = None, **data):
+        """
+        Hand an event to every interested subscriber without ever blocking
+        :param type: The kind of event, e.g. job, step or log
+        :param job: The id of the job it belongs to
+        """
+        event = dict(type=type, job=job, time=time.time(), **data)
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.offer(event)
+
+
+class EventLogHandler(logging.Handler):
+    """Publishes log records made while running a job, e.g. Jenkins console lines and SSH output"""
+
+    def __init__(self, bus: EventBus, level=logging.DEBUG):
+        super().__init__(level)
+        self.bus = bus
+
+    def emit(self, record):
+        job = CURRENT_JOB.get()
+        if job is None:
+            return
+        try:
+            self.bus.publish(
+                "log",
+                job=job,
+                level=record.levelname,
+                hostname=getattr(record, "hostname", None),
+                message=record.getMessage(),
+            )
+        except Exception:
+            self.handleError(record)
+
+
+EVENT_BUS = EventBus()
@@ -0,0 +1,177 @@
+import re
+import time
+import codecs
+import socket
+import selectors
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Pattern, Tuple, Union
+
+# Characters of recent output kept for matching, patterns can't span more than this
+MAX_BUFFER = 64 * 1024
+
+
+class _Expectation:
+    def __init__(self, channel, pattern, deadline, on_output, collect, max_buffer):
+        self.channel = channel
+        self.pattern = pattern
+        self.deadline = deadline
+        self.on_output = on_output
+        self.output = [] if collect else None
+        self.max_buffer = max_buffer
+        self.buffer = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.future = Future()
+
+    def feed(self, data: bytes) -> Optional[re.Match]:
+        text = self.decoder.decode(data)
+        if not text:
+            return None
+        if self.on_output is not None:
+            self.on_output(text)
+        if self.output is not None:
+            self.output.append(text)
+        # Search the rolling buffer rather than the chunk so matches can span chunks
+        self.buffer += text
+        match = self.pattern.search(self.buffer)
+        if len(self.buffer) > self.max_buffer:
+            self.buffer = self.buffer[-self.max_buffer :]
+        return match
+
+
+class ExpectEngine:
+    """
+    Waits for patterns on any number of paramiko channels from a single thread.
+    Channels are multiplexed with a selector instead of polling recv_ready(), output is
+    matched against a bounded rolling buffer and can be streamed to a callback.
+    """
+
+    def __init__(self, max_buffer: int = MAX_BUFFER):
+        self.max_buffer = max_buffer
+        self._selector = selectors.DefaultSelector()
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._selector.register(self._wake_reader, selectors.EVENT_READ, None)
+        self._pending: List[_Expectation] = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def expect(
+        self,
+        channel,
+        pattern: Union[str, Pattern],
+        timeout: float = 10,
+        on_output: Optional[Callable[[str], None]] = None,
+        collect: bool = False,
+    ) -> Future:
+        """
+        Wait for `pattern` to appear in a channel's output
+        :param channel: A paramiko Channel, e.g. from invoke_shell()
+        :param pattern: Regex to wait for
+        :param timeout: Seconds before the future fails with TimeoutError
+        :param on_output: Called with every decoded chunk of output as it arrives
+        :param collect: Keep the whole output, not just the rolling buffer
+        :return: Future of (match, output), output is None unless `collect`
+        """
+        expectation = _Expectation(
+            channel,
+            re.compile(pattern) if isinstance(pattern, str) else pattern,
+            time.monotonic() + timeout,
+            on_output,
+            collect,
+            self.max_buffer,
+        )
+        with self._lock:
+            self._pending.append(expectation)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="expect-engine", daemon=True
+                )
+                self._thread.start()
+        self._wake_writer.send(b"\0")
+        return expectation.future
+
+    def expect_many(
+        self, expectations: List[Tuple[object, Union[str, Pattern]]], timeout: float = 10
+    ) -> List[Future]:
+        """
+        Wait for a pattern on each of many channels at once
+        :param expectations: List of (channel, pattern)
+        :return: List of futures, as returned by expect()
+        """
+        return [self.expect(channel, pattern, timeout) for channel, pattern in expectations]
+
+    def _finish(self, expectation: _Expectation, match=None, error=None):
+        try:
+            self._selector.unregister(expectation.channel)
+        except (KeyError, ValueError):
+            pass
+        if expectation.future.done():
+            return
+        if error is not None:
+            expectation.future.set_exception(error)
+        else:
+            output = "".join(expectation.output) if expectation.output is not None else None
+            expectation.future.set_result((match, output))
+
+    def _read(self, expectation: _Expectation):
+        channel = expectation.channel
+        try:
+            while channel.recv_ready():
+                match = expectation.feed(channel.recv(65536))
+                if match is not None:
+                    return self._finish(expectation, match=match)
+        except Exception as e:
+            return self._finish(expectation, error=e)
+        if channel.closed or channel.eof_received:
+            self._finish(
+                expectation,
+                error=EOFError(f"Channel closed before `{expectation.pattern.pattern}` appeared"),
+            )
+
+    def _run(self):
+        active: List[_Expectation] = []
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            for expectation in pending:
+                try:
+                    self._selector.register(
+                        expectation.channel, selectors.EVENT_READ, expectation
+                    )
+                    active.append(expectation)
+                except KeyError:
+                    expectation.future.set_exception(
+                        RuntimeError("Channel already has a pending expect")
+                    )
+
+            now = time.monotonic()
+            for expectation in active:
+                if not expectation.future.done() and expectation.deadline <= now:
+                    self._finish(
+                        expectation,
+                        error=TimeoutError(
+                            f"Timed out waiting for `{expectation.pattern.pattern}`"
+                        ),
+                    )
+            active = [expectation for expectation in active if not expectation.future.done()]
+            if not active:
+                with self._lock:
+                    if not self._pending:
+                        self._thread = None
+                        return
+                continue
+
+            timeout = max(0, min(expectation.deadline for expectation in active) - now)
+            for key, _ in self._selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self._wake_reader.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._read(key.data)
+
+
+EXPECT_ENGINE = ExpectEngine()
@@ -1,85 +1,303 @@
-import os, time
+import os
+import re
+import time
+import codecs
+import threading
 import requests
+from typing import Callable, Iterator, Optional
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from utils.logger import logger
+from utils.metrics import observe_request
 
 load_dotenv()
 
+JENKINS_HOST = os.environ.get("JENKINS_HOST", "http://dcgpuauto-jenkins.amd.com:8080")
+JENKINS_TIMEOUT = int(os.environ.get("JENKINS_TIMEOUT", 30))
+
+# Only request the fields we read, a full build document is orders of magnitude larger
+BUILD_TREE = "number,result,building,duration"
+QUEUE_ITEM_TREE = "cancelled,executable[number]"
+# Fields the poller needs from a job's builds, limited to the most recent ones
+BUILDS_TREE = "builds[number,queueId,result,building,duration]{0,50}"
+# Recent builds with their parameters, to tell which SUT each one was for
+HISTORY_TREE = "builds[number,result,timestamp,actions[parameters[name,value]]]{0,50}"
+# Seconds that history is shared by every SUT planned meanwhile, before it is fetched again
+JENKINS_HISTORY_TTL = float(os.environ.get("JENKINS_HISTORY_TTL", 10))
+
+
+def _route(method: str, path: str) -> str:
+    # Build numbers and queue ids would give every build its own series
+    return f"{method} " + re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
 
 class Jenkins:
+    # One session for every Jenkins instance in the process. It is shared rather than
+    # per-thread because Jenkins ties CSRF crumbs to the session cookie.
+    _session = None
+    _crumb = None
+    _lock = threading.Lock()
+    # Separate from _lock, fetching a crumb goes through the session property which takes that one
+    _crumb_lock = threading.Lock()
+    # type -> (fetched at, builds), see get_history
+    _history = {}
+    _history_lock = threading.Lock()
+
     def __init__(self):
-        self.HOST = "http://dcgpuauto-jenkins.amd.com:8080"
+        self.HOST = JENKINS_HOST
         self.USER = os.environ.get("JENKINS_USER")
         self.CREDS = os.environ.get("JENKINS_CREDS")
 
-    def install_sut_auth(self, new_hostname):
-        # Install Jenkins
-        payload = {
-            "SUT_HOSTNAME": new_hostname,
-            "SUT_CREDENTIALS": "default_-amd__credentials",
-        }
-        response = requests.post(
-            f"{self.HOST}/job/At-Scale/job/sut-auth/job/manual-install-prod/buildWithParameters",
-            auth=(self.USER, self.CREDS),
-            data=payload,
-        )
-        if response.status_code == 201:
-            loc = response.headers.get("Location").split("/")[-2]
+    @property
+    def session(self) -> requests.Session:
+        if Jenkins._session is None:
+            with Jenkins._lock:
+                if Jenkins._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_maxsize=32)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    Jenkins._session = session
+        return Jenkins._session
 
-            timeout = 60  # Maximum time to wait for the build number
-            start_time = time.time()
+    def _get(self, path: str, **params) -> requests.Response:
+        with observe_request("jenkins", _route("GET", path)) as observation:
+            response = self.session.get(
+                f"{self.HOST}/{path}",
+                params=params,
+                auth=(self.USER, self.CREDS),
+                timeout=JENKINS_TIMEOUT,
+            )
+            observation.status = response.status_code
+        response.raise_for_status()
+        return response
 
-            while time.time() - start_time < timeout:
-                queue_response = requests.get(
-                    f"{self.HOST}/queue/item/{loc}/api/json", auth=(self.USER, self.CREDS)
+    def _get_crumb(self, refresh: bool = False) -> dict:
+        with Jenkins._crumb_lock:
+            if Jenkins._crumb is None or refresh:
+                with observe_request("jenkins", "GET crumbIssuer/api/json") as observation:
+                    response = self.session.get(
+                        f"{self.HOST}/crumbIssuer/api/json",
+                        params={"tree": "crumb,crumbRequestField"},
+                        auth=(self.USER, self.CREDS),
+                        timeout=JENKINS_TIMEOUT,
+                    )
+                    observation.status = response.status_code
+                # Jenkins without CSRF protection has no crumb issuer
+                if response.status_code == 404:
+                    Jenkins._crumb = {}
+                else:
+                    response.raise_for_status()
+                    crumb = response.json()
+                    Jenkins._crumb = {crumb["crumbRequestField"]: crumb["crumb"]}
+            return Jenkins._crumb
+
+    def _post(self, path: str, data: dict = None) -> requests.Response:
+        for refresh in (False, True):
+            headers = self._get_crumb(refresh=refresh)
+            with observe_request("jenkins", _route("POST", path)) as observation:
+                response = self.session.post(
+                    f"{self.HOST}/{path}",
+                    data=data,
+                    headers=headers,
+                    auth=(self.USER, self.CREDS),
+                    timeout=JENKINS_TIMEOUT,
                 )
-                
-                queue_data = queue_response.json()
+                observation.status = response.status_code
+            # A 403 usually means the cached crumb expired with its session
+            if response.status_code != 403:
+                break
+        return response
+
+    def _job_path(self, type: str) -> str:
+        if type not in ("install", "uninstall"):
+            raise ValueError("type must be either 'install' or 'uninstall'")
+        return f"job/At-Scale/job/sut-auth/job/manual-{type}-prod"
 
-                if "executable" in queue_data and "number" in queue_data["executable"]:
-                    build_num = queue_data["executable"]["number"]
-                    return build_num
-                time.sleep(1)
+    def queue_sut_auth(self, type: str, new_hostname: str) -> int | None:
+        """
+        Queue a SUT Auth install/uninstall build
+        :param type: Either 'install' or 'uninstall'
+        :param new_hostname: The hostname of the SUT
+        :return: The queue item id, or None if Jenkins refused the build
+        """
+        credentials = "default_-amd__credentials" if type == "install" else "amd_recovery"
+        payload = {"SUT_HOSTNAME": new_hostname, "SUT_CREDENTIALS": credentials}
+        response = self._post(f"{self._job_path(type)}/buildWithParameters", data=payload)
+        if response.status_code != 201:
+            return None
+        # The shared history no longer has the latest build
+        with Jenkins._history_lock:
+            Jenkins._history.pop(type, None)
+        return int(response.headers.get("Location").split("/")[-2])
+
+    def _wait_for_build_num(self, type: str, queue_id: int, timeout: int = 60) -> int:
+        from utils.jenkins_poller import JENKINS_POLLER
+
+        try:
+            return JENKINS_POLLER.wait_for_build_number(type, queue_id, timeout).result()
+        except TimeoutError:
             raise TimeoutError("Failed to get build number")
-        else:
-            print(f"Failed to install SUT Auth")
+
+    def install_sut_auth(self, new_hostname):
+        # Install Jenkins
+        queue_id = self.queue_sut_auth("install", new_hostname)
+        if queue_id is None:
+            logger.error(f"Jenkins refused the SUT Auth install build for {new_hostname}")
             return None
+        return self._wait_for_build_num("install", queue_id)
 
     def uninstall_sut_auth(self, new_hostname: str):
         # Uninstall Jenkins
-        payload = {"SUT_HOSTNAME": new_hostname, "SUT_CREDENTIALS": "amd_recovery"}
-        response = requests.post(
-            f"{self.HOST}/job/At-Scale/job/sut-auth/job/manual-uninstall-prod/buildWithParameters",
-            auth=(self.USER, self.CREDS),
-            data=payload,
-        )
-        if response.status_code == 201:
-            loc = response.headers.get("Location").split("/")[-2]
+        queue_id = self.queue_sut_auth("uninstall", new_hostname)
+        if queue_id is None:
+            logger.error(f"Jenkins refused the SUT Auth uninstall build for {new_hostname}")
+            return None
+        return self._wait_for_build_num("uninstall", queue_id)
 
-            timeout = 60  # Maximum time to wait for the build number
-            start_time = time.time()
+    def get_job_progress(self, type: str, build_num: str):
+        """
+        :return: The build's {number, result, building, duration}
+        """
+        return self._get(
+            f"{self._job_path(type)}/{build_num}/api/json", tree=BUILD_TREE
+        ).json()
 
-            while time.time() - start_time < timeout:
-                queue_response = requests.get(
-                    f"{self.HOST}/queue/item/{loc}/api/json", auth=(self.USER, self.CREDS)
-                )
-                
-                queue_data = queue_response.json()
+    def iter_console(
+        self,
+        type: str,
+        build_num: str,
+        timeout: float = 300,
+        poll_interval: float = 2,
+    ) -> Iterator[str]:
+        """
+        Stream a build's console line by line until the build reaches a terminal state
+        :param type: Either 'install' or 'uninstall'
+        :param build_num: The build number
+        :param timeout: Seconds before TimeoutError is raised if the build is still running
+        :param poll_interval: Seconds between polls while no new output is available
+        :return: Generator of console lines
+        """
+        deadline = time.monotonic() + timeout
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        start, pending = 0, ""
+        while True:
+            response = self._get(
+                f"{self._job_path(type)}/{build_num}/logText/progressiveText", start=start
+            )
+            start = int(response.headers.get("X-Text-Size", start))
+            more_data = response.headers.get("X-More-Data") == "true"
+            lines = (pending + decoder.decode(response.content, final=not more_data)).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip("\r")
+            if not more_data:
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{type} build {build_num} still running after {timeout}s")
+            time.sleep(poll_interval)
+        if pending:
+            yield pending.rstrip("\r")
 
-                if "executable" in queue_data and "number" in queue_data["executable"]:
-                    build_num = queue_data["executable"]["number"]
-                    return build_num
-                time.sleep(1)
-            raise TimeoutError("Failed to get build number")
-        else:
-            print(f"Failed to uninstall SUT Auth")
-            return None
+    def watch_build(
+        self,
+        type: str,
+        build_num: str,
+        timeout: float = 300,
+        on_line: Optional[Callable[[str], None]] = None,
+        poll_interval: float = 2,
+    ) -> dict:
+        """
+        Follow a build's console and return as soon as it finishes, whatever the result
+        The console is streamed per build, the result comes from JENKINS_POLLER
+        :param type: Either 'install' or 'uninstall'
+        :param build_num: The build number
+        :param timeout: Seconds before TimeoutError is raised if the build is still running
+        :param on_line: Called with every console line as it arrives
+        :param poll_interval: Seconds between polls while no new output is available
+        :return: The build's {number, result, building, duration}
+        """
+        from utils.jenkins_poller import JENKINS_POLLER
 
-    def get_job_progress(self, type: str, build_num: str):
-        if type not in ("install", "uninstall"):
-            raise ValueError("type must be either 'install' or 'uninstall'")
+        deadline = time.monotonic() + timeout
+        for line in self.iter_console(type, build_num, timeout, poll_interval):
+            if on_line is not None:
+                on_line(line)
+        # The console is complete once the build stops, the result follows right behind it and
+        # is picked up by the shared poller along with every other outstanding build
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"{type} build {build_num} has no result after {timeout}s")
+        try:
+            return JENKINS_POLLER.wait_for_result(type, build_num, remaining).result()
+        except TimeoutError:
+            raise TimeoutError(f"{type} build {build_num} has no result after {timeout}s")
 
-        job_response = requests.get(
-            f"{self.HOST}/job/At-Scale/job/sut-auth/job/manual-{type}-prod/{build_num}/api/json",
-            auth=(self.USER, self.CREDS),
+    def get_builds(self, type: str) -> list:
+        """
+        List the most recent builds of a SUT Auth job in one call
+        :param type: Either 'install' or 'uninstall'
+        :return: List of {number, queueId, result, building, duration}
+        """
+        return (
+            self._get(f"{self._job_path(type)}/api/json", tree=BUILDS_TREE)
+            .json()
+            .get("builds", [])
         )
-        return job_response.json()
+
+    def get_history(self, type: str) -> list:
+        """
+        List the most recent builds of a SUT Auth job with their parameters
+        Fetched at most once per JENKINS_HISTORY_TTL and shared, so planning a batch costs one call per job
+        :param type: Either 'install' or 'uninstall'
+        :return: List of {number, result, timestamp, actions: [{parameters: [{name, value}]}]}
+        """
+        # Held while fetching, so planners starting together wait for one call instead of each making it
+        with Jenkins._history_lock:
+            fetched_at, builds = Jenkins._history.get(type, (None, None))
+            if fetched_at is None or time.monotonic() - fetched_at > JENKINS_HISTORY_TTL:
+                builds = (
+                    self._get(f"{self._job_path(type)}/api/json", tree=HISTORY_TREE)
+                    .json()
+                    .get("builds", [])
+                )
+                Jenkins._history[type] = (time.monotonic(), builds)
+            return builds
+
+    def get_last_sut_auth(self, hostname: str) -> Optional[dict]:
+        """
+        Find the most recent successful SUT Auth install or uninstall of a SUT among the recent builds
+        :param hostname: The SUT_HOSTNAME the build ran for
+        :return: {type, number, timestamp} of the latest one, None if there's none
+        """
+        latest = None
+        for type in ("install", "uninstall"):
+            for build in self.get_history(type):
+                if build.get("result") != "SUCCESS":
+                    continue
+                parameters = {
+                    parameter.get("name"): parameter.get("value")
+                    for action in build.get("actions") or []
+                    for parameter in (action or {}).get("parameters") or []
+                }
+                if parameters.get("SUT_HOSTNAME") != hostname:
+                    continue
+                if latest is None or build.get("timestamp", 0) > latest["timestamp"]:
+                    latest = dict(type=type, number=build["number"], timestamp=build.get("timestamp", 0))
+                # Builds are listed newest first
+                break
+        return latest
+
+    def get_queue_ids(self) -> set:
+        """
+        List the ids of every item waiting in the Jenkins queue in one call
+        """
+        items = self._get("queue/api/json", tree="items[id]").json().get("items", [])
+        return {item["id"] for item in items}
+
+    def get_queue_item(self, queue_id: int) -> dict:
+        """
+        :return: The queue item's {cancelled, executable: {number}}
+        """
+        return self._get(f"queue/item/{queue_id}/api/json", tree=QUEUE_ITEM_TREE).json()
@@ -0,0 +1,196 @@
+import time
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.jenkins import Jenkins
+from utils.logger import logger
+
+
+class JenkinsPoller:
+    """
+    Single background poller for every outstanding SUT Auth queue item and build.
+
+    Each cycle costs one builds listing per job with waiters (which resolves queue items
+    through their queueId as well as build results), plus the queue listing only while
+    queue items are unresolved. The interval backs off while nothing changes and resets
+    whenever a waiter resolves or registers. Waiters get a Future, optionally with a callback.
+    """
+
+    def __init__(
+        self,
+        jenkins: Optional[Jenkins] = None,
+        min_interval: float = 1,
+        max_interval: float = 10,
+        backoff: float = 1.5,
+    ):
+        self.jenkins = jenkins or Jenkins()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        # (type, queue_id) / (type, build_num) -> [future, deadline]
+        self._queue_waiters: Dict[Tuple[str, int], list] = {}
+        self._build_waiters: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _register(
+        self,
+        waiters: Dict,
+        key: Tuple[str, int],
+        timeout: float,
+        callback: Optional[Callable[[Future], None]],
+    ) -> Future:
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            if key in waiters:
+                waiter = waiters[key]
+                waiter[1] = max(waiter[1], deadline)
+            else:
+                waiter = waiters[key] = [Future(), deadline]
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="jenkins-poller", daemon=True
+                )
+                self._thread.start()
+        self._wakeup.set()
+        if callback is not None:
+            waiter[0].add_done_callback(callback)
+        return waiter[0]
+
+    def wait_for_build_number(
+        self,
+        type: str,
+        queue_id: int,
+        timeout: float = 60,
+        callback: Optional[Callable[[Future], None]] = None,
+    ) -> Future:
+        """
+        Resolve a queue item to its build number
+        :param type: Either 'install' or 'uninstall'
+        :param queue_id: The queue item id returned by Jenkins.queue_sut_auth
+        :param timeout: Seconds before the future fails with TimeoutError
+        :param callback: Called with the future once it is done
+        :return: Future of the build number
+        """
+        return self._register(self._queue_waiters, (type, int(queue_id)), timeout, callback)
+
+    def wait_for_result(
+        self,
+        type: str,
+        build_num: int,
+        timeout: float = 300,
+        callback: Optional[Callable[[Future], None]] = None,
+    ) -> Future:
+        """
+        Wait for a build to finish, whatever its result
+        :param type: Either 'install' or 'uninstall'
+        :param build_num: The build number
+        :param timeout: Seconds before the future fails with TimeoutError
+        :param callback: Called with the future once it is done
+        :return: Future of the build's {number, queueId, result, building, duration}
+        """
+        return self._register(self._build_waiters, (type, int(build_num)), timeout, callback)
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            with self._lock:
+                if not self._queue_waiters and not self._build_waiters:
+                    self._thread = None
+                    return
+            try:
+                progressed = self._poll()
+            except Exception:
+                logger.exception("Jenkins poll failed")
+                progressed = False
+            self._expire()
+            interval = (
+                self.min_interval
+                if progressed
+                else min(interval * self.backoff, self.max_interval)
+            )
+            if self._wakeup.wait(interval):
+                interval = self.min_interval
+            self._wakeup.clear()
+
+    def _resolve(self, waiters: Dict, key: Tuple[str, int], result=None, error=None):
+        with self._lock:
+            waiter = waiters.pop(key, None)
+        if waiter is None or waiter[0].done():
+            return
+        if error is not None:
+            waiter[0].set_exception(error)
+        else:
+            waiter[0].set_result(result)
+
+    def _poll(self) -> bool:
+        with self._lock:
+            queue_keys = list(self._queue_waiters)
+            build_keys = list(self._build_waiters)
+        progressed = False
+
+        builds_by_job = {}
+        for type in {key[0] for key in queue_keys + build_keys}:
+            try:
+                builds_by_job[type] = self.jenkins.get_builds(type)
+            except Exception as e:
+                logger.warning(f"Failed to list {type} builds: {e}")
+
+        unresolved_queue_keys = []
+        for type, queue_id in queue_keys:
+            builds = builds_by_job.get(type, [])
+            build = next((b for b in builds if b.get("queueId") == queue_id), None)
+            if build is not None:
+                self._resolve(self._queue_waiters, (type, queue_id), build["number"])
+                progressed = True
+            elif type in builds_by_job:
+                unresolved_queue_keys.append((type, queue_id))
+
+        if unresolved_queue_keys:
+            # Items that left the queue without showing up in the builds were
+            # cancelled or started before the listed window, look them up directly
+            queued = self.jenkins.get_queue_ids()
+            for type, queue_id in unresolved_queue_keys:
+                if queue_id in queued:
+                    continue
+                item = self.jenkins.get_queue_item(queue_id)
+                if item.get("cancelled"):
+                    self._resolve(
+                        self._queue_waiters,
+                        (type, queue_id),
+                        error=RuntimeError(f"Queue item {queue_id} was cancelled"),
+                    )
+                    progressed = True
+                elif "number" in (item.get("executable") or {}):
+                    self._resolve(
+                        self._queue_waiters, (type, queue_id), item["executable"]["number"]
+                    )
+                    progressed = True
+
+        for type, build_num in build_keys:
+            if type not in builds_by_job:
+                continue
+            build = next(
+                (b for b in builds_by_job[type] if b.get("number") == build_num), None
+            )
+            if build is None:
+                build = self.jenkins.get_job_progress(type, build_num)
+            if not build.get("building") and build.get("result") is not None:
+                self._resolve(self._build_waiters, (type, build_num), build)
+                progressed = True
+        return progressed
+
+    def _expire(self):
+        now = time.monotonic()
+        for waiters in (self._queue_waiters, self._build_waiters):
+            with self._lock:
+                expired = [key for key, (_, deadline) in waiters.items() if deadline < now]
+            for key in expired:
+                self._resolve(
+                    waiters, key, error=TimeoutError(f"Timed out waiting for {key[0]} {key[1]}")
+                )
+
+
+JENKINS_POLLER = JenkinsPoller()
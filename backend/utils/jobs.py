@@ -0,0 +1,188 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils.events import CURRENT_JOB, EventBus
+from utils.logger import logger
+from utils.pipeline import StepRun
+
+RENAME_JOB_WORKERS = int(os.environ.get("RENAME_JOB_WORKERS", 8))
+# Finished jobs kept for status lookups, the oldest are forgotten first
+RENAME_JOB_HISTORY = int(os.environ.get("RENAME_JOB_HISTORY", 1000))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    params: dict
+    state: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    steps: Dict[str, StepRun] = field(default_factory=dict)
+
+    @property
+    def done(self) -> bool:
+        return self.state in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> dict:
+        return dict(
+            id=self.id,
+            **self.params,
+            state=self.state,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            duration=(
+                self.finished_at - self.started_at
+                if self.started_at is not None and self.finished_at is not None
+                else None
+            ),
+            error=self.error,
+            steps={
+                name: dict(
+                    state=run.state,
+                    started_at=run.started_at,
+                    finished_at=run.finished_at,
+                    duration=run.duration,
+                    error=run.error,
+                )
+                for name, run in list(self.steps.items())
+            },
+        )
+
+
+class JobConflict(Exception):
+    def __init__(self, key: str, job: Optional[Job] = None):
+        """
+        A job was submitted for something another job is already working on
+        :param key: What both jobs are for
+        :param job: The job that is queued or running, None when both were in the same submission
+        """
+        super().__init__(f"A job for {key} is already queued or running")
+        self.key = key
+        self.job = job
+
+
+class JobManager:
+    def __init__(
+        self,
+        run: Callable[..., object],
+        max_workers: int = RENAME_JOB_WORKERS,
+        history: int = RENAME_JOB_HISTORY,
+        events: Optional[EventBus] = None,
+        keys: Optional[Callable[[dict], Iterable[str]]] = None,
+    ):
+        """
+        Runs pipelines in the background and keeps track of their progress
+        :param run: Called with a job's params and `on_transition`, which it hands to Pipeline.run
+        :param max_workers: Maximum number of jobs running at once, the rest wait in the queue
+        :param history: Number of finished jobs kept for status lookups
+        :param events: Bus that job and step transitions are published to
+        :param keys: Called with a job's params, returns what the job works on, e.g. hostnames.
+            A job sharing a key with one that is queued or running is refused with JobConflict.
+        """
+        self.run = run
+        self.history = history
+        self.events = events
+        self.keys = keys
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        # key -> the queued or running job holding it
+        self._in_flight: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, **params) -> Job:
+        """
+        Queue a job
+        :return: The Job, its id can be used to look it up
+        """
+        return self.submit_many([params])[0]
+
+    def submit_many(self, params_list: List[dict]) -> List[Job]:
+        """
+        Queue several jobs, either all of them or, on a JobConflict, none
+        :return: The Jobs, in the order of their params
+        """
+        jobs = [Job(id=uuid.uuid4().hex, params=params) for params in params_list]
+        with self._lock:
+            claimed = {}
+            for job in jobs:
+                for key in self.keys(job.params) if self.keys is not None else ():
+                    if key in self._in_flight:
+                        raise JobConflict(key, self._in_flight[key])
+                    if key in claimed:
+                        raise JobConflict(key)
+                    claimed[key] = job
+            self._in_flight.update(claimed)
+            for job in jobs:
+                self._jobs[job.id] = job
+            self._forget_finished()
+        for job in jobs:
+            self._publish_job(job)
+            self._executor.submit(self._execute, job)
+        return jobs
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[: max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _release(self, job: Job):
+        with self._lock:
+            for key in self.keys(job.params) if self.keys is not None else ():
+                if self._in_flight.get(key) is job:
+                    del self._in_flight[key]
+
+    def _publish_job(self, job: Job):
+        if self.events is not None:
+            self.events.publish("job", job=job.id, state=job.state, error=job.error)
+
+    def _execute(self, job: Job):
+        def on_transition(run: StepRun):
+            job.steps[run.name] = run
+            if self.events is not None:
+                self.events.publish(
+                    "step",
+                    job=job.id,
+                    step=run.name,
+                    state=run.state,
+                    duration=run.duration,
+                    error=run.error,
+                )
+
+        token = CURRENT_JOB.set(job.id)
+        job.state = RUNNING
+        job.started_at = time.time()
+        self._publish_job(job)
+        try:
+            self.run(**job.params, on_transition=on_transition)
+            job.state = SUCCEEDED
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            job.error = str(e) or e.__class__.__name__
+            job.state = FAILED
+        finally:
+            job.finished_at = time.time()
+            self._release(job)
+            self._publish_job(job)
+            CURRENT_JOB.reset(token)
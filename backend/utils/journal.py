@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+RENAME_JOURNAL_PATH = os.environ.get("RENAME_JOURNAL_PATH", "rename_journal.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS renames (
+    id TEXT PRIMARY KEY,
+    current_hostname TEXT NOT NULL,
+    new_hostname TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    rename_id TEXT NOT NULL REFERENCES renames(id) ON DELETE CASCADE,
+    step TEXT NOT NULL,
+    state TEXT NOT NULL,
+    outputs TEXT,
+    error TEXT,
+    started_at REAL,
+    finished_at REAL,
+    PRIMARY KEY (rename_id, step)
+);
+"""
+
+
+class RenameJournal:
+    def __init__(self, path: str = RENAME_JOURNAL_PATH):
+        """
+        Durable record of every rename's completed steps and their outputs, so a rerun can pick up where
+        a crashed one stopped. Backed by SQLite in WAL mode, opened on first use.
+        :param path: The database file
+        """
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def rename_id(current_hostname: str, new_hostname: str) -> str:
+        """
+        Renames are keyed by their hostnames, so rerunning the same rename finds its journal
+        """
+        return f"{current_hostname}->{new_hostname}"
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, sql: str, parameters=()) -> list:
+        with self._lock:
+            return self._connect().execute(sql, parameters).fetchall()
+
+    def start(self, rename_id: str, current_hostname: str, new_hostname: str):
+        """
+        Register a rename, or mark a journaled one as running again
+        The steps of one that succeeded are forgotten, doing the same rename again is a new attempt
+        """
+        now = time.time()
+        self._execute(
+            """
+            DELETE FROM steps WHERE rename_id = ?
+            AND EXISTS (SELECT 1 FROM renames WHERE id = ? AND state = 'succeeded')
+            """,
+            (rename_id, rename_id),
+        )
+        self._execute(
+            """
+            INSERT INTO renames (id, current_hostname, new_hostname, state, created_at, updated_at)
+            VALUES (?, ?, ?, 'running', ?, ?)
+            ON CONFLICT(id) DO UPDATE SET state = 'running', error = NULL, updated_at = excluded.updated_at
+            """,
+            (rename_id, current_hostname, new_hostname, now, now),
+        )
+
+    def finish(self, rename_id: str, state: str, error: Optional[str] = None):
+        self._execute(
+            "UPDATE renames SET state = ?, error = ?, updated_at = ? WHERE id = ?",
+            (state, error, time.time(), rename_id),
+        )
+
+    def record_step(
+        self,
+        rename_id: str,
+        step: str,
+        state: str,
+        outputs: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+        started_at: Optional[float] = None,
+        finished_at: Optional[float] = None,
+    ):
+        """
+        Save a step's state, with its outputs once it succeeded
+        """
+        self._execute(
+            """
+            INSERT OR REPLACE INTO steps (rename_id, step, state, outputs, error, started_at, finished_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                rename_id,
+                step,
+                state,
+                json.dumps(outputs) if outputs is not None else None,
+                error,
+                started_at,
+                finished_at,
+            ),
+        )
+
+    def completed_steps(self, rename_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Only a rename that is still running or failed is resumed, one that succeeded has nothing to pick up
+        :return: Dict of step name to its outputs, for every step that succeeded
+        """
+        rows = self._execute(
+            """
+            SELECT steps.step, steps.outputs FROM steps JOIN renames ON renames.id = steps.rename_id
+            WHERE steps.rename_id = ? AND steps.state = 'succeeded'
+            AND renames.state IN ('running', 'failed')
+            """,
+            (rename_id,),
+        )
+        return {step: json.loads(outputs) if outputs else {} for step, outputs in rows}
+
+    def get(self, rename_id: str) -> Optional[dict]:
+        """
+        :return: The rename's {id, current_hostname, new_hostname, state, error, created_at, updated_at}
+        """
+        rows = self._execute(
+            """
+            SELECT id, current_hostname, new_hostname, state, error, created_at, updated_at
+            FROM renames WHERE id = ?
+            """,
+            (rename_id,),
+        )
+        if not rows:
+            return None
+        keys = ("id", "current_hostname", "new_hostname", "state", "error", "created_at", "updated_at")
+        return dict(zip(keys, rows[0]))
+
+    def discard(self, rename_id: str):
+        """
+        Forget a rename so it starts from scratch next time
+        """
+        self._execute("DELETE FROM renames WHERE id = ?", (rename_id,))
+
+
+RENAME_JOURNAL = RenameJournal()
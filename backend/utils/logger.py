@@ -29,3 +29,15 @@ logger.addHandler(handler)
 # Avoid duplicate logs if imported multiple times
 if not logger.hasHandlers():
     logger.addHandler(handler)
+
+
+class SUTLoggerAdapter(logging.LoggerAdapter):
+    """Prefixes every message with the SUT hostname so interleaved batch logs stay readable"""
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return f"[{self.extra['hostname']}] {msg}", kwargs
+
+
+def get_sut_logger(hostname: str) -> logging.LoggerAdapter:
+    return SUTLoggerAdapter(logger, {"hostname": hostname})
@@ -1,8 +1,14 @@
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
 from dotenv import load_dotenv
 from requests_oauthlib import OAuth1Session
 from oauthlib.oauth1 import SIGNATURE_PLAINTEXT
 
+from utils.metrics import observe_request
+
 load_dotenv()
 
 MAAS_CONFIG = {
@@ -16,11 +22,15 @@ MAAS_CONFIG = {
     },
 }
 
+MACHINE_INDEX_TTL = float(os.environ.get("MAAS_INDEX_TTL", 300))
+# Hostnames sent per listing request, keeps the query string a sane length
+HOSTNAMES_PER_REQUEST = 100
+
 
 class MAAS:
     def __init__(self, loc: str):
-        if loc not in ("eq", "ust"):
-            raise ValueError("loc must be either 'eq' or 'ust'")
+        if loc not in MAAS_CONFIG:
+            raise ValueError(f"loc must be one of {', '.join(MAAS_CONFIG)}")
 
         self.HOST = MAAS_CONFIG[loc]["host"]
         self.API_KEY = MAAS_CONFIG[loc]["api_key"]
@@ -35,39 +45,231 @@ class MAAS:
     def get_machine(self, name: str) -> str | None:
         # e.g. name = asrock325x-png-5cr14-02b
         try:
-            node = self.MAAS.get(
-                f"{self.HOST}/MAAS/api/2.0/machines/", params={"hostname": name}
-            )
+            with observe_request("maas", "GET machines/") as observation:
+                node = self.MAAS.get(
+                    f"{self.HOST}/MAAS/api/2.0/machines/", params={"hostname": name}
+                )
+                observation.status = node.status_code
             node.raise_for_status()
-            if len(node.json()) == 0:
-                return None
-            return node.json()[0]
+            machines = node.json()
+            return machines[0] if machines else None
         except Exception as e:
             return None
 
+    def get_machines(self, names: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        List machines in bulk, one request per HOSTNAMES_PER_REQUEST hostnames
+        :param names: Hostnames to look up, or None for every machine on the site
+        :return: List of machines, hostnames that don't exist are left out
+        """
+        if names is None:
+            batches = [[]]
+        else:
+            names = list(names)
+            batches = [
+                names[i : i + HOSTNAMES_PER_REQUEST]
+                for i in range(0, len(names), HOSTNAMES_PER_REQUEST)
+            ]
+        machines = []
+        for batch in batches:
+            with observe_request("maas", "GET machines/") as observation:
+                node = self.MAAS.get(
+                    f"{self.HOST}/MAAS/api/2.0/machines/",
+                    params=[("hostname", name) for name in batch],
+                )
+                observation.status = node.status_code
+            node.raise_for_status()
+            machines.extend(node.json())
+        return machines
+
     def update_machine(
         self, machine_id: str, new_name: str, power_type: str
     ) -> str | None:
         # e.g. name = asrock325x-png-5cr14-02b
         try:
-            node = self.MAAS.put(
-                f"{self.HOST}/MAAS/api/2.0/machines/{machine_id}/",
-                data={
-                    "hostname": new_name,
-                    **(
-                        {
-                            "power_parameters_power_on_uri": f"http://png-dcgpuval-platypiserver.png.dcgpu/api/v1/{new_name}/power_on_pxe",
-                            "power_parameters_power_off_uri": f"http://png-dcgpuval-platypiserver.png.dcgpu/api/v1/{new_name}/power_off_pxe",
-                            "power_parameters_power_query_uri": f"http://png-dcgpuval-platypiserver.png.dcgpu/api/v1/{new_name}/power_check_pxe",
-                        }
-                        if power_type == "webhook"
-                        else {}
-                    ),
-                },
-            )
+            with observe_request("maas", "PUT machines/{id}/") as observation:
+                node = self.MAAS.put(
+                    f"{self.HOST}/MAAS/api/2.0/machines/{machine_id}/",
+                    data={
+                        "hostname": new_name,
+                        **(
+                            {
+                                "power_parameters_power_on_uri": f"http://png-dcgpuval-platypiserver.png.dcgpu/api/v1/{new_name}/power_on_pxe",
+                                "power_parameters_power_off_uri": f"http://png-dcgpuval-platypiserver.png.dcgpu/api/v1/{new_name}/power_off_pxe",
+                                "power_parameters_power_query_uri": f"http://png-dcgpuval-platypiserver.png.dcgpu/api/v1/{new_name}/power_check_pxe",
+                            }
+                            if power_type == "webhook"
+                            else {}
+                        ),
+                    },
+                )
+                observation.status = node.status_code
             node.raise_for_status()
             if len(node.json()) == 0:
                 return None
             return node.json()
         except:
             return None
+
+
+class MachineIndex:
+    """
+    Per-site index of MAAS machines keyed by hostname and system_id.
+    Loaded in bulk (for a list of hostnames or the whole site) and refreshed incrementally:
+    only entries older than the TTL are fetched again, in a single listing.
+    """
+
+    def __init__(self, maas: MAAS, ttl: float = MACHINE_INDEX_TTL):
+        self.maas = maas
+        self.ttl = ttl
+        # hostname -> (fetched_at, machine or None when it doesn't exist)
+        self._by_hostname: Dict[str, tuple] = {}
+        self._by_id: Dict[str, Dict] = {}
+        self._full_scan_at = None
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, fetched_at: Optional[float]) -> bool:
+        return fetched_at is not None and time.monotonic() - fetched_at < self.ttl
+
+    def _store(self, machines: List[Dict], requested: Iterable[str], fetched_at: float):
+        with self._lock:
+            for name in requested:
+                self._by_hostname[name] = (fetched_at, None)
+            for machine in machines:
+                old = self._by_id.get(machine["system_id"])
+                if old is not None and old["hostname"] != machine["hostname"]:
+                    # Renamed since we last saw it, nothing answers to the old hostname
+                    self._by_hostname[old["hostname"]] = (fetched_at, None)
+                self._by_hostname[machine["hostname"]] = (fetched_at, machine)
+                self._by_id[machine["system_id"]] = machine
+
+    def load(self, names: Optional[Iterable[str]] = None):
+        """
+        Bulk load machines into the index
+        :param names: Hostnames to load, or None to scan the whole site
+        """
+        fetched_at = time.monotonic()
+        if names is None:
+            machines = self.maas.get_machines()
+            self._store(machines, [], fetched_at)
+            with self._lock:
+                self._full_scan_at = fetched_at
+        else:
+            names = list(names)
+            self._store(self.maas.get_machines(names), names, fetched_at)
+
+    def prefetch(self, names: Iterable[str]):
+        """
+        Refresh the stale or missing entries among `names` in one bulk listing
+        """
+        with self._lock:
+            stale = [
+                name
+                for name in set(names)
+                if not self._is_fresh(self._by_hostname.get(name, (None,))[0])
+            ]
+        if stale:
+            self.load(stale)
+
+    def get(self, name: str) -> Optional[Dict]:
+        """
+        Look up a machine by hostname, only hitting MAAS if the entry is stale or unknown
+        :param name: e.g. asrock325x-png-5cr14-02b
+        :return: The machine, or None if it doesn't exist
+        """
+        with self._lock:
+            fetched_at, machine = self._by_hostname.get(name, (None, None))
+            if self._is_fresh(fetched_at):
+                return machine
+            if self._is_fresh(self._full_scan_at) and fetched_at is None:
+                # A fresh full scan is authoritative, the machine doesn't exist
+                return None
+        try:
+            self.load([name])
+        except Exception:
+            return None
+        with self._lock:
+            return self._by_hostname.get(name, (None, None))[1]
+
+    def get_by_id(self, system_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._by_id.get(system_id)
+
+    def update_machine(
+        self, machine_id: str, new_name: str, power_type: str
+    ) -> str | None:
+        """
+        MAAS.update_machine, keeping the index in step with the rename
+        """
+        updated = self.maas.update_machine(machine_id, new_name, power_type)
+        if updated:
+            self._store([updated], [], time.monotonic())
+        return updated
+
+
+_MACHINE_INDEXES: Dict[str, MachineIndex] = {}
+_MACHINE_INDEXES_LOCK = threading.Lock()
+
+
+def get_machine_index(loc: str) -> MachineIndex:
+    """
+    The shared MachineIndex of a site, created on first use
+    :param loc: Either 'eq' or 'ust'
+    """
+    with _MACHINE_INDEXES_LOCK:
+        if loc not in _MACHINE_INDEXES:
+            _MACHINE_INDEXES[loc] = MachineIndex(MAAS(loc))
+        return _MACHINE_INDEXES[loc]
+
+
+class MachineResolver:
+    """
+    Finds which MAAS site a machine lives on by querying every configured site at once
+    through their shared indexes, taking the first site that has it. The site is
+    remembered per hostname so later lookups go straight to it.
+    """
+
+    def __init__(self, sites: Optional[List[str]] = None):
+        self.sites = sites or [
+            site
+            for site, config in MAAS_CONFIG.items()
+            if config["host"] and config["api_key"]
+        ]
+        self._site_by_hostname: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.sites)), thread_name_prefix="maas-resolver"
+        )
+
+    def remember(self, name: str, site: str):
+        with self._lock:
+            self._site_by_hostname[name] = site
+
+    def resolve(self, name: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        Find a machine on whichever site has it
+        :param name: e.g. asrock325x-png-5cr14-02b
+        :return: Tuple of the site and the machine, or (None, None) if no site has it
+        """
+        with self._lock:
+            known_site = self._site_by_hostname.get(name)
+        if known_site is not None:
+            machine = get_machine_index(known_site).get(name)
+            if machine is not None:
+                return known_site, machine
+
+        futures = {
+            self._executor.submit(get_machine_index(site).get, name): site
+            for site in self.sites
+            if site != known_site
+        }
+        for future in as_completed(futures):
+            machine = future.result()
+            if machine is not None:
+                site = futures[future]
+                self.remember(name, site)
+                return site, machine
+        return None, None
+
+
+MACHINE_RESOLVER = MachineResolver()
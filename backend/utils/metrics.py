@@ -0,0 +1,66 @@
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# From a pooled Conductor lookup up to a SUT Auth build being followed to the end
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+BACKEND_REQUEST_SECONDS = Histogram(
+    "backend_request_duration_seconds",
+    "Time spent on requests to Conductor, MAAS, Jenkins, Redfish and SSH hosts",
+    ["backend", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+BACKEND_REQUEST_EXCEPTIONS = Counter(
+    "backend_request_exceptions",
+    "Requests to backends that raised before a response came back, by exception type",
+    ["backend", "route", "exception"],
+)
+PIPELINE_STEP_SECONDS = Histogram(
+    "pipeline_step_duration_seconds",
+    "Time spent running pipeline steps, by the state they finished in",
+    ["step", "state"],
+    buckets=LATENCY_BUCKETS,
+)
+PIPELINE_STEPS = Counter(
+    "pipeline_steps",
+    "Pipeline steps that finished, were skipped or were resumed from an earlier run",
+    ["step", "state"],
+)
+PIPELINE_STEPS_RUNNING = Gauge(
+    "pipeline_steps_running",
+    "Pipeline steps running right now",
+    ["step"],
+)
+
+
+@contextmanager
+def observe_request(backend: str, route: str):
+    """
+    Time a request to a backend
+    The caller sets `status` on what is yielded once the response is in, e.g. the HTTP status code.
+    Requests that raise first are recorded with the status "error" and counted by exception type.
+    :param backend: e.g. conductor, maas, jenkins, redfish or ssh
+    :param route: The method and route template, without per-request parts like ids,
+        e.g. "PUT machines/{id}/"
+    """
+    observation = SimpleNamespace(status="error")
+    start_time = time.perf_counter()
+    try:
+        yield observation
+    except Exception as e:
+        BACKEND_REQUEST_EXCEPTIONS.labels(backend, route, e.__class__.__name__).inc()
+        raise
+    finally:
+        BACKEND_REQUEST_SECONDS.labels(backend, route, str(observation.status)).observe(
+            time.perf_counter() - start_time
+        )
+
+
+def render_metrics():
+    """
+    :return: Tuple of every metric in the Prometheus text format and its content type
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
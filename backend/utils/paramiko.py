@@ -1,80 +1,381 @@
+import os
 import re
 import time
+import uuid
+import shlex
+import selectors
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
 from paramiko import SSHClient, AutoAddPolicy, SSHException
 
+from utils.expect import EXPECT_ENGINE
+from utils.metrics import observe_request
+
+SSH_PORT = int(os.environ.get("SSH_PORT", 22))
+SSH_IDLE_TIMEOUT = float(os.environ.get("SSH_IDLE_TIMEOUT", 120))
+
+
+@dataclass
+class CommandResult:
+    hostname: str
+    command: str
+    exit_status: Optional[int]
+    stdout: str
+    stderr: str
+    duration: float
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.exit_status == 0
+
+
+@dataclass
+class StepResult:
+    command: str
+    exit_status: int
+    stdout: str
+    stderr: str
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_status == 0
+
+
+def detached(command, delay=1):
+    """
+    Wrap a command so it runs in the background after a short delay, e.g. a reboot at the end of a script
+    that would otherwise drop the connection before the script can report back
+    """
+    return f"nohup sh -c {shlex.quote(f'sleep {delay}; {command}')} >/dev/null 2>&1 &"
+
+
+class SSHConnectionPool:
+    def __init__(self, idle_timeout=SSH_IDLE_TIMEOUT):
+        """
+        Pool of authenticated SSH connections keyed by (host, port, user)
+        Connections are leased exclusively, health-checked before reuse and closed once idle for too long
+        While any connection is idle a background thread closes expired ones, even if the pool sees no more use
+        :param idle_timeout: Seconds an idle connection is kept before it is closed
+        """
+        self.idle_timeout = idle_timeout
+        # (hostname, port, username) -> [(client, released_at), ...]
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    @staticmethod
+    def _is_healthy(client):
+        transport = client.get_transport()
+        if transport is None or not transport.is_active() or not transport.is_authenticated():
+            return False
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for key, idle in list(self._idle.items()):
+                fresh = []
+                for client, released_at in idle:
+                    if now - released_at > self.idle_timeout:
+                        expired.append(client)
+                    else:
+                        fresh.append((client, released_at))
+                if fresh:
+                    self._idle[key] = fresh
+                else:
+                    del self._idle[key]
+        for client in expired:
+            client.close()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(1.0, self.idle_timeout / 2))
+            self._evict_idle()
+            with self._lock:
+                if not self._idle:
+                    self._reaper = None
+                    return
+
+    def acquire(self, hostname, username, password, port=SSH_PORT, timeout=None):
+        """
+        Lease a connection, reusing an idle one when it is still alive
+        :param timeout: Seconds to wait when a new connection has to be opened
+        :return: A connected SSHClient
+        """
+        self._evict_idle()
+        key = (hostname, port, username)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                client = idle.pop()[0] if idle else None
+            if client is None:
+                break
+            if self._is_healthy(client):
+                return client
+            client.close()
+
+        client = SSHClient()
+        client.set_missing_host_key_policy(AutoAddPolicy())
+        with observe_request("ssh", "connect") as observation:
+            client.connect(
+                hostname=hostname, port=port, username=username, password=password, timeout=timeout
+            )
+            observation.status = "ok"
+        return client
+
+    def release(self, client, hostname, username, port=SSH_PORT, discard=False):
+        """
+        Return a leased connection to the pool
+        :param discard: Close it instead, e.g. when the host is rebooting
+        """
+        if discard or not self._is_healthy(client):
+            client.close()
+            return
+        with self._lock:
+            self._idle.setdefault((hostname, port, username), []).append(
+                (client, time.monotonic())
+            )
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name="ssh-pool-reaper", daemon=True)
+                self._reaper.start()
+        self._evict_idle()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for client, _ in connections:
+                client.close()
+
+
+SSH_POOL = SSHConnectionPool()
+
+
 class Paramiko:
-    def __init__(self, hostname, username, password):
+    def __init__(
+        self, hostname, username, password, port=SSH_PORT, pool=SSH_POOL, timeout=None
+    ):
         """
         Initialize the Paramiko class
         :param hostname: The hostname of the remote host
         :param username: The username to use
         :param password: The password to use
+        :param port: The SSH port of the remote host
+        :param pool: The connection pool to lease from, None to always open a dedicated connection
+        :param timeout: Seconds to wait for the connection to open
         """
         self.hostname = hostname
         self.username = username
         self.password = password
+        self.port = port
+        self.pool = pool
+        self.timeout = timeout
 
-        self.ssh = SSHClient()
-        self.ssh.set_missing_host_key_policy(AutoAddPolicy())
+        self.ssh = None
+        self._channel = None
         self._connect()
-        self.channel = self.ssh.invoke_shell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # After an error the connection may be left mid-command, don't hand it back to the pool
+        self.close(discard=exc_type is not None)
+
+    @property
+    def channel(self):
+        """
+        Interactive shell channel, only opened on first use
+        """
+        if self._channel is None:
+            self._channel = self.ssh.invoke_shell()
+        return self._channel
 
     def _connect(self):
         """
         Connect to the remote host
         """
         try:
-            self.ssh.connect(
-                hostname=self.hostname, username=self.username, password=self.password
-            )
+            if self.pool is not None:
+                self.ssh = self.pool.acquire(
+                    self.hostname, self.username, self.password, self.port, self.timeout
+                )
+            else:
+                self.ssh = SSHClient()
+                self.ssh.set_missing_host_key_policy(AutoAddPolicy())
+                with observe_request("ssh", "connect") as observation:
+                    self.ssh.connect(
+                        hostname=self.hostname,
+                        port=self.port,
+                        username=self.username,
+                        password=self.password,
+                        timeout=self.timeout,
+                    )
+                    observation.status = "ok"
 
         except SSHException as e:
             raise RuntimeError(f"Failed to connect to {self.hostname}: {e}")
         except Exception as e:
             raise RuntimeError(f"An error occurred: {e}")
 
+    def _open_session(self, timeout=None):
+        try:
+            channel = self.ssh.get_transport().open_session(timeout=timeout)
+        except (SSHException, AttributeError):
+            # A pooled connection can drop between its health check and use, reconnect once
+            if self.pool is None:
+                raise
+            self.close(discard=True)
+            self._connect()
+            channel = self.ssh.get_transport().open_session(timeout=timeout)
+        return channel
+
+    def run(self, command, timeout=None, input=None) -> CommandResult:
+        """
+        Run a command, reading stdout and stderr as they arrive so neither can fill up and stall it
+        :param command: The command to execute
+        :param timeout: Seconds before the command is abandoned and TimeoutError is raised
+        :param input: Text sent to the command's stdin
+        :return: CommandResult with the exit status, output and duration
+        """
+        start_time = time.monotonic()
+        deadline = start_time + timeout if timeout is not None else None
+        # Commands are told apart by program only, their arguments would make a series per host
+        with observe_request("ssh", f"exec {(command.split() or ['<empty>'])[0]}") as observation:
+            channel = self._open_session(timeout)
+            stdout, stderr = [], []
+            try:
+                channel.exec_command(command)
+                if input is not None:
+                    channel.sendall(input.encode())
+                channel.shutdown_write()
+                with selectors.DefaultSelector() as selector:
+                    # A channel's fileno is signalled for stdout, stderr and close alike
+                    selector.register(channel, selectors.EVENT_READ)
+                    while True:
+                        while channel.recv_ready():
+                            stdout.append(channel.recv(65536))
+                        while channel.recv_stderr_ready():
+                            stderr.append(channel.recv_stderr(65536))
+                        if (
+                            channel.exit_status_ready()
+                            and (channel.eof_received or channel.closed)
+                            and not channel.recv_ready()
+                            and not channel.recv_stderr_ready()
+                        ):
+                            break
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise TimeoutError(
+                                f"`{command}` on {self.hostname} timed out after {timeout}s"
+                            )
+                        selector.select(remaining)
+                exit_status = channel.recv_exit_status()
+            finally:
+                channel.close()
+            observation.status = exit_status
+
+        return CommandResult(
+            hostname=self.hostname,
+            command=command,
+            exit_status=exit_status,
+            stdout=b"".join(stdout).decode(errors="replace"),
+            stderr=b"".join(stderr).decode(errors="replace"),
+            duration=time.monotonic() - start_time,
+        )
+
     def execute(self, command):
         """
         Execute a command on the remote host
         :param command: The command to execute
         :return: A tuple containing the stdout and stderr
         """
-        stdin, stdout, stderr = self.ssh.exec_command(command)
-        
-        return stdout.read().decode(), stderr.read().decode()
-    
-    def invoke(self, command, expected_output, timeout=10):
+        result = self.run(command)
+        return result.stdout, result.stderr
+
+    def run_script(self, steps, timeout=None, stop_on_error=True) -> List[StepResult]:
+        """
+        Run a list of commands as a single shell script in one round trip
+        Each step's output is fenced with markers so exit codes and output can be told apart per step
+        :param steps: The commands to run, in order
+        :param timeout: Seconds before the script is abandoned and TimeoutError is raised
+        :param stop_on_error: Stop the script at the first failing step
+        :return: StepResult for every step that ran
+        """
+        marker = f"__STEP_{uuid.uuid4().hex}__"
+        lines = []
+        for index, step in enumerate(steps):
+            lines += [
+                f"printf '\\n{marker} begin {index}\\n'; printf '\\n{marker} begin {index}\\n' >&2",
+                # Steps must not read stdin, it carries the rest of the script
+                f"{{\n{step}\n}} </dev/null",
+                "rc=$?",
+                f"printf '\\n{marker} end {index} %d\\n' $rc; printf '\\n{marker} end {index} %d\\n' $rc >&2",
+            ]
+            if stop_on_error:
+                lines.append('[ "$rc" -eq 0 ] || exit "$rc"')
+
+        result = self.run("sh -s", timeout=timeout, input="\n".join(lines) + "\n")
+
+        # The markers start with a newline so they always sit on their own line, strip it back off
+        pattern = re.compile(
+            rf"\n{marker} begin (\d+)\n(.*?)\n{marker} end \1 (\d+)\n", re.DOTALL
+        )
+        stdout = {int(m.group(1)): (m.group(2), int(m.group(3))) for m in pattern.finditer(result.stdout)}
+        stderr = {int(m.group(1)): m.group(2) for m in pattern.finditer(result.stderr)}
+        return [
+            StepResult(steps[index], exit_status, output, stderr.get(index, ""))
+            for index, (output, exit_status) in sorted(stdout.items())
+        ]
+
+    def invoke(self, command, expected_output, timeout=10, on_output=None):
         """
         Workaround way of executing a command on custom CLI
         :param command: The command to execute
         :param expected_output: The expected output to wait before ending
         :param timeout: The timeout to wait for the expected output
-        :return: String of the output 
-        """        
-        output = ""
-        start_time = time.time()
-
-        self.channel.send(command + "\n")
+        :param on_output: Called with the output as it arrives
+        :return: String of the output received after the prompt
+        """
+        chunks = []
 
-        is_stdout = False
+        def collect(text):
+            chunks.append(text)
+            if on_output is not None:
+                on_output(text)
 
-        while True:
-            if self.channel.recv_ready():
-                curr_output = self.channel.recv(4096).decode('utf-8')
-                if is_stdout:
-                    output += curr_output
-                if ">" in curr_output:
-                    is_stdout = True
-                if re.search(expected_output, curr_output):
-                    break
-            if time.time() - start_time > timeout:
-                raise TimeoutError(f"Timeout occurred while executing `{command}`")
+        self.channel.send(command + "\n")
+        try:
+            EXPECT_ENGINE.expect(self.channel, expected_output, timeout, on_output=collect).result()
+        except TimeoutError:
+            raise TimeoutError(f"Timeout occurred while executing `{command}`")
 
-        return output
+        # Output starts after the chunk carrying the CLI prompt
+        prompt = next((i for i, chunk in enumerate(chunks) if ">" in chunk), len(chunks))
+        return "".join(chunks[prompt + 1 :])
 
-    def close(self):
+    def close(self, discard=False):
         """
-        Close the connection to the remote host
+        Close the connection to the remote host, or hand it back to the pool for reuse
+        Closing again does nothing, e.g. on leaving a `with` block after an explicit close
+        :param discard: Close the pooled connection too, e.g. after rebooting the host
         """
-        self.ssh.close()
-
+        if self._channel is not None:
+            self._channel.close()
+            self._channel = None
+        if self.ssh is None:
+            return
+        if self.pool is not None:
+            self.pool.release(
+                self.ssh, self.hostname, self.username, self.port, discard=discard
+            )
+        else:
+            self.ssh.close()
+        self.ssh = None
@@ -0,0 +1,212 @@
+import time
+import threading
+import contextvars
+from dataclasses import dataclass, field
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from utils.metrics import PIPELINE_STEP_SECONDS, PIPELINE_STEPS, PIPELINE_STEPS_RUNNING
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+# Completed by an earlier run, its outputs were restored rather than recomputed
+RESUMED = "resumed"
+
+
+@dataclass
+class Step:
+    """
+    A unit of work in a pipeline
+    `func` is called with its inputs as keyword arguments and returns a dict holding its outputs
+    """
+
+    name: str
+    func: Callable[..., Optional[Dict[str, Any]]]
+    inputs: Sequence[str] = ()
+    outputs: Sequence[str] = ()
+
+
+@dataclass
+class StepRun:
+    name: str
+    state: str = PENDING
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+@dataclass
+class PipelineResult:
+    context: Dict[str, Any]
+    runs: Dict[str, StepRun]
+    duration: float = 0.0
+    error: Optional[BaseException] = field(default=None, repr=False)
+
+    @property
+    def success(self) -> bool:
+        return all(run.state in (SUCCEEDED, RESUMED) for run in self.runs.values())
+
+
+class PipelineError(RuntimeError):
+    def __init__(self, step: str, error: BaseException, result: PipelineResult):
+        super().__init__(f"{step}: {error}")
+        self.step = step
+        self.result = result
+
+
+class Pipeline:
+    def __init__(self, steps: List[Step], max_workers: Optional[int] = None):
+        """
+        A set of steps wired together by the names of their inputs and outputs
+        A step starts as soon as every one of its inputs is available, so independent steps run concurrently
+        :param steps: The steps, in any order
+        :param max_workers: Maximum number of steps running at once, defaults to one per step
+        """
+        names = [step.name for step in steps]
+        if len(set(names)) != len(names):
+            raise ValueError("Step names must be unique")
+
+        self.producers = {}
+        for step in steps:
+            for output in step.outputs:
+                if output in self.producers:
+                    raise ValueError(
+                        f"`{output}` is produced by both {self.producers[output]} and {step.name}"
+                    )
+                self.producers[output] = step.name
+
+        self.steps = {step.name: step for step in steps}
+        self.max_workers = max_workers or max(1, len(steps))
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Steps form a cycle: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for input in self.steps[name].inputs:
+                if input in self.producers:
+                    visit(self.producers[input], path + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.steps:
+            visit(name, [])
+
+    def run(
+        self,
+        context: Optional[Dict[str, Any]] = None,
+        on_transition: Optional[Callable[[StepRun], None]] = None,
+        completed: Optional[Dict[str, Dict[str, Any]]] = None,
+        on_outputs: Optional[Callable[[StepRun, Dict[str, Any]], None]] = None,
+    ) -> PipelineResult:
+        """
+        Run every step, each one once its inputs are available
+        Once a step fails no new steps are started, the running ones are waited for and the rest are skipped
+        :param context: Values available to steps before any of them run
+        :param on_transition: Called with a step's StepRun whenever its state changes
+        :param completed: Outputs of steps finished by an earlier run, keyed by step name, these are not run again
+        :param on_outputs: Called from the step's thread with its StepRun and outputs once it succeeds,
+            an exception raised here fails the step
+        :return: PipelineResult with the final context and every step's StepRun
+        :raises PipelineError: When a step fails, holding the PipelineResult so far
+        """
+        context = dict(context or {})
+        missing = {
+            input
+            for step in self.steps.values()
+            for input in step.inputs
+            if input not in self.producers and input not in context
+        }
+        if missing:
+            raise ValueError(f"No step produces {', '.join(sorted(missing))}")
+
+        runs = {name: StepRun(name) for name in self.steps}
+        result = PipelineResult(context=context, runs=runs)
+        lock = threading.Lock()
+
+        def transition(run: StepRun, state: str, error: Optional[str] = None):
+            with lock:
+                run.state = state
+                if state == RUNNING:
+                    run.started_at = time.time()
+                elif state in (SUCCEEDED, FAILED):
+                    run.finished_at = time.time()
+                run.error = error
+            if state == RUNNING:
+                PIPELINE_STEPS_RUNNING.labels(run.name).inc()
+            else:
+                if state in (SUCCEEDED, FAILED):
+                    PIPELINE_STEPS_RUNNING.labels(run.name).dec()
+                    PIPELINE_STEP_SECONDS.labels(run.name, state).observe(run.duration)
+                PIPELINE_STEPS.labels(run.name, state).inc()
+            if on_transition is not None:
+                on_transition(run)
+
+        def execute(step: Step):
+            transition(runs[step.name], RUNNING)
+            outputs = step.func(**{input: context[input] for input in step.inputs}) or {}
+            missing = [output for output in step.outputs if output not in outputs]
+            if missing:
+                raise RuntimeError(f"{step.name} did not produce {', '.join(missing)}")
+            if on_outputs is not None:
+                on_outputs(runs[step.name], {output: outputs[output] for output in step.outputs})
+            return outputs
+
+        start_time = time.perf_counter()
+        pending = dict(self.steps)
+        for name, outputs in (completed or {}).items():
+            step = pending.get(name)
+            # Steps whose recorded outputs no longer match their declaration are run again
+            if step is None or any(output not in outputs for output in step.outputs):
+                continue
+            del pending[name]
+            context.update({output: outputs[output] for output in step.outputs})
+            transition(runs[name], RESUMED)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if result.error is None:
+                    for name, step in list(pending.items()):
+                        if all(input in context for input in step.inputs):
+                            del pending[name]
+                            # Steps see the caller's context variables, e.g. the job they run for
+                            running[
+                                executor.submit(contextvars.copy_context().run, execute, step)
+                            ] = step
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    try:
+                        outputs = future.result()
+                    except Exception as e:
+                        if result.error is None:
+                            result.error = PipelineError(step.name, e, result)
+                            result.error.__cause__ = e
+                        transition(runs[step.name], FAILED, str(e) or e.__class__.__name__)
+                        continue
+                    context.update({output: outputs[output] for output in step.outputs})
+                    transition(runs[step.name], SUCCEEDED)
+
+        for name in pending:
+            transition(runs[name], SKIPPED)
+        result.duration = time.perf_counter() - start_time
+        if result.error is not None:
+            raise result.error
+        return result
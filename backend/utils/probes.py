@@ -0,0 +1,125 @@
+import time
+import socket
+import requests
+import urllib3
+from typing import Callable, Iterable, Optional
+
+from utils.logger import logger
+from utils.paramiko import SSH_PORT
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Seconds a single probe attempt may take
+PROBE_TIMEOUT = 5
+
+
+def probe_tcp(host: str, port: int, timeout: float = PROBE_TIMEOUT) -> bool:
+    """
+    :return: Whether a TCP connection to host:port can be opened
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def probe_ssh_banner(host: str, port: int = SSH_PORT, timeout: float = PROBE_TIMEOUT) -> bool:
+    """
+    :return: Whether an SSH server answers on host:port, which an open port alone doesn't prove while booting
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.settimeout(timeout)
+            return sock.recv(256).startswith(b"SSH-")
+    except OSError:
+        return False
+
+
+def probe_http(
+    url: str,
+    expected_status: Iterable[int] = (200,),
+    timeout: float = PROBE_TIMEOUT,
+    **kwargs,
+) -> bool:
+    """
+    :param expected_status: Status codes that count as ready
+    :param kwargs: Passed on to requests.get, e.g. auth or verify
+    :return: Whether the URL answers with one of the expected status codes
+    """
+    try:
+        response = requests.get(url, timeout=timeout, **kwargs)
+    except requests.RequestException:
+        return False
+    return response.status_code in tuple(expected_status)
+
+
+def probe_redfish(host: str, timeout: float = PROBE_TIMEOUT) -> bool:
+    """
+    :return: Whether the Redfish service root answers, it doesn't need credentials
+    """
+    return probe_http(f"https://{host}/redfish/v1", timeout=timeout, verify=False)
+
+
+def probe_dns(hostname: str, expected_address: Optional[str] = None) -> bool:
+    """
+    :param expected_address: Only count the name as resolved once it points here
+    :return: Whether the hostname resolves
+    """
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(hostname, None)}
+    except OSError:
+        return False
+    return expected_address is None or expected_address in addresses
+
+
+def wait_until(
+    probe: Callable[[], bool],
+    timeout: float,
+    description: str = "probe",
+    initial_delay: float = 0.5,
+    max_delay: float = 10,
+    backoff: float = 2,
+) -> float:
+    """
+    Call a probe until it succeeds, backing off exponentially between attempts
+    :param probe: Returns True once the condition holds
+    :param timeout: Seconds before TimeoutError is raised
+    :param description: What is being waited for, used in the error
+    :return: Seconds it took
+    """
+    start_time = time.monotonic()
+    deadline = start_time + timeout
+    delay = initial_delay
+    while True:
+        if probe():
+            return time.monotonic() - start_time
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Timed out after {timeout}s waiting for {description}")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * backoff, max_delay)
+
+
+def wait_for_ssh(host: str, timeout: float = 300, port: int = SSH_PORT) -> float:
+    """
+    Wait for a host's name to resolve and its SSH server to answer
+    :return: Seconds it took
+    """
+    elapsed = wait_until(lambda: probe_dns(host), timeout, f"{host} to resolve")
+    elapsed += wait_until(
+        lambda: probe_ssh_banner(host, port), timeout - elapsed, f"SSH on {host}"
+    )
+    logger.debug(f"SSH on {host} ready after {elapsed:.1f}s")
+    return elapsed
+
+
+def wait_for_redfish(host: str, timeout: float = 300) -> float:
+    """
+    Wait for a BMC's name to resolve and its Redfish service to answer
+    :return: Seconds it took
+    """
+    elapsed = wait_until(lambda: probe_dns(host), timeout, f"{host} to resolve")
+    elapsed += wait_until(lambda: probe_redfish(host), timeout - elapsed, f"Redfish on {host}")
+    logger.debug(f"Redfish on {host} ready after {elapsed:.1f}s")
+    return elapsed
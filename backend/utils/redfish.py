@@ -0,0 +1,213 @@
+import os
+import re
+import time
+import threading
+import requests
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+
+from utils.logger import logger
+from utils.metrics import observe_request
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+REDFISH_TIMEOUT = int(os.environ.get("REDFISH_TIMEOUT", 30))
+REDFISH_WORKERS = int(os.environ.get("REDFISH_WORKERS", 16))
+
+# Asrock BMCs keep their hostname on the bonded management interface
+BMC_INTERFACE_PATH = "/redfish/v1/Managers/Self/EthernetInterfaces/bond0"
+
+TASK_FAILED_STATES = ("Exception", "Killed", "Cancelled", "Interrupted")
+
+
+def _route(method: str, path: str) -> str:
+    # Sessions and tasks get a new id every time, keep them to one series each
+    path = re.sub(r"/(Sessions|Tasks|TaskMonitors)/[^/]+", r"/\1/{id}", urlsplit(path).path)
+    return f"{method} {path}"
+
+
+class Redfish:
+    # Connections are pooled across every BMC in the process, auth travels in headers
+    _session = None
+    _lock = threading.Lock()
+
+    def __init__(self, host: str, username: str, password: str, verify: bool = False):
+        """
+        Redfish client for a single BMC, authenticating with a session token
+        :param host: The hostname or IP of the BMC
+        :param username: The username to use
+        :param password: The password to use
+        :param verify: Whether to verify the BMC's certificate
+        """
+        self.host = host
+        self.username = username
+        self.password = password
+        self.verify = verify
+        self.token = None
+        self.session_uri = None
+
+    def __enter__(self):
+        self.login()
+        return self
+
+    def __exit__(self, *exc):
+        self.logout()
+
+    @property
+    def session(self) -> requests.Session:
+        if Redfish._session is None:
+            with Redfish._lock:
+                if Redfish._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=REDFISH_WORKERS, pool_maxsize=4)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    Redfish._session = session
+        return Redfish._session
+
+    def _url(self, path: str) -> str:
+        return path if path.startswith("http") else f"https://{self.host}{path}"
+
+    def login(self):
+        """
+        Open a Redfish session, falling back to basic auth when the BMC has no session service
+        """
+        with observe_request("redfish", "POST /redfish/v1/SessionService/Sessions") as observation:
+            response = self.session.post(
+                self._url("/redfish/v1/SessionService/Sessions"),
+                json={"UserName": self.username, "Password": self.password},
+                verify=self.verify,
+                timeout=REDFISH_TIMEOUT,
+            )
+            observation.status = response.status_code
+        if response.status_code in (404, 405, 501):
+            self.token = None
+            return
+        response.raise_for_status()
+        self.token = response.headers.get("X-Auth-Token")
+        self.session_uri = response.headers.get("Location")
+
+    def logout(self):
+        if self.session_uri is None:
+            return
+        try:
+            self._request("DELETE", self.session_uri, relogin=False)
+        except requests.RequestException as e:
+            logger.debug(f"Failed to close Redfish session on {self.host}: {e}")
+        self.token = self.session_uri = None
+
+    def _request(self, method: str, path: str, relogin: bool = True, **kwargs) -> requests.Response:
+        headers = kwargs.pop("headers", {})
+        if self.token is not None:
+            auth = None
+            headers["X-Auth-Token"] = self.token
+        else:
+            auth = (self.username, self.password)
+        with observe_request("redfish", _route(method, path)) as observation:
+            response = self.session.request(
+                method,
+                self._url(path),
+                headers=headers,
+                auth=auth,
+                verify=self.verify,
+                timeout=REDFISH_TIMEOUT,
+                **kwargs,
+            )
+            observation.status = response.status_code
+        # Sessions expire on the BMC's schedule, start a new one and try again
+        if response.status_code == 401 and relogin and self.token is not None:
+            self.login()
+            return self._request(method, path, relogin=False, headers=headers, **kwargs)
+        return response
+
+    def get(self, path: str) -> Tuple[dict, Optional[str]]:
+        """
+        :return: The resource and its ETag
+        """
+        response = self._request("GET", path)
+        response.raise_for_status()
+        etag = response.headers.get("ETag") or response.json().get("@odata.etag")
+        return response.json(), etag
+
+    def patch(self, path: str, payload: dict, etag: Optional[str] = None) -> requests.Response:
+        """
+        Update a resource, guarded by its ETag so a concurrent change isn't overwritten
+        :param etag: The ETag the change is based on, fetched when not given
+        :return: The response, 202 when the BMC queued a task for it
+        """
+        if etag is None:
+            _, etag = self.get(path)
+        for attempt in range(2):
+            # BMCs that don't version the resource still insist on an If-Match
+            response = self._request("PATCH", path, json=payload, headers={"If-Match": etag or "*"})
+            if response.status_code != 412 or attempt:
+                break
+            _, etag = self.get(path)
+        response.raise_for_status()
+        return response
+
+    def wait_for_task(self, monitor: str, timeout: float = 300, poll_interval: float = 2) -> dict:
+        """
+        Poll a task monitor until the task completes
+        :param monitor: The task monitor URI from a 202's Location header
+        :param timeout: Seconds before TimeoutError is raised
+        :return: The final task, or {} when the monitor returns no body
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            response = self._request("GET", monitor)
+            if response.status_code == 404:
+                # Some BMCs drop the monitor as soon as the task is done
+                return {}
+            response.raise_for_status()
+            task = response.json() if response.content else {}
+            state = task.get("TaskState")
+            if state in TASK_FAILED_STATES:
+                messages = "; ".join(m.get("Message", "") for m in task.get("Messages", []))
+                raise RuntimeError(f"Redfish task on {self.host} ended {state}: {messages}")
+            if response.status_code != 202 and state in (None, "Completed"):
+                return task
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Redfish task on {self.host} still {state} after {timeout}s")
+            time.sleep(poll_interval)
+
+    def set_hostname(self, hostname: str, path: str = BMC_INTERFACE_PATH, timeout: float = 300):
+        """
+        Rename the BMC and wait for the change to be applied
+        :param hostname: The new hostname of the BMC
+        :param path: The interface holding the hostname
+        :param timeout: Seconds to wait for a queued task
+        """
+        response = self.patch(path, {"HostName": hostname})
+        if response.status_code == 202 and response.headers.get("Location"):
+            self.wait_for_task(response.headers["Location"], timeout)
+
+
+def bulk_set_hostname(
+    targets: List[dict], max_workers: int = REDFISH_WORKERS, timeout: float = 300
+) -> Dict[str, Optional[str]]:
+    """
+    Rename many BMCs concurrently
+    :param targets: List of {host, username, password, hostname}
+    :param max_workers: Maximum number of BMCs worked on at once
+    :param timeout: Seconds each BMC gets for its task
+    :return: Dict of host to None on success or the error message
+    """
+
+    def rename(target):
+        try:
+            with Redfish(target["host"], target["username"], target["password"]) as redfish:
+                redfish.set_hostname(target["hostname"], timeout=timeout)
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to rename BMC {target['host']}: {e}")
+            return str(e) or e.__class__.__name__
+
+    if not targets:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(targets))) as executor:
+        errors = list(executor.map(rename, targets))
+    return {target["host"]: error for target, error in zip(targets, errors)}
@@ -0,0 +1,113 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union
+
+from utils.logger import logger
+from utils.paramiko import CommandResult, Paramiko, SSH_POOL, SSH_PORT
+
+SSH_FANOUT_WORKERS = int(os.environ.get("SSH_FANOUT_WORKERS", 16))
+
+
+class SSHExecutor:
+    def __init__(self, max_workers=SSH_FANOUT_WORKERS, pool=SSH_POOL):
+        """
+        Run commands on many hosts at once
+        :param max_workers: Maximum number of hosts worked on concurrently
+        :param pool: The connection pool hosts are leased from
+        """
+        self.max_workers = max_workers
+        self.pool = pool
+
+    def _run_host(self, host: dict, commands: List[str], timeout, stop_on_error):
+        hostname = host["hostname"]
+        start_time = time.monotonic()
+        deadline = start_time + timeout if timeout is not None else None
+        results = []
+
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        try:
+            ssh = Paramiko(
+                hostname=hostname,
+                username=host["username"],
+                password=host["password"],
+                port=host.get("port", SSH_PORT),
+                pool=self.pool,
+                timeout=remaining(),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to connect to {hostname}: {e}")
+            return [
+                CommandResult(
+                    hostname, commands[0], None, "", "", time.monotonic() - start_time, str(e)
+                )
+            ]
+
+        discard = False
+        try:
+            for command in commands:
+                command_start = time.monotonic()
+                try:
+                    result = ssh.run(command, timeout=remaining())
+                except Exception as e:
+                    # A timed out command may still be running, don't hand its connection back
+                    discard = True
+                    result = CommandResult(
+                        hostname, command, None, "", "", time.monotonic() - command_start, str(e)
+                    )
+                results.append(result)
+                if discard or (stop_on_error and not result.ok):
+                    break
+        finally:
+            ssh.close(discard=discard)
+        return results
+
+    def run(
+        self,
+        hosts: List[Union[str, dict]],
+        commands: Union[str, List[str]],
+        username: str = None,
+        password: str = None,
+        timeout: float = 30,
+        stop_on_error: bool = True,
+    ) -> Dict[str, Union[CommandResult, List[CommandResult]]]:
+        """
+        Run a command, or a list of commands in order, on every host concurrently
+        :param hosts: Hostnames, or dicts of {hostname, username, password, port} to override the defaults per host
+        :param commands: A command, or a list of commands run one after the other on each host
+        :param username: The username to use for hosts given by name
+        :param password: The password to use for hosts given by name
+        :param timeout: Seconds each host gets for connecting and running all of its commands
+        :param stop_on_error: Skip a host's remaining commands after one fails
+        :return: Dict of hostname to its CommandResult, or list of CommandResult when given a list of commands
+        """
+        single = isinstance(commands, str)
+        command_list = [commands] if single else list(commands)
+        hosts = [
+            {
+                "username": username,
+                "password": password,
+                **(host if isinstance(host, dict) else {"hostname": host}),
+            }
+            for host in hosts
+        ]
+        if len({host["hostname"] for host in hosts}) != len(hosts):
+            raise ValueError("Hosts must be unique, results are keyed by hostname")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(hosts)))) as executor:
+            futures = {
+                host["hostname"]: executor.submit(
+                    self._run_host, host, command_list, timeout, stop_on_error
+                )
+                for host in hosts
+            }
+            results = {hostname: future.result() for hostname, future in futures.items()}
+
+        if single:
+            return {hostname: host_results[0] for hostname, host_results in results.items()}
+        return results
+
+
+SSH_EXECUTOR = SSHExecutor()